@@ -36,6 +36,8 @@ class InfluxService:
         query = f'''
         from(bucket: "{settings.INFLUX_BUCKET}")
           {range_filter}
+          |> filter(fn: (r) => r._measurement == "device_metrics")
+          |> filter(fn: (r) => r._field == "value")
           |> filter(fn: (r) => r.factory_id == "{factory_id}")
           |> filter(fn: (r) => {device_filter})
           |> filter(fn: (r) => {prop_filter})
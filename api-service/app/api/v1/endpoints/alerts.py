@@ -5,6 +5,7 @@ from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.api import deps
 from app.core.database import get_db
+from app.core.queue import alert_state
 from app.models.models import Alert, User
 from app.schemas.schemas import AlertResponse, AlertStatus, AlertAcknowledge, AlertResolve
 
@@ -48,6 +49,9 @@ def acknowledge_alert(
     db.add(alert)
     db.commit()
     db.refresh(alert)
+    # An acknowledged alert no longer holds back the rule's cooldown
+    alert_state.publish({"source": "api", "factory_id": factory_id, "rule_id": alert.rule_id,
+                         "alert_id": alert.id, "status": "acknowledged"})
     return alert
 
 @router.patch("/{alert_id}/resolve", response_model=AlertResponse)
@@ -71,4 +75,6 @@ def resolve_alert(
     db.add(alert)
     db.commit()
     db.refresh(alert)
+    alert_state.publish({"source": "api", "factory_id": factory_id, "rule_id": alert.rule_id,
+                         "alert_id": alert.id, "status": "resolved"})
     return alert
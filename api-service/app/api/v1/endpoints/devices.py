@@ -2,14 +2,18 @@ from typing import Any, List
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+import redis
 from influxdb_client.client.query_api import QueryApi
 
 from app.api import deps
 from app.core.config import settings
 from app.core import influx
+from app.core.latest import latest_values
+from app.core.properties import property_cache
+from app.core.queue import device_invalidation
 from app.core.database import get_db
 from app.models.models import Device, DeviceProperty, User
-from app.schemas.schemas import DeviceCreate, DeviceResponse, PropertyResponse, TelemetryResponse
+from app.schemas.schemas import DeviceCreate, DeviceResponse, FactoryStateResponse, PropertyDeadbandUpdate, PropertyResponse, TelemetryResponse
 
 router = APIRouter()
 
@@ -45,8 +49,23 @@ def create_device(
     db.add(device)
     db.commit()
     db.refresh(device)
+    # Telemetry accepts messages from the new device without waiting for its refresh
+    device_invalidation.publish({"factory_id": factory_id, "device_id": device.id})
     return device
 
+@router.get("/latest", response_model=FactoryStateResponse)
+def read_latest_values(
+    current_user: User = Depends(deps.get_current_active_user),
+    factory_id: str = Depends(deps.get_factory_id)
+) -> Any:
+    # Latest value of every device property, kept in Redis by the telemetry
+    # service, so dashboards do not need an InfluxDB query for current state
+    try:
+        devices = latest_values.factory_state(factory_id)
+    except redis.RedisError:
+        raise HTTPException(status_code=503, detail="Latest values unavailable")
+    return {"factory_id": factory_id, "devices": devices}
+
 @router.get("/{device_id}/properties", response_model=List[PropertyResponse])
 def read_device_properties(
     device_id: str,
@@ -60,6 +79,39 @@ def read_device_properties(
     ).all()
     return props
 
+@router.patch("/{device_id}/properties/{property_name}/deadband", response_model=PropertyResponse)
+def update_property_deadband(
+    *,
+    db: Session = Depends(get_db),
+    device_id: str,
+    property_name: str,
+    deadband_in: PropertyDeadbandUpdate,
+    current_user: User = Depends(deps.get_current_active_user),
+    factory_id: str = Depends(deps.get_factory_id)
+) -> Any:
+    prop = db.query(DeviceProperty).filter(
+        DeviceProperty.device_id == device_id,
+        DeviceProperty.factory_id == factory_id,
+        DeviceProperty.property_name == property_name
+    ).first()
+    if not prop:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    if not current_user.can_write and current_user.role != "super_admin":
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+
+    for field, value in deadband_in.model_dump(exclude_unset=True).items():
+        setattr(prop, field, value)
+    db.add(prop)
+    db.commit()
+    db.refresh(prop)
+    # Telemetry replicas drop the device's cached properties (shared hash and
+    # their own cache) and read the new settings from MySQL; otherwise the
+    # change would wait for PROPERTY_CACHE_TTL_SECONDS
+    property_cache.invalidate(factory_id, device_id)
+    device_invalidation.publish({"factory_id": factory_id, "device_id": device_id})
+    return prop
+
 @router.get("/{device_id}/telemetry") # Returns custom dict structure or schema
 def read_telemetry(
     device_id: str,
@@ -6,6 +6,7 @@ from fastapi.encoders import jsonable_encoder
 
 from app.api import deps
 from app.core.database import get_db
+from app.core.queue import rules_invalidation
 from app.models.models import Rule, User
 from app.schemas.schemas import RuleCreate, RuleResponse, RuleUpdate
 
@@ -54,6 +55,8 @@ def create_rule(
     db.add(rule)
     db.commit()
     db.refresh(rule)
+    # The rule engine applies the change without waiting for its cache TTL
+    rules_invalidation.publish({"factory_id": factory_id, "device_id": rule.device_id})
     return rule
 
 @router.put("/{rule_id}", response_model=RuleResponse)
@@ -80,6 +83,7 @@ def update_rule(
     db.add(rule)
     db.commit()
     db.refresh(rule)
+    rules_invalidation.publish({"factory_id": factory_id, "device_id": rule.device_id})
     return rule
 
 @router.delete("/{rule_id}", response_model=RuleResponse)
@@ -102,4 +106,5 @@ def delete_rule(
     db.add(rule)
     db.commit()
     db.refresh(rule)
+    rules_invalidation.publish({"factory_id": factory_id, "device_id": rule.device_id})
     return rule
@@ -0,0 +1,23 @@
+import redis
+import json
+from app.core.config import settings
+
+# Written by the telemetry service: field "{device_id}:{property}",
+# value JSON [value, ISO timestamp]
+LATEST_KEY = "telemetry:latest:{factory_id}"
+
+class LatestValues:
+    """Current state of a factory from the telemetry service's latest-value hashes."""
+    def __init__(self):
+        self.redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    def factory_state(self, factory_id: str) -> dict:
+        """device_id -> property -> {"value", "timestamp"}, in one HGETALL."""
+        devices = {}
+        for field, raw in self.redis_client.hgetall(LATEST_KEY.format(factory_id=factory_id)).items():
+            device_id, _, name = field.partition(":")
+            value, timestamp = json.loads(raw)
+            devices.setdefault(device_id, {})[name] = {"value": value, "timestamp": timestamp}
+        return devices
+
+latest_values = LatestValues()
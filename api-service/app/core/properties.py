@@ -0,0 +1,26 @@
+import logging
+import redis
+from app.core.config import settings
+
+logger = logging.getLogger("api-properties")
+
+# The telemetry service's shared property cache: one hash per device,
+# field = property name, value = encoded deadband
+PROPERTIES_KEY = "telemetry:props:{factory_id}:{device_id}"
+
+class PropertyCache:
+    """Drops a device's entry from the telemetry service's shared property cache."""
+    def __init__(self):
+        self.redis_client = redis.Redis.from_url(settings.REDIS_URL)
+
+    def invalidate(self, factory_id: str, device_id: str) -> bool:
+        # Telemetry reloads the device's properties from MySQL on its next
+        # miss; like a missed notification, a failure must not fail the request
+        try:
+            self.redis_client.delete(PROPERTIES_KEY.format(factory_id=factory_id, device_id=device_id))
+            return True
+        except redis.RedisError as e:
+            logger.warning(f"Could not invalidate shared properties of {device_id}: {e}")
+            return False
+
+property_cache = PropertyCache()
@@ -1,7 +1,10 @@
 import redis
 import json
+import logging
 from app.core.config import settings
 
+logger = logging.getLogger("api-queue")
+
 class RedisQueue:
     def __init__(self, key: str):
         self.key = key
@@ -16,7 +19,32 @@ class RedisQueue:
             return json.loads(item)
         return None
 
+class RedisChannel:
+    """Fire-and-forget pub/sub notifications to other services."""
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.redis_client = redis.Redis.from_url(settings.REDIS_URL)
+
+    def publish(self, message: dict) -> bool:
+        # Subscribers also poll for changes, so a missed notification only
+        # delays them; it must not fail the request that made the change.
+        try:
+            self.redis_client.publish(self.channel, json.dumps(message))
+            return True
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish to {self.channel}: {e}")
+            return False
+
 analytics_queue = RedisQueue("analytics_queue")
 reports_queue = RedisQueue("reports_queue")
 notifications_queue = RedisQueue("notifications_queue")
 events_queue = RedisQueue("events_queue") 
+
+# Telemetry service device snapshot
+device_invalidation = RedisChannel("device_invalidation")
+
+# Rule engine rule cache
+rules_invalidation = RedisChannel("rules_invalidation")
+
+# Rule engine open-alert state (cooldown and auto-resolve)
+alert_state = RedisChannel("alert_state")
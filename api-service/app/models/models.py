@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Enum, JSON, Integer, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, Enum, JSON, Integer, Float, ForeignKey, Text
 from datetime import datetime
 from app.core.database import Base
 import uuid
@@ -23,6 +23,22 @@ class Device(Base):
     location = Column(String(255), nullable=True)
     status = Column(Enum('active', 'inactive', 'maintenance'), default='active')
     last_seen_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DeviceProperty(Base):
+    __tablename__ = "device_properties"
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    factory_id = Column(String(36), nullable=False)
+    device_id = Column(String(36), nullable=False)
+    property_name = Column(String(255), nullable=False)
+    unit = Column(String(20), nullable=True)
+    data_type = Column(String(50), nullable=False, default="float")
+    first_seen_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+    # Change-only filtering applied by the telemetry service; NULL disables it
+    deadband_abs = Column(Float, nullable=True)
+    deadband_pct = Column(Float, nullable=True)
+    max_silence_seconds = Column(Integer, nullable=True)
 
 class Rule(Base):
     __tablename__ = "rules"
@@ -146,6 +146,15 @@ class PropertyResponse(BaseModel):
     data_type: str
     first_seen_at: datetime
     last_seen_at: datetime
+    deadband_abs: Optional[float] = None
+    deadband_pct: Optional[float] = None
+    max_silence_seconds: Optional[int] = None
+
+class PropertyDeadbandUpdate(BaseModel):
+    # Send null to clear a setting; with neither tolerance set nothing is filtered
+    deadband_abs: Optional[float] = Field(None, ge=0)
+    deadband_pct: Optional[float] = Field(None, ge=0)
+    max_silence_seconds: Optional[int] = Field(None, gt=0)
 
 # --- Telemetry ---
 
@@ -161,6 +170,15 @@ class TelemetryResponse(BaseModel):
     window: str
     points: List[TelemetryPoint]
 
+class LatestValue(BaseModel):
+    value: Any
+    timestamp: datetime
+
+class FactoryStateResponse(BaseModel):
+    factory_id: str
+    # device_id -> property -> latest value
+    devices: Dict[str, Dict[str, LatestValue]]
+
 # --- Rule ---
 
 class RuleCondition(BaseModel):
@@ -1,3 +1,4 @@
+import redis
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.api.v1.api import api_router
@@ -64,3 +65,70 @@ def test_tenant_isolation(client: TestClient, db: Session, user_one, normal_user
     # LLD has /devices/{id}/properties but not /devices/{id} explicitly in detail section, maybe I missed it.
     # LLD has GET /devices/{device_id}/telemetry.
     # If endpoint exists to get single device, it should 404.
+
+def test_update_property_deadband_invalidates_telemetry_caches(client: TestClient, db: Session, user_one,
+                                                               normal_user_token_headers, monkeypatch):
+    from app.api.v1.endpoints import devices
+    from app.models.models import DeviceProperty
+    invalidated, published = [], []
+    monkeypatch.setattr(devices.property_cache, "invalidate", lambda f, d: invalidated.append((f, d)))
+    monkeypatch.setattr(devices.device_invalidation, "publish", published.append)
+
+    device = Device(id="dev-db-1", name="Press", type="test", factory_id=user_one.factory_id)
+    prop = DeviceProperty(factory_id=user_one.factory_id, device_id="dev-db-1", property_name="temp")
+    db.add_all([device, prop])
+    db.commit()
+
+    r = client.patch("/api/v1/devices/dev-db-1/properties/temp/deadband",
+                     json={"deadband_abs": 0.5, "max_silence_seconds": 60}, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert r.json()["deadband_abs"] == 0.5
+    db.refresh(prop)
+    assert prop.deadband_abs == 0.5 and prop.max_silence_seconds == 60
+    assert invalidated == [(user_one.factory_id, "dev-db-1")]
+    assert published == [{"factory_id": user_one.factory_id, "device_id": "dev-db-1"}]
+
+    r = client.patch("/api/v1/devices/dev-db-1/properties/missing/deadband",
+                     json={"deadband_abs": 1.0}, headers=normal_user_token_headers)
+    assert r.status_code == 404
+    assert len(invalidated) == 1
+
+class FakeLatestRedis:
+    def __init__(self, hashes=None, down=False):
+        self.hashes = hashes or {}
+        self.down = down
+
+    def hgetall(self, key):
+        if self.down:
+            raise redis.ConnectionError("redis down")
+        return dict(self.hashes.get(key, {}))
+
+def test_read_latest_values(client: TestClient, db: Session, user_one, normal_user_token_headers, monkeypatch):
+    from app.api.v1.endpoints import devices
+    from app.core.latest import LATEST_KEY
+    db.add_all([Device(id=d, name=d, type="test", factory_id=user_one.factory_id)
+                for d in ("dev-lv-1", "dev-lv-2", "dev-lv-3")])
+    db.commit()
+    # dev-lv-3 has not reported anything yet
+    fake = FakeLatestRedis({
+        LATEST_KEY.format(factory_id=user_one.factory_id): {
+            "dev-lv-1:temp": '[21.5, "2026-02-17T14:00:00"]',
+            "dev-lv-1:running": '[true, "2026-02-17T14:00:01"]',
+            "dev-lv-2:temp": '[19.0, "2026-02-17T13:59:00"]',
+        },
+        LATEST_KEY.format(factory_id="other-factory"): {"dev-x:temp": '[1.0, "2026-02-17T14:00:00"]'},
+    })
+    monkeypatch.setattr(devices.latest_values, "redis_client", fake)
+
+    r = client.get("/api/v1/devices/latest", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert data["factory_id"] == user_one.factory_id
+    assert set(data["devices"]) == {"dev-lv-1", "dev-lv-2"}
+    assert data["devices"]["dev-lv-1"]["temp"] == {"value": 21.5, "timestamp": "2026-02-17T14:00:00"}
+    assert data["devices"]["dev-lv-1"]["running"]["value"] is True
+    assert data["devices"]["dev-lv-2"]["temp"]["value"] == 19.0
+
+    monkeypatch.setattr(devices.latest_values, "redis_client", FakeLatestRedis(down=True))
+    r = client.get("/api/v1/devices/latest", headers=normal_user_token_headers)
+    assert r.status_code == 503
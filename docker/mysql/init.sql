@@ -15,15 +15,24 @@ CREATE TABLE IF NOT EXISTS devices (
     type VARCHAR(50), 
     status ENUM('active', 'inactive', 'maintenance') DEFAULT 'active',
     metadata JSON,
-    FOREIGN KEY (factory_id) REFERENCES factories(id)
+    last_seen_at TIMESTAMP NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (factory_id) REFERENCES factories(id),
+    INDEX idx_devices_updated_at (updated_at)
 );
 
 CREATE TABLE IF NOT EXISTS device_properties (
     id VARCHAR(36) PRIMARY KEY,
+    factory_id VARCHAR(36) NOT NULL,
     device_id VARCHAR(36) NOT NULL,
     property_name VARCHAR(100) NOT NULL,
     data_type VARCHAR(50),
     unit VARCHAR(20),
+    first_seen_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    deadband_abs DOUBLE NULL,
+    deadband_pct DOUBLE NULL,
+    max_silence_seconds INT NULL,
     FOREIGN KEY (device_id) REFERENCES devices(id),
     UNIQUE(device_id, property_name)
 );
@@ -53,7 +62,20 @@ CREATE TABLE IF NOT EXISTS alerts (
     triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     resolved_at TIMESTAMP,
     trigger_values JSON,
-    FOREIGN KEY (rule_id) REFERENCES rules(id)
+    FOREIGN KEY (rule_id) REFERENCES rules(id),
+    INDEX idx_alerts_status_triggered_at (status, triggered_at)
+);
+
+-- Rule Engine notification outbox, written in the alert's transaction
+CREATE TABLE IF NOT EXISTS alert_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    factory_id VARCHAR(36) NOT NULL,
+    alert_id VARCHAR(36) NOT NULL,
+    payload JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP NULL,
+    FOREIGN KEY (alert_id) REFERENCES alerts(id),
+    INDEX idx_alert_outbox_sent_at (sent_at)
 );
 
 -- Analytics Service Tables (AnalyticsJob, AnalyticsModel)
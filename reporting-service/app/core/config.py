@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     INFLUX_URL: str
     INFLUX_ORG: str
     INFLUX_BUCKET: str
+    REPORT_USE_ROLLUPS: bool = False # Read device_metrics_1m instead of aggregating raw points
 
     # MinIO
     MINIO_ENDPOINT: str
@@ -16,15 +16,35 @@ class DataFetcher:
         )
 
     def get_telemetry_aggregates(self, factory_id, device_ids, start, end):
-        # Sample aggregate query
+        # Hourly mean per property
         device_filter = ""
         if device_ids:
             device_filter = " or ".join([f'r.device_id == "{d}"' for d in device_ids])
             device_filter = f'|> filter(fn: (r) => {device_filter})'
-            
-        query = f'''
+
+        if settings.REPORT_USE_ROLLUPS:
+            # Per-minute rollups written by the telemetry service: 60x fewer
+            # points than the raw series. The hourly mean is sum / count, so
+            # minutes with more samples weigh more, as they would in raw data.
+            query = f'''
+        from(bucket: "{settings.INFLUX_BUCKET}")
+          |> range(start: {start.isoformat()}Z, stop: {end.isoformat()}Z)
+          |> filter(fn: (r) => r._measurement == "device_metrics_1m")
+          |> filter(fn: (r) => r.factory_id == "{factory_id}")
+          {device_filter}
+          |> filter(fn: (r) => r._field == "sum" or r._field == "count")
+          |> toFloat()
+          |> aggregateWindow(every: 1h, fn: sum, createEmpty: false)
+          |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> map(fn: (r) => ({{ r with _value: r.sum / r.count }}))
+          |> drop(columns: ["sum", "count"])
+          |> pivot(rowKey:["_time"], columnKey: ["property_name"], valueColumn: "_value")
+        '''
+        else:
+            query = f'''
         from(bucket: "{settings.INFLUX_BUCKET}")
           |> range(start: {start.isoformat()}Z, stop: {end.isoformat()}Z)
+          |> filter(fn: (r) => r._measurement == "device_metrics")
           |> filter(fn: (r) => r.factory_id == "{factory_id}")
           {device_filter}
           |> filter(fn: (r) => r._field == "value")
@@ -1,5 +1,11 @@
 from fastapi import APIRouter
 from app.core.config import settings
+from app.services.alert_state import alert_state
+from app.services.consumer import event_consumer
+from app.services.outbox import outbox_relay
+from app.services import processor
+from app.services.rule_cache import rule_cache
+from app.services.workers import worker_pool
 import redis
 
 api_router = APIRouter()
@@ -15,7 +21,13 @@ def health_check():
         status["redis"] = "ok"
     except Exception as e:
         status["redis"] = f"error: {str(e)}"
-        
+
+    status["consumer"] = event_consumer.stats()
+    status["workers"] = worker_pool.stats()
+    status["processor"] = processor.get_stats()
+    status["rule_cache"] = rule_cache.stats()
+    status["alert_state"] = alert_state.stats()
+    status["outbox"] = outbox_relay.stats()
     return status
 
 # No explicit API endpoints for rule engine, it's a background worker.
@@ -9,6 +9,21 @@ class Settings(BaseSettings):
 
     # Redis
     REDIS_URL: str
+
+    # Active rules per device (LLD 4.2: TTL 30s, invalidated on rule changes)
+    RULE_CACHE_TTL_SECONDS: float = 30.0
+    RULE_CACHE_MAX_DEVICES: int = 100000
+
+    # Events are taken from events_queue and evaluated in batches
+    EVENT_BATCH_SIZE: int = 100
+    EVENT_BATCH_WAIT_MS: int = 10 # Longest wait to fill a batch once the first event is in
+    RULE_WORKERS: int = 4 # Evaluation threads, each device always goes to the same one
+    RULE_WORKER_QUEUE_SIZE: int = 200 # Batches queued across all workers before the consumer waits
+
+    # Alert notifications go through the alert_outbox table to notifications_queue
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_INTERVAL_MS: int = 1000 # Also relayed right after alerts are committed
+    OUTBOX_RETENTION_HOURS: float = 24.0 # Sent rows are kept this long
     
     # Service
     SERVICE_NAME: str = "rule-engine-service"
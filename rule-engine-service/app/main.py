@@ -1,13 +1,13 @@
 import logging
 import sys
-import threading
-import json
-import redis
-import time
 from fastapi import FastAPI
 from app.api.api import api_router, health_check
 from app.core.config import settings
-from app.services.processor import process_event
+from app.services.alert_state import alert_state
+from app.services.consumer import event_consumer
+from app.services.outbox import outbox_relay
+from app.services.rule_cache import rule_cache
+from app.services.workers import worker_pool
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -26,32 +26,26 @@ app = FastAPI(
 app.include_router(api_router, prefix="/api/v1")
 app.add_api_route("/health", health_check, methods=["GET"])
 
-# Background Worker Thread for Redis Queue
-def worker_loop():
-    logger.info("Starting Rule Engine Worker Loop")
-    r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-    while True:
-        try:
-            # BLPOP blocks until item available
-            # Queue name from Telemetry Service: "events_queue"
-            msg = r.blpop("events_queue", timeout=5) 
-            if msg:
-                queue, payload = msg
-                event = json.loads(payload)
-                process_event(event) # Async processing usually, here sync for simplicity
-                
-        except redis.ConnectionError:
-            logger.error("Redis connection lost, retrying...")
-            time.sleep(5)
-        except Exception as e:
-            logger.error(f"Error in worker loop: {e}")
-            time.sleep(1)
-
 @app.on_event("startup")
 async def startup_event():
-    # Start worker thread
-    t = threading.Thread(target=worker_loop, daemon=True)
-    t.start()
+    # Rule changes from the API service invalidate cached rules
+    rule_cache.start()
+    # Open alerts for cooldown and auto-resolve, before the first event
+    alert_state.start()
+    # Relays alert notifications, including any left from the last run
+    outbox_relay.start()
+    # Evaluation workers, then the events_queue consumer feeding them
+    worker_pool.start()
+    event_consumer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    event_consumer.stop()
+    # Batches already handed to the workers are evaluated before the relay stops
+    worker_pool.stop()
+    outbox_relay.stop()
+    alert_state.stop()
+    rule_cache.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -39,3 +39,13 @@ class NotificationLog(Base):
     channel = Column(Enum("email", "whatsapp"), nullable=False)
     status = Column(Enum("pending", "sent", "failed"), nullable=False, default="pending")
     retry_count = Column(Integer, nullable=False, default=0)
+
+class AlertOutbox(Base):
+    """Notifications for new alerts, written with the alert and relayed to Redis by OutboxRelay."""
+    __tablename__ = "alert_outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    factory_id = Column(String(36), nullable=False)
+    alert_id = Column(String(36), ForeignKey("alerts.id"), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True, index=True)
@@ -0,0 +1,280 @@
+from datetime import datetime, timedelta
+from app.core import database
+from app.core.config import settings
+from app.models.models import Alert
+import json
+import logging
+import threading
+import uuid
+import redis
+
+logger = logging.getLogger("alert-state")
+
+# Alert status changes, published by every rule engine instance and by the
+# API service when an alert is acknowledged or resolved
+STATE_CHANNEL = "alert_state"
+# Shared snapshot: rule_id -> JSON [[alert_id, triggered_at], ...] of open alerts
+STATE_KEY = "rule_engine:open_alerts"
+
+class AlertStateStore:
+    """
+    Open alerts per rule (id and trigger time, oldest first), which is all
+    the cooldown check and auto-resolve need, so evaluation runs no alert
+    SELECTs.
+
+    Rebuilt from MySQL at `start`; if MySQL is unavailable the shared Redis
+    snapshot is used, and failing that each rule is loaded from MySQL the
+    first time it is needed. Changes are made through an AlertStateBatch and
+    applied when the batch's transaction has committed, then published on
+    STATE_CHANNEL and written to the snapshot in one round trip. Changes
+    from other instances and from the API service arrive on the channel.
+    """
+    def __init__(self, session_factory=None, redis_client_factory=None):
+        self._session_factory = session_factory
+        self._redis_client_factory = redis_client_factory
+        self._redis = None
+        self._open = {} # rule_id -> [(alert_id, triggered_at), ...]
+        self.loaded = False
+        self.source = uuid.uuid4().hex # Own messages are skipped
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.loads = 0
+        self.snapshot_loads = 0
+        self.rule_loads = 0
+        self.published = 0
+        self.remote_updates = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        if not self.load():
+            self.load_snapshot()
+        if self._redis_client_factory is not None:
+            self._thread = threading.Thread(target=self._run_updates, name="alert-state-updates", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._open = {}
+            self.loaded = False
+
+    def load(self) -> bool:
+        """Rebuild from every open alert in MySQL."""
+        db = (self._session_factory or database.SessionLocal)()
+        try:
+            rows = db.query(Alert.rule_id, Alert.id, Alert.triggered_at).filter(
+                Alert.status == "open").order_by(Alert.triggered_at).all()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error loading open alerts: {e}")
+            return False
+        finally:
+            db.close()
+        state = {}
+        for rule_id, alert_id, triggered_at in rows:
+            state.setdefault(rule_id, []).append((alert_id, triggered_at))
+        with self._lock:
+            self._open = state
+            self.loaded = True
+        self.loads += 1
+        logger.info(f"Loaded {len(rows)} open alerts for {len(state)} rules")
+        return True
+
+    def load_snapshot(self) -> bool:
+        """Load the shared Redis snapshot, for when MySQL is unavailable at startup."""
+        try:
+            snapshot = self._client().hgetall(STATE_KEY)
+        except redis.RedisError as e:
+            self._redis = None
+            self.errors += 1
+            logger.error(f"Error loading open alerts snapshot: {e}")
+            return False
+        state = {}
+        for rule_id, raw in snapshot.items():
+            alerts = [(alert_id, datetime.fromisoformat(ts)) for alert_id, ts in json.loads(raw)]
+            if alerts:
+                state[rule_id] = alerts
+        with self._lock:
+            self._open = state
+            self.loaded = True
+        self.snapshot_loads += 1
+        return True
+
+    def batch(self) -> "AlertStateBatch":
+        return AlertStateBatch(self)
+
+    def open_alerts(self, db, rule_id: str) -> list:
+        alerts = self._open.get(rule_id)
+        if alerts is not None or self.loaded:
+            return alerts or []
+        # Not loaded: this rule's open alerts from MySQL, kept from now on
+        rows = db.query(Alert.id, Alert.triggered_at).filter(
+            Alert.rule_id == rule_id, Alert.status == "open").order_by(Alert.triggered_at).all()
+        alerts = [(alert_id, triggered_at) for alert_id, triggered_at in rows]
+        with self._lock:
+            self._open.setdefault(rule_id, alerts)
+        self.rule_loads += 1
+        return alerts
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "rules": len(self._open),
+            "open_alerts": sum(len(a) for a in self._open.values()),
+            "loads": self.loads,
+            "snapshot_loads": self.snapshot_loads,
+            "rule_loads": self.rule_loads,
+            "published": self.published,
+            "remote_updates": self.remote_updates,
+            "errors": self.errors,
+        }
+
+    def _apply(self, added: dict, closed: dict, messages: list):
+        # Applied as changes to the current lists, not as the batch's view of
+        # them: updates that arrived on the channel meanwhile are kept
+        changed = {}
+        with self._lock:
+            for rule_id in added.keys() | closed.keys():
+                changed[rule_id] = self._open[rule_id] = _changed(
+                    self._open.get(rule_id) or [], added.get(rule_id, ()), closed.get(rule_id, ()))
+        self._publish(changed, messages)
+
+    def _publish(self, changed: dict, messages: list):
+        if self._redis_client_factory is None or not changed:
+            return
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            for rule_id, alerts in changed.items():
+                if alerts:
+                    pipe.hset(STATE_KEY, rule_id, json.dumps([[a, ts.isoformat()] for a, ts in alerts]))
+                else:
+                    pipe.hdel(STATE_KEY, rule_id)
+            for message in messages:
+                pipe.publish(STATE_CHANNEL, json.dumps({"source": self.source, **message}))
+            pipe.execute()
+            self.published += len(messages)
+        except redis.RedisError as e:
+            # Other instances catch up when they reload; evaluation goes on
+            self._redis = None
+            self.errors += 1
+            logger.warning(f"Could not publish {len(messages)} alert state changes: {e}")
+
+    def _client(self):
+        if self._redis is None:
+            self._redis = self._redis_client_factory()
+        return self._redis
+
+    def _run_updates(self):
+        retry_delay = 1.0
+        subscribed_once = False
+        while not self._stop.is_set():
+            try:
+                pubsub = self._redis_client_factory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(STATE_CHANNEL)
+                retry_delay = 1.0
+                # Changes published while we were not subscribed were missed
+                if subscribed_once:
+                    self.load()
+                subscribed_once = True
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._on_update(message["data"])
+                pubsub.close()
+            except redis.RedisError as e:
+                logger.warning(f"Alert state channel unavailable: {e}")
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
+    def _on_update(self, data):
+        try:
+            message = json.loads(data)
+            if message.get("source") == self.source:
+                return
+            rule_id, alert_id, status = message["rule_id"], message["alert_id"], message["status"]
+            triggered_at = datetime.fromisoformat(message["triggered_at"]) if status == "open" else None
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed alert state update {data!r}: {e}")
+            return
+        with self._lock:
+            current = self._open.get(rule_id)
+            if current is None and not self.loaded:
+                return # Loaded from MySQL when first needed
+            alerts = [a for a in current or [] if a[0] != alert_id]
+            if status == "open":
+                alerts.append((alert_id, triggered_at))
+                alerts.sort(key=_triggered_at)
+            if alerts == (current or []):
+                return
+            self._open[rule_id] = alerts
+        self.remote_updates += 1
+        # Every instance writes the same result, so the snapshot follows
+        # changes made through the API as well
+        self._publish({rule_id: alerts}, [])
+
+class AlertStateBatch:
+    """
+    Changes of one batch transaction: alerts opened and closed per rule.
+    Reads see the store's current state with the batch's changes on top;
+    `commit` applies them to the store once the transaction has committed.
+    """
+    def __init__(self, store: AlertStateStore):
+        self._store = store
+        self._added = {} # rule_id -> [(alert_id, triggered_at), ...]
+        self._closed = {} # rule_id -> {alert_id, ...}
+        self._messages = []
+
+    def open_alerts(self, db, rule_id: str) -> list:
+        alerts = self._store.open_alerts(db, rule_id)
+        if rule_id not in self._added and rule_id not in self._closed:
+            return alerts
+        return _changed(alerts, self._added.get(rule_id, ()), self._closed.get(rule_id, ()))
+
+    def in_cooldown(self, db, rule_id: str, cooldown_seconds: int, now: datetime) -> bool:
+        """True if the rule's latest open alert was triggered less than `cooldown_seconds` ago."""
+        alerts = self.open_alerts(db, rule_id)
+        return bool(alerts) and alerts[-1][1] > now - timedelta(seconds=cooldown_seconds)
+
+    def latest_open(self, db, rule_id: str):
+        alerts = self.open_alerts(db, rule_id)
+        return alerts[-1][0] if alerts else None
+
+    def opened(self, db, factory_id: str, rule_id: str, alert_id: str, triggered_at: datetime):
+        self.open_alerts(db, rule_id) # Loads the rule if needed
+        self._added.setdefault(rule_id, []).append((alert_id, triggered_at))
+        self._messages.append({"factory_id": factory_id, "rule_id": rule_id, "alert_id": alert_id,
+                               "status": "open", "triggered_at": triggered_at.isoformat()})
+
+    def closed(self, db, factory_id: str, rule_id: str, alert_id: str, status: str):
+        self.open_alerts(db, rule_id)
+        self._closed.setdefault(rule_id, set()).add(alert_id)
+        self._messages.append({"factory_id": factory_id, "rule_id": rule_id, "alert_id": alert_id,
+                               "status": status})
+
+    def commit(self):
+        self._store._apply(self._added, self._closed, self._messages)
+
+def _changed(alerts: list, added, closed) -> list:
+    """`alerts` with `added` opened and the ids in `closed` closed, oldest first."""
+    alerts = [a for a in (*alerts, *added) if a[0] not in closed]
+    alerts.sort(key=_triggered_at)
+    return alerts
+
+def _triggered_at(alert: tuple):
+    return alert[1]
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+alert_state = AlertStateStore(redis_client_factory=_redis_client)
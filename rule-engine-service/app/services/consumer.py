@@ -0,0 +1,132 @@
+from app.core.config import settings
+from app.services.processor import process_events
+from app.services.workers import worker_pool
+import json
+import logging
+import threading
+import time
+import redis
+
+logger = logging.getLogger("rule-engine-consumer")
+
+# Filled by the Telemetry Service with LPUSH, oldest entry at the tail
+EVENTS_QUEUE = "events_queue"
+
+def take_batch(client, key: str, max_items: int, max_wait: float, block_timeout: float = 5.0) -> list:
+    """
+    Pop up to `max_items` entries, oldest first. Blocks up to `block_timeout`
+    for the first one, then keeps taking what is queued (RPOP with a count,
+    one round trip for a backlog) and waits at most `max_wait` seconds for
+    more while the batch is not full.
+    """
+    first = client.brpop(key, timeout=block_timeout)
+    if not first:
+        return []
+    batch = [first[1]]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_items:
+        more = client.rpop(key, max_items - len(batch))
+        if more:
+            batch.extend(more)
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        item = client.brpop(key, timeout=remaining)
+        if not item:
+            break
+        batch.append(item[1])
+    return batch
+
+class EventConsumer:
+    """
+    Pulls events from EVENTS_QUEUE in batches of up to `batch_size`, waiting
+    at most `batch_wait` seconds to fill one, and hands each batch to
+    `handler`: `process_events` (one DB transaction per batch) or, for the
+    service, the worker pool. Under a backlog every round trip moves a full
+    batch instead of a single event.
+    """
+    def __init__(self, redis_client_factory, batch_size: int, batch_wait: float, handler=process_events):
+        self._redis_client_factory = redis_client_factory
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._handler = handler
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.batches = 0
+        self.events = 0
+        self.max_batch = 0
+        self.malformed = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rule-engine-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # The batch being processed is finished first
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def handle(self, payloads: list):
+        events = []
+        for payload in payloads:
+            try:
+                events.append(json.loads(payload))
+            except ValueError:
+                self.malformed += 1
+                logger.warning(f"Ignoring malformed event {payload!r}")
+        if events:
+            self._handler(events)
+        self.batches += 1
+        self.events += len(events)
+        self.max_batch = max(self.max_batch, len(payloads))
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "events": self.events,
+            "mean_batch": round(self.events / self.batches, 2) if self.batches else None,
+            "max_batch": self.max_batch,
+            "malformed": self.malformed,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        logger.info("Starting Rule Engine Worker Loop")
+        client = None
+        while not self._stop.is_set():
+            try:
+                if client is None:
+                    client = self._redis_client_factory()
+                # Short block so a stop request is noticed
+                payloads = take_batch(client, EVENTS_QUEUE, self.batch_size, self.batch_wait, block_timeout=1.0)
+                if payloads:
+                    self.handle(payloads)
+            except redis.ConnectionError:
+                client = None
+                self.errors += 1
+                logger.error("Redis connection lost, retrying...")
+                self._stop.wait(5)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in worker loop: {e}")
+                self._stop.wait(1)
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+event_consumer = EventConsumer(
+    _redis_client,
+    batch_size=settings.EVENT_BATCH_SIZE,
+    batch_wait=settings.EVENT_BATCH_WAIT_MS / 1000,
+    handler=worker_pool.dispatch,
+)
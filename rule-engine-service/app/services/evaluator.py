@@ -1,4 +1,5 @@
 from datetime import datetime, time
+import operator
 import logging
 
 logger = logging.getLogger("rule-evaluator")
@@ -50,3 +51,119 @@ def evaluate_rule(rule, payload: dict) -> bool:
         return all(results)
     else:
         return any(results)
+
+# Compiled rules: the checks above, prepared once when rules are loaded
+
+def _eq(value, threshold) -> bool:
+    return abs(value - threshold) < 0.001
+
+def _neq(value, threshold) -> bool:
+    return abs(value - threshold) >= 0.001
+
+def _never(value, threshold) -> bool:
+    return False
+
+OPERATORS = {
+    "GT": operator.gt,
+    "LT": operator.lt,
+    "GTE": operator.ge,
+    "LTE": operator.le,
+    "EQ": _eq,
+    "NEQ": _neq,
+}
+
+RULE_FIELDS = ("id", "factory_id", "device_id", "name", "is_active", "conditions", "condition_operator",
+               "schedule_start", "schedule_end", "cooldown_seconds", "auto_resolve")
+
+_MISSING = object()
+
+def parse_schedule_time(value):
+    try:
+        return datetime.strptime(value, "%H:%M:%S").time()
+    except (TypeError, ValueError):
+        return None
+
+class CompiledRule:
+    """
+    A rule prepared for evaluation: a plain copy of the row (usable after its
+    session is gone) with the schedule parsed and an operator function per
+    condition. Evaluates exactly like `evaluate_rule`; AND/OR stop at the
+    first deciding condition.
+    """
+    __slots__ = RULE_FIELDS + ("position", "properties", "_conditions", "_all", "_start", "_end")
+
+    def __init__(self, rule, position: int = 0):
+        for field in RULE_FIELDS:
+            setattr(self, field, getattr(rule, field))
+        self.position = position
+        self._conditions = tuple(
+            (c.get("property"), OPERATORS.get(c.get("operator"), _never), c.get("threshold"))
+            for c in self.conditions
+        )
+        self.properties = frozenset(prop for prop, _, _ in self._conditions)
+        self._all = self.condition_operator == "AND"
+        self._start = self._end = None
+        if self.schedule_start and self.schedule_end:
+            # Unparseable schedules are open, as in check_schedule
+            start, end = parse_schedule_time(self.schedule_start), parse_schedule_time(self.schedule_end)
+            if start is not None and end is not None:
+                self._start, self._end = start, end
+
+    def in_schedule(self, now: time) -> bool:
+        if self._start is None:
+            return True
+        if self._start <= self._end:
+            return self._start <= now <= self._end
+        return self._start <= now or now <= self._end # Crosses midnight
+
+    def matches(self, payload: dict, now: time) -> bool:
+        if not self.is_active or not self.in_schedule(now):
+            return False
+        if self._all:
+            for prop, op, threshold in self._conditions:
+                value = payload.get(prop, _MISSING)
+                if value is _MISSING or not op(value, threshold):
+                    return False
+            return True
+        for prop, op, threshold in self._conditions:
+            value = payload.get(prop, _MISSING)
+            if value is not _MISSING and op(value, threshold):
+                return True
+        return False
+
+class RuleIndex:
+    """
+    Compiled rules of one device, indexed by the properties their conditions
+    use, so an event only reaches rules that reference a property it
+    carries. Rules without conditions see every event.
+    """
+    __slots__ = ("rules", "_by_property", "_unconditional")
+
+    def __init__(self, rules):
+        self.rules = [CompiledRule(r, i) for i, r in enumerate(rules)]
+        self._by_property = {}
+        self._unconditional = []
+        for rule in self.rules:
+            if not rule.properties:
+                self._unconditional.append(rule)
+            for prop in rule.properties:
+                self._by_property.setdefault(prop, []).append(rule)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, payload: dict) -> list:
+        """Rules referencing at least one property of `payload`, in rule order."""
+        by_property = self._by_property
+        hits = [rule for name in payload if name in by_property for rule in by_property[name]]
+        hits += self._unconditional
+        if len(hits) > 1:
+            # A rule over several properties is listed once per property
+            hits = sorted(dict.fromkeys(hits), key=_position)
+        return hits
+
+def _position(rule: CompiledRule) -> int:
+    return rule.position
@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta
+from app.core import database
+from app.core.config import settings
+from app.models.models import AlertOutbox
+import json
+import logging
+import threading
+import time
+import redis
+
+logger = logging.getLogger("alert-outbox")
+
+# Consumed by the Notification Service with BLPOP, so entries are RPUSHed
+NOTIFICATIONS_QUEUE = "notifications_queue"
+
+def notification_payload(factory_id: str, rule, alert_id: str, device_id: str,
+                         triggered_at: datetime, trigger_values: dict) -> dict:
+    """LLD 4.2: { alert, rule, factory_id }, as the notification worker reads it."""
+    return {
+        "factory_id": factory_id,
+        "alert": {
+            "id": alert_id,
+            "rule_id": rule.id,
+            "device_id": device_id,
+            "status": "open",
+            "triggered_at": triggered_at.isoformat(),
+            "trigger_values": trigger_values,
+        },
+        "rule": {"id": rule.id, "name": rule.name},
+    }
+
+class OutboxRelay:
+    """
+    Moves pending alert_outbox rows to NOTIFICATIONS_QUEUE: up to
+    `batch_size` rows per round, pushed in one pipeline, then marked sent in
+    one UPDATE. Rows are only marked after Redis took them, so delivery is
+    at least once; a failure in between sends those rows again.
+
+    Runs every `interval` seconds, and right away when `notify` is called
+    after alerts were committed. Rows are claimed with SKIP LOCKED so
+    several rule engine instances do not send the same ones. Sent rows are
+    purged after `retention`.
+    """
+    def __init__(self, redis_client_factory, batch_size: int, interval: float,
+                 retention: float = 86400.0, session_factory=None):
+        self._redis_client_factory = redis_client_factory
+        self._redis = None
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retention = retention
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+        # Counters
+        self.relayed = 0
+        self.batches = 0
+        self.purged = 0
+        self.errors = 0
+        self.last_lag = 0.0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # What was committed before shutdown still goes out
+        self.drain()
+
+    def notify(self):
+        self._wake.set()
+
+    def drain(self) -> int:
+        total = 0
+        while True:
+            sent = self.relay()
+            total += sent
+            if sent < self.batch_size:
+                return total
+
+    def relay(self) -> int:
+        """Send one batch of pending rows. Returns how many were sent."""
+        db = (self._session_factory or database.SessionLocal)()
+        try:
+            rows = db.query(AlertOutbox).filter(AlertOutbox.sent_at.is_(None)) \
+                .order_by(AlertOutbox.id).limit(self.batch_size) \
+                .with_for_update(skip_locked=True).all()
+            if not rows:
+                db.rollback()
+                return 0
+
+            if self._redis is None:
+                self._redis = self._redis_client_factory()
+            pipe = self._redis.pipeline(transaction=False)
+            for row in rows:
+                pipe.rpush(NOTIFICATIONS_QUEUE, json.dumps(row.payload))
+            pipe.execute()
+
+            now = datetime.utcnow()
+            sent, oldest = len(rows), rows[0].created_at
+            db.query(AlertOutbox).filter(AlertOutbox.id.in_([r.id for r in rows])) \
+                .update({"sent_at": now}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            if isinstance(e, redis.RedisError):
+                self._redis = None
+            db.rollback()
+            self.errors += 1
+            logger.error(f"Error relaying alert notifications: {e}")
+            return 0
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.relayed += sent
+        self.last_lag = (now - oldest).total_seconds()
+        return sent
+
+    def purge(self) -> int:
+        db = (self._session_factory or database.SessionLocal)()
+        try:
+            purged = db.query(AlertOutbox).filter(
+                AlertOutbox.sent_at < datetime.utcnow() - timedelta(seconds=self.retention)
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.errors += 1
+            logger.error(f"Error purging alert outbox: {e}")
+            return 0
+        finally:
+            db.close()
+        self.purged += purged
+        return purged
+
+    def stats(self) -> dict:
+        return {
+            "relayed": self.relayed,
+            "batches": self.batches,
+            "purged": self.purged,
+            "errors": self.errors,
+            "last_lag_seconds": round(self.last_lag, 3),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.drain()
+            if time.monotonic() - self._last_purge >= 3600:
+                self._last_purge = time.monotonic()
+                self.purge()
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+outbox_relay = OutboxRelay(
+    _redis_client,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    interval=settings.OUTBOX_INTERVAL_MS / 1000,
+    retention=settings.OUTBOX_RETENTION_HOURS * 3600,
+)
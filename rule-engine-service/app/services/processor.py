@@ -1,78 +1,136 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.core.database import SessionLocal
-from app.models.models import Rule, Alert, NotificationLog
-from app.services.evaluator import evaluate_rule
+from app.models.models import Alert, AlertOutbox
+from app.services.alert_state import alert_state
+from app.services.outbox import notification_payload, outbox_relay
+from app.services.rule_cache import rule_cache
 import logging
+import threading
 
 logger = logging.getLogger("rule-engine")
 
+STATS = {
+    "batches": 0,
+    "events": 0,
+    "alerts_created": 0,
+    "alerts_resolved": 0,
+    "batch_failures": 0,
+    "errors": 0,
+}
+# Batches are evaluated by several workers at once
+_STATS_LOCK = threading.Lock()
+
+def get_stats() -> dict:
+    with _STATS_LOCK:
+        return dict(STATS)
+
 def process_event(event: dict):
-    factory_id = event.get("factory_id")
-    device_id = event.get("device_id")
-    payload = event.get("properties", {})
-    
+    process_events([event])
+
+def process_events(events: list):
+    """
+    Evaluate a batch of events in one DB session. Events are grouped per
+    (factory_id, device_id), so each device's rules are looked up once and
+    its events are applied in order. Alert writes and resolutions of the
+    whole batch are committed in one transaction; if that fails, the batch
+    is rolled back and retried one event per transaction so a single bad
+    event cannot hold back the others.
+    """
+    groups = {}
+    for event in events:
+        groups.setdefault((event.get("factory_id"), event.get("device_id")), []).append(event)
+
     db = SessionLocal()
+    state = alert_state.batch()
     try:
-        # 1. Fetch active rules
-        rules = db.query(Rule).filter(
-            Rule.factory_id == factory_id,
-            Rule.device_id == device_id,
-            Rule.is_active == True
-        ).all()
-        
-        for rule in rules:
+        created = resolved = 0
+        for (factory_id, device_id), device_events in groups.items():
+            c, r = _apply_device_events(db, state, factory_id, device_id, device_events)
+            created += c
+            resolved += r
+        db.commit()
+        state.commit()
+        if created:
+            outbox_relay.notify()
+        with _STATS_LOCK:
+            STATS["batches"] += 1
+            STATS["events"] += len(events)
+            STATS["alerts_created"] += created
+            STATS["alerts_resolved"] += resolved
+    except Exception as e:
+        db.rollback()
+        if len(events) == 1:
+            with _STATS_LOCK:
+                STATS["errors"] += 1
+            logger.error(f"Error processing event: {e}")
+            return
+        with _STATS_LOCK:
+            STATS["batch_failures"] += 1
+        logger.error(f"Error processing batch of {len(events)} events, retrying one by one: {e}")
+        db.close()
+        for event in events:
+            process_events([event])
+    finally:
+        db.close()
+
+def _apply_device_events(db, state, factory_id: str, device_id: str, events: list) -> tuple:
+    """Evaluate one device's events in order. Returns (alerts created, alerts resolved)."""
+    # 1. Fetch active rules (cached and compiled, see RuleCache)
+    rules = rule_cache.get(db, factory_id, device_id)
+    created = resolved = 0
+    if not len(rules):
+        return created, resolved
+
+    for event in events:
+        payload = event.get("properties", {})
+        now = datetime.utcnow().time()
+
+        # Rules over none of the event's properties are neither triggered nor resolved
+        for rule in rules.candidates(payload):
             try:
                 # 2. Evaluate
-                triggered = evaluate_rule(rule, payload)
-                
-                if triggered:
-                    # Check Cooldown
-                    last_alert = db.query(Alert).filter(
-                        Alert.rule_id == rule.id,
-                        Alert.status == "open",
-                        Alert.triggered_at > datetime.utcnow() - timedelta(seconds=rule.cooldown_seconds)
-                    ).first()
-                    
-                    if not last_alert:
-                        # Create Alert
-                        new_alert = Alert(
-                            factory_id=factory_id,
-                            rule_id=rule.id,
-                            device_id=device_id,
-                            status="open",
-                            trigger_values=payload
-                        )
-                        db.add(new_alert)
-                        db.commit() # Commit to get ID
-                        
-                        logger.info(f"Alert created: {new_alert.id} for rule {rule.id}")
-                        
-                        # Publish Notification (Mock - Insert Log which Notification Service would pick up)
-                        # Here we just insert into NotificationLog or publish to another queue
-                        # LLD 4.2 -> Publish to Notification Queue: { alert_id, rule, ... }
-                        
-                        # Minimal implementation: Insert NotificationLog directly if Worker is same process or separate
-                        # LLD 4.3 says Notification Worker consumes from Notification Queue.
-                        # We will simulate publishing by just logging for now, or use Redis queue if implemented.
-                        pass
-                
-                elif rule.auto_resolve:
-                    # Check if open alert exists to resolve
-                    open_alert = db.query(Alert).filter(
-                        Alert.rule_id == rule.id,
-                        Alert.status == "open"
-                    ).order_by(Alert.triggered_at.desc()).first()
-                    
-                    if open_alert:
-                        open_alert.status = "resolved"
-                        open_alert.resolved_at = datetime.utcnow()
-                        db.commit()
-                        logger.info(f"Alert resolved: {open_alert.id}")
-
+                triggered = rule.matches(payload, now)
             except Exception as e:
                 logger.error(f"Error evaluating rule {rule.id}: {e}")
-                
-    except Exception as e:
-        logger.error(f"Error processing event: {e}")
-    finally:
-        db.close()
+                continue
+
+            # Writes are flushed, not committed, and the batch commits once
+            if triggered:
+                # Check Cooldown (open alerts are tracked in AlertStateStore)
+                utcnow = datetime.utcnow()
+                if not state.in_cooldown(db, rule.id, rule.cooldown_seconds, utcnow):
+                    # Create Alert
+                    new_alert = Alert(
+                        factory_id=factory_id,
+                        rule_id=rule.id,
+                        device_id=device_id,
+                        status="open",
+                        triggered_at=utcnow,
+                        trigger_values=payload
+                    )
+                    db.add(new_alert)
+                    db.flush() # Assigns the ID
+                    # LLD 4.2 -> Publish to Notification Queue: { alert_id, rule, ... }
+                    # Written with the alert, sent by OutboxRelay after commit
+                    db.add(AlertOutbox(
+                        factory_id=factory_id,
+                        alert_id=new_alert.id,
+                        payload=notification_payload(factory_id, rule, new_alert.id, device_id, utcnow, payload),
+                    ))
+                    state.opened(db, factory_id, rule.id, new_alert.id, utcnow)
+                    created += 1
+
+                    logger.info(f"Alert created: {new_alert.id} for rule {rule.id}")
+
+            elif rule.auto_resolve:
+                # Resolve the latest open alert, unless it was acknowledged or
+                # resolved through the API in the meantime
+                alert_id = state.latest_open(db, rule.id)
+                if alert_id:
+                    updated = db.query(Alert).filter(Alert.id == alert_id, Alert.status == "open").update(
+                        {"status": "resolved", "resolved_at": datetime.utcnow()}, synchronize_session=False)
+                    state.closed(db, factory_id, rule.id, alert_id, "resolved")
+                    if updated:
+                        resolved += 1
+                        logger.info(f"Alert resolved: {alert_id}")
+    return created, resolved
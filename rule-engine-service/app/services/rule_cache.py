@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from app.core.config import settings
+from app.models.models import Rule
+from app.services.evaluator import RuleIndex
+import json
+import logging
+import threading
+import time
+import redis
+
+logger = logging.getLogger("rule-cache")
+
+# Published by the API service when a rule is created, updated or deleted
+INVALIDATION_CHANNEL = "rules_invalidation"
+
+class RuleCache:
+    """
+    Active rules per (factory_id, device_id), so events do not query MySQL
+    for rules that have not changed (LLD 4.2: cached with TTL 30s,
+    invalidated on rule create/update). Rules are compiled into a RuleIndex
+    once per load.
+
+    Entries live in a bounded LRU for `ttl` seconds; devices without rules
+    are cached too. Invalidations published by the API service drop entries
+    right away, the TTL bounds staleness if one is missed. A load that
+    overlaps an invalidation is returned but not cached.
+    """
+    def __init__(self, ttl: float, max_devices: int, redis_client_factory=None):
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self._redis_client_factory = redis_client_factory
+        self._entries = OrderedDict() # (factory_id, device_id) -> (loaded_at, RuleIndex)
+        self._generation = 0 # bumped by every invalidation
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.errors = 0
+        self._age_total = 0.0
+        self.max_age = 0.0
+
+    def get(self, db, factory_id: str, device_id: str) -> RuleIndex:
+        """Active rules of the device, from the cache or loaded with `db`."""
+        key = (factory_id, device_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._age_total += age
+                    self.max_age = max(self.max_age, age)
+                    return entry[1]
+                self.expired += 1
+            self.misses += 1
+            generation = self._generation
+
+        try:
+            rows = db.query(Rule).filter(
+                Rule.factory_id == factory_id,
+                Rule.device_id == device_id,
+                Rule.is_active == True
+            ).all()
+        except Exception:
+            self.errors += 1
+            raise
+        rules = RuleIndex(rows)
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now, rules)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_devices:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return rules
+
+    def invalidate(self, factory_id: str, device_id: str = None):
+        """Drop the device's rules, or every device of the factory without `device_id`."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if device_id is not None:
+                self._entries.pop((factory_id, device_id), None)
+                return
+            for key in [k for k in self._entries if k[0] == factory_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def start(self):
+        if self._thread or self._redis_client_factory is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_invalidations, name="rule-cache-invalidations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "devices": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            # How old the rules were when served from the cache
+            "mean_age_seconds": round(self._age_total / self.hits, 3) if self.hits else None,
+            "max_age_seconds": round(self.max_age, 3),
+        }
+
+    def _run_invalidations(self):
+        retry_delay = 1.0
+        while not self._stop.is_set():
+            try:
+                pubsub = self._redis_client_factory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                retry_delay = 1.0
+                # Changes made while we were not subscribed were missed
+                self.clear()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._on_invalidation(message["data"])
+                pubsub.close()
+            except redis.RedisError as e:
+                logger.warning(f"Rule invalidation channel unavailable: {e}")
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
+    def _on_invalidation(self, data):
+        try:
+            message = json.loads(data)
+            self.invalidate(message["factory_id"], message.get("device_id"))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed rule invalidation {data!r}: {e}")
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+rule_cache = RuleCache(
+    ttl=settings.RULE_CACHE_TTL_SECONDS,
+    max_devices=settings.RULE_CACHE_MAX_DEVICES,
+    redis_client_factory=_redis_client,
+)
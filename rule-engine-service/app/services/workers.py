@@ -0,0 +1,157 @@
+from collections import deque
+from app.core.config import settings
+from app.services.processor import process_events
+import logging
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("rule-engine-workers")
+
+_STOP = object()
+# Throughput is reported over this many recent seconds
+RATE_WINDOW = 60.0
+
+def worker_for(factory_id: str, device_id: str, workers: int) -> int:
+    """Stable worker index for a device, so its events are evaluated in order (auto_resolve relies on it)."""
+    return zlib.crc32(f"{factory_id}/{device_id}".encode()) % workers
+
+class EventWorker:
+    """One evaluation thread with its own queue, batches and DB transactions."""
+    def __init__(self, index: int, handler, queue_size: int, batch_size: int):
+        self.index = index
+        self._handler = handler
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._recent = deque() # (finished_at, events) of recent batches
+
+        # Counters
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"rule-engine-worker-{self.index}", daemon=True)
+        self._thread.start()
+
+    def join(self):
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        recent = sum(count for finished, count in list(self._recent) if now - finished <= RATE_WINDOW)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "events_per_second": round(recent / RATE_WINDOW, 2),
+            # Time the oldest event of the last batch waited for this worker
+            "lag_seconds": round(self.lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+        }
+
+    def _take(self) -> tuple:
+        """Block for the next item, then take queued ones up to `batch_size` events."""
+        enqueued_at, events = self.queue.get()
+        if events is _STOP:
+            return enqueued_at, None, True
+        batch = list(events)
+        stopping = False
+        while len(batch) < self.batch_size:
+            try:
+                _, more = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if more is _STOP:
+                stopping = True
+                break
+            batch.extend(more)
+        return enqueued_at, batch, stopping
+
+    def _run(self):
+        while True:
+            enqueued_at, batch, stopping = self._take()
+            if batch:
+                started = time.monotonic()
+                self.lag = started - enqueued_at
+                self.max_lag = max(self.max_lag, self.lag)
+                try:
+                    self._handler(batch)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Worker {self.index} failed on a batch of {len(batch)} events: {e}")
+                finished = time.monotonic()
+                self.processed += len(batch)
+                self.batches += 1
+                self._recent.append((finished, len(batch)))
+                while self._recent and finished - self._recent[0][0] > RATE_WINDOW:
+                    self._recent.popleft()
+            if stopping:
+                return
+
+class WorkerPool:
+    """
+    Evaluation workers fed by the events_queue consumer. Each event goes to
+    the worker owning its (factory_id, device_id), so a device's events are
+    evaluated in order while different devices run in parallel, each worker
+    with its own DB session per batch. `dispatch` blocks while the owning
+    worker's queue is full, which slows down reading from Redis.
+
+    Ordering holds within one rule engine instance; instances reading the
+    same queue do not coordinate.
+    """
+    def __init__(self, workers: int, queue_size: int, batch_size: int, handler=process_events):
+        self.workers = [EventWorker(i, handler, max(queue_size // max(workers, 1), 1), batch_size)
+                        for i in range(max(workers, 1))]
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"Started {len(self.workers)} rule engine workers")
+
+    def stop(self):
+        """Let every worker finish what is queued, then stop."""
+        if not self._running:
+            return
+        self._running = False
+        for worker in self.workers:
+            worker.queue.put((time.monotonic(), _STOP))
+        for worker in self.workers:
+            worker.join()
+
+    def dispatch(self, events: list):
+        now = time.monotonic()
+        parts = {}
+        for event in events:
+            index = worker_for(event.get("factory_id"), event.get("device_id"), len(self.workers))
+            parts.setdefault(index, []).append(event)
+        for index, part in parts.items():
+            self.workers[index].queue.put((now, part))
+
+    def stats(self) -> dict:
+        workers = [w.stats() for w in self.workers]
+        return {
+            "workers": len(workers),
+            "queue_depth": sum(w["queue_depth"] for w in workers),
+            "processed": sum(w["processed"] for w in workers),
+            "events_per_second": round(sum(w["events_per_second"] for w in workers), 2),
+            "max_lag_seconds": max(w["max_lag_seconds"] for w in workers),
+            "per_worker": workers,
+        }
+
+worker_pool = WorkerPool(
+    workers=settings.RULE_WORKERS,
+    queue_size=settings.RULE_WORKER_QUEUE_SIZE,
+    batch_size=settings.EVENT_BATCH_SIZE,
+)
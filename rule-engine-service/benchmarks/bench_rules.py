@@ -0,0 +1,79 @@
+"""
+Events/sec on one core: evaluate_rule over every rule of a device vs the
+compiled RuleIndex, for devices with hundreds of rules.
+
+Run from the rule-engine-service directory:
+    python -m benchmarks.bench_rules
+"""
+import random
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+from app.services.evaluator import RuleIndex, evaluate_rule
+
+RULE_COUNTS = (100, 300, 1000)
+PROPERTIES = 50
+EVENT_PROPERTIES = (1, 5, 20)
+OPERATORS = ("GT", "LT", "GTE", "LTE", "EQ", "NEQ")
+
+def make_rules(count: int, rng: random.Random) -> list:
+    rules = []
+    for i in range(count):
+        conditions = [
+            {"property": f"sensor_{rng.randrange(PROPERTIES)}", "operator": rng.choice(OPERATORS),
+             "threshold": rng.uniform(0, 100)}
+            for _ in range(rng.choice((1, 1, 2, 3)))
+        ]
+        scheduled = i % 4 == 0
+        rules.append(SimpleNamespace(
+            id=f"rule-{i}", factory_id="fct-001", device_id="dev-001", name=f"Rule {i}", is_active=True,
+            conditions=conditions, condition_operator=rng.choice(("AND", "OR")),
+            schedule_start="06:00:00" if scheduled else None, schedule_end="22:00:00" if scheduled else None,
+            cooldown_seconds=300, auto_resolve=False,
+        ))
+    return rules
+
+def make_events(properties: int, rng: random.Random, count: int = 100) -> list:
+    return [
+        {f"sensor_{p}": rng.uniform(0, 100) for p in rng.sample(range(PROPERTIES), properties)}
+        for _ in range(count)
+    ]
+
+def best_of(fn, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+def main(number: int = 200):
+    rng = random.Random(42)
+    print(f"{'rules':>6} {'props':>6} {'scan ev/s':>10} {'index ev/s':>11} {'speedup':>8} {'evaluated':>10}")
+    for rule_count in RULE_COUNTS:
+        rules = make_rules(rule_count, rng)
+        index = RuleIndex(rules)
+        for properties in EVENT_PROPERTIES:
+            events = make_events(properties, rng)
+            state = {"i": 0}
+
+            def next_event():
+                state["i"] = (state["i"] + 1) % len(events)
+                return events[state["i"]]
+
+            def scan():
+                payload = next_event()
+                return [r for r in rules if evaluate_rule(r, payload)]
+
+            def indexed():
+                payload = next_event()
+                now = datetime.utcnow().time()
+                return [r for r in index.candidates(payload) if r.matches(payload, now)]
+
+            # Same rules trigger either way
+            for payload in events:
+                now = datetime.utcnow().time()
+                assert [r.id for r in rules if evaluate_rule(r, payload)] == \
+                       [r.id for r in index.candidates(payload) if r.matches(payload, now)]
+            evaluated = sum(len(index.candidates(e)) for e in events) / len(events)
+            old = best_of(scan, number)
+            new = best_of(indexed, number)
+            print(f"{rule_count:>6} {properties:>6} {1 / old:>10,.0f} {1 / new:>11,.0f} {old / new:>8.1f} {evaluated:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 from app.core import database
-from sqlalchemy import create_engine
+from app.services.alert_state import alert_state
+from app.services.rule_cache import rule_cache
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 import pytest
+import redis
 
 # Use SQLite for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -27,10 +30,72 @@ def db_session(test_engine, monkeypatch):
     monkeypatch.setattr("app.services.processor.SessionLocal", lambda: session)
     
     # Clear tables before each test
-    session.execute("DELETE FROM alerts")
-    session.execute("DELETE FROM rules")
+    session.execute(text("DELETE FROM alert_outbox"))
+    session.execute(text("DELETE FROM alerts"))
+    session.execute(text("DELETE FROM rules"))
     session.commit()
+    rule_cache.clear()
+    # Loaded per rule from the test session; nothing is published
+    alert_state.reset()
+    monkeypatch.setattr(alert_state, "_redis_client_factory", None)
     
     yield session
     
     session.close()
+
+class FakeRedis:
+    """In-memory Redis with the list, hash and pipeline commands the service uses."""
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.published = []
+        self.down = False
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def check(self):
+        if self.down:
+            raise redis.ConnectionError("redis down")
+
+    def rpush(self, key, *values):
+        self.check()
+        self.lists.setdefault(key, []).extend(values)
+
+    def hgetall(self, key):
+        self.check()
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, field, value):
+        self.check()
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, *fields):
+        self.check()
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def publish(self, channel, message):
+        self.check()
+        self.published.append((channel, message))
+
+class FakePipeline:
+    """Queues FakeRedis commands and runs them in one round trip on execute()."""
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        self.client.check()
+        results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.client.round_trips += 1
+        return results
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,93 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app.models.models import Alert, Rule
+from app.services.alert_state import AlertStateStore, STATE_KEY, alert_state
+from app.services.processor import process_events
+
+def add_rule(session, rid, resolve=True, cooldown=300):
+    session.add(Rule(
+        id=rid, factory_id="fct-001", device_id="dev-001", name="State Rule", is_active=True,
+        conditions=[{"property": "temp", "operator": "GT", "threshold": 100}],
+        condition_operator="AND", cooldown_seconds=cooldown, auto_resolve=resolve,
+    ))
+    session.commit()
+
+def event_for(temp):
+    return {"factory_id": "fct-001", "device_id": "dev-001", "properties": {"temp": temp}}
+
+def test_loaded_state_needs_no_alert_selects(db_session, test_engine, monkeypatch):
+    add_rule(db_session, "as-1")
+    db_session.add(Alert(id="old-open", factory_id="fct-001", rule_id="as-1", device_id="dev-001",
+                         status="open", triggered_at=datetime.utcnow() - timedelta(hours=1)))
+    db_session.commit()
+    store = AlertStateStore(session_factory=lambda: db_session)
+    assert store.load()
+    monkeypatch.setattr("app.services.processor.alert_state", store)
+
+    selects = []
+    def count_selects(conn, cursor, statement, *args):
+        if statement.lstrip().startswith("SELECT") and "FROM alerts" in statement:
+            selects.append(statement)
+    event.listen(test_engine, "before_cursor_execute", count_selects)
+    try:
+        # Cooldown over: a new alert. Then two normal readings resolve both.
+        process_events([event_for(150), event_for(160), event_for(90)])
+        process_events([event_for(90)])
+    finally:
+        event.remove(test_engine, "before_cursor_execute", count_selects)
+
+    assert selects == []
+    statuses = sorted(a.status for a in db_session.query(Alert).all())
+    assert statuses == ["resolved", "resolved"]
+    assert store.stats()["open_alerts"] == 0
+
+def test_alert_acknowledged_through_the_api_is_not_resolved(db_session):
+    add_rule(db_session, "as-2")
+    process_events([event_for(150)])
+    alert = db_session.query(Alert).filter(Alert.rule_id == "as-2").one()
+    alert_id = alert.id
+    # Acknowledged by the API service, before its state update arrived
+    alert.status = "acknowledged"
+    db_session.commit()
+
+    process_events([event_for(90)])
+    assert db_session.query(Alert).filter(Alert.id == alert_id).one().status == "acknowledged"
+    assert alert_state.batch().latest_open(db_session, "as-2") is None
+
+def test_remote_updates_and_snapshot(fake_redis):
+    redis_client = fake_redis
+    store = AlertStateStore(session_factory=None, redis_client_factory=lambda: redis_client)
+    redis_client.hashes[STATE_KEY] = {"r1": json.dumps([["a1", "2026-01-01T12:00:00"]])}
+    assert store.load_snapshot()
+    batch = store.batch()
+    assert batch.latest_open(None, "r1") == "a1"
+
+    now = datetime.utcnow()
+    store._publish = lambda changed, messages: None
+    store._on_update(json.dumps({"source": "other", "rule_id": "r1", "alert_id": "a2",
+                                 "status": "open", "triggered_at": now.isoformat()}))
+    assert store.batch().in_cooldown(None, "r1", 60, now + timedelta(seconds=30))
+    store._on_update(json.dumps({"source": "api", "rule_id": "r1", "alert_id": "a2", "status": "acknowledged"}))
+    assert store.batch().latest_open(None, "r1") == "a1"
+    # Own messages are not applied twice
+    store._on_update(json.dumps({"source": store.source, "rule_id": "r1", "alert_id": "a1", "status": "resolved"}))
+    assert store.stats()["remote_updates"] == 2
+
+def test_updates_during_a_batch_are_kept_on_commit(fake_redis):
+    fake_redis.hashes[STATE_KEY] = {"r1": json.dumps([["a1", "2026-01-01T12:00:00"]])}
+    store = AlertStateStore(session_factory=None, redis_client_factory=lambda: fake_redis)
+    assert store.load_snapshot()
+
+    batch = store.batch()
+    triggered_at = datetime(2026, 1, 1, 12, 5)
+    batch.opened(None, "fct-001", "r1", "a2", triggered_at)
+    assert [a for a, _ in batch.open_alerts(None, "r1")] == ["a1", "a2"]
+    # Acknowledged through the API while the batch transaction runs
+    store._on_update(json.dumps({"source": "api", "rule_id": "r1", "alert_id": "a1", "status": "acknowledged"}))
+    assert [a for a, _ in batch.open_alerts(None, "r1")] == ["a2"]
+    batch.commit()
+
+    assert store.batch().open_alerts(None, "r1") == [("a2", triggered_at)]
+    assert json.loads(fake_redis.hashes[STATE_KEY]["r1"]) == [["a2", triggered_at.isoformat()]]
+    assert [json.loads(m)["alert_id"] for _, m in fake_redis.published] == ["a2"]
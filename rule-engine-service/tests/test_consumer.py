@@ -0,0 +1,44 @@
+import json
+from app.services.consumer import EventConsumer, take_batch
+
+class FakeRedis:
+    """A list filled with LPUSH, as the Telemetry Service does."""
+    def __init__(self, items=()):
+        self.items = []
+        self.calls = 0
+        for item in items:
+            self.items.insert(0, item)
+
+    def brpop(self, key, timeout=0):
+        self.calls += 1
+        return (key, self.items.pop()) if self.items else None
+
+    def rpop(self, key, count=None):
+        self.calls += 1
+        taken = []
+        while self.items and len(taken) < count:
+            taken.append(self.items.pop())
+        return taken or None
+
+def test_backlog_is_taken_in_full_batches_oldest_first():
+    client = FakeRedis(range(250))
+    batches = []
+    while True:
+        batch = take_batch(client, "events_queue", 100, 0.01, block_timeout=0)
+        if not batch:
+            break
+        batches.append(batch)
+    assert [len(b) for b in batches] == [100, 100, 50]
+    assert [i for b in batches for i in b] == list(range(250))
+    # BRPOP + RPOP per full batch; the short one also waits for more, and
+    # the last call finds the queue empty
+    assert client.calls == 9
+
+def test_consumer_hands_events_to_the_handler():
+    handled = []
+    consumer = EventConsumer(FakeRedis, batch_size=10, batch_wait=0, handler=handled.append)
+    consumer.handle([json.dumps({"device_id": "dev-1"}), "not json", json.dumps({"device_id": "dev-2"})])
+    assert handled == [[{"device_id": "dev-1"}, {"device_id": "dev-2"}]]
+    stats = consumer.stats()
+    assert stats["events"] == 2
+    assert stats["malformed"] == 1
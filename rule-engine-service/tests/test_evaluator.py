@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 import pytest
-from app.services.evaluator import check_schedule, evaluate_condition, evaluate_rule as eval_service_rule
+from app.services.evaluator import check_schedule, evaluate_condition, evaluate_rule as eval_service_rule, CompiledRule, RuleIndex
 
 class MockRule:
     def __init__(self, start=None, end=None, active=True, conds=[], op="AND"):
@@ -61,3 +61,47 @@ def test_evaluate_rule_or():
     
     # Both false
     assert eval_service_rule(rule, {"temp": 90, "pressure": 15}) == False
+
+class FullRule(MockRule):
+    def __init__(self, rid, **kwargs):
+        super().__init__(**kwargs)
+        self.id = rid
+        self.factory_id = "fct-001"
+        self.device_id = "dev-001"
+        self.name = rid
+        self.cooldown_seconds = 300
+        self.auto_resolve = False
+
+def test_compiled_rule_matches_evaluate_rule():
+    now = datetime.utcnow()
+    schedules = [
+        (None, None),
+        ((now - timedelta(minutes=10)).strftime("%H:%M:%S"), (now + timedelta(minutes=10)).strftime("%H:%M:%S")),
+        ((now + timedelta(minutes=10)).strftime("%H:%M:%S"), (now + timedelta(minutes=20)).strftime("%H:%M:%S")),
+        ("bad", "12:00:00"),
+    ]
+    payloads = [{"temp": 101, "pressure": 5}, {"temp": 100, "pressure": 10}, {"pressure": 5}, {}]
+    for op in ("AND", "OR"):
+        for operator in ("GT", "LT", "GTE", "LTE", "EQ", "NEQ", "BOGUS"):
+            conds = [
+                {"property": "temp", "operator": operator, "threshold": 100},
+                {"property": "pressure", "operator": "LT", "threshold": 10},
+            ]
+            for start, end in schedules:
+                rule = FullRule("r", start=start, end=end, conds=conds, op=op)
+                compiled = CompiledRule(rule)
+                for payload in payloads:
+                    assert compiled.matches(payload, datetime.utcnow().time()) == eval_service_rule(rule, payload)
+
+def test_rule_index_returns_rules_using_event_properties():
+    rules = [
+        FullRule("temp", conds=[{"property": "temp", "operator": "GT", "threshold": 1}]),
+        FullRule("both", conds=[{"property": "temp", "operator": "GT", "threshold": 1},
+                                {"property": "rpm", "operator": "GT", "threshold": 1}]),
+        FullRule("rpm", conds=[{"property": "rpm", "operator": "GT", "threshold": 1}]),
+        FullRule("always", conds=[]),
+    ]
+    index = RuleIndex(rules)
+    assert [r.id for r in index.candidates({"rpm": 5})] == ["both", "rpm", "always"]
+    assert [r.id for r in index.candidates({"rpm": 5, "temp": 3})] == ["temp", "both", "rpm", "always"]
+    assert [r.id for r in index.candidates({"humidity": 40})] == ["always"]
@@ -0,0 +1,46 @@
+import json
+from app.models.models import Alert, AlertOutbox, Rule
+from app.services.outbox import OutboxRelay
+from app.services.processor import process_events
+
+def add_rules(session, count):
+    for i in range(count):
+        session.add(Rule(
+            id=f"ob-{i}", factory_id="fct-001", device_id="dev-001", name=f"Outbox Rule {i}", is_active=True,
+            conditions=[{"property": "temp", "operator": "GT", "threshold": i}],
+            condition_operator="AND", cooldown_seconds=300, auto_resolve=False,
+        ))
+    session.commit()
+
+def test_alerts_and_notifications_are_written_together(db_session):
+    add_rules(db_session, 3)
+    process_events([{"factory_id": "fct-001", "device_id": "dev-001", "properties": {"temp": 50}}])
+
+    alerts = {a.id: a.rule_id for a in db_session.query(Alert).all()}
+    entries = db_session.query(AlertOutbox).all()
+    assert len(alerts) == len(entries) == 3
+    for entry in entries:
+        assert entry.sent_at is None
+        assert entry.payload["alert"]["id"] == entry.alert_id
+        assert entry.payload["rule"]["id"] == alerts[entry.alert_id]
+        assert entry.payload["alert"]["trigger_values"] == {"temp": 50}
+
+def test_relay_pushes_in_one_pipeline_and_marks_sent(db_session, fake_redis):
+    add_rules(db_session, 5)
+    process_events([{"factory_id": "fct-001", "device_id": "dev-001", "properties": {"temp": 50}}])
+    client = fake_redis
+    relay = OutboxRelay(lambda: client, batch_size=3, interval=60, session_factory=lambda: db_session)
+
+    client.down = True
+    assert relay.drain() == 0
+    assert db_session.query(AlertOutbox).filter(AlertOutbox.sent_at.is_(None)).count() == 5
+
+    client.down = False
+    assert relay.drain() == 5
+    assert client.round_trips == 2
+    pushed = [json.loads(v)["alert"]["id"] for v in client.lists["notifications_queue"]]
+    assert len(set(pushed)) == 5
+    assert db_session.query(AlertOutbox).filter(AlertOutbox.sent_at.is_(None)).count() == 0
+    stats = relay.stats()
+    assert stats["relayed"] == 5
+    assert stats["errors"] == 1
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from app.services.processor import process_event
+from app.services.processor import process_event, process_events
 from app.models.models import Rule, Alert
 from sqlalchemy import text
 
@@ -59,7 +59,25 @@ def test_auto_resolve_integration(db_session):
     # Trigger NORMAL
     process_event({"factory_id": fid, "device_id": did, "properties": {"temp": 90}})
     
-    # Refresh
-    db_session.refresh(alert)
+    # Re-read: process_event closed the shared session, detaching `alert`
+    alert = db_session.query(Alert).filter(Alert.rule_id == "r3").first()
     assert alert.status == "resolved"
     assert alert.resolved_at is not None
+
+def test_batch_is_applied_in_order_per_device(db_session):
+    fid = "fct-001"
+    create_rule(db_session, "r4", fid, "dev-001", [{"property": "temp", "operator": "GT", "threshold": 100}], resolve=True)
+    create_rule(db_session, "r5", fid, "dev-002", [{"property": "temp", "operator": "GT", "threshold": 100}])
+
+    process_events([
+        {"factory_id": fid, "device_id": "dev-001", "properties": {"temp": 101}},
+        {"factory_id": fid, "device_id": "dev-002", "properties": {"temp": 150}},
+        {"factory_id": fid, "device_id": "dev-001", "properties": {"temp": 105}}, # Cooldown
+        {"factory_id": fid, "device_id": "dev-002", "properties": {"temp": 160}}, # Cooldown
+        {"factory_id": fid, "device_id": "dev-001", "properties": {"temp": 90}},  # Resolves
+    ])
+
+    alerts = {a.rule_id: a for a in db_session.query(Alert).all()}
+    assert set(alerts) == {"r4", "r5"}
+    assert alerts["r4"].status == "resolved"
+    assert alerts["r5"].status == "open"
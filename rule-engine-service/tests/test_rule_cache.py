@@ -0,0 +1,48 @@
+from app.services.processor import process_event
+from app.services.rule_cache import RuleCache, rule_cache
+from app.models.models import Rule, Alert
+
+def add_rule(session, rid, did="dev-001", active=True):
+    session.add(Rule(
+        id=rid, factory_id="fct-001", device_id=did, name="Cached Rule", is_active=active,
+        conditions=[{"property": "temp", "operator": "GT", "threshold": 100}],
+        condition_operator="AND", cooldown_seconds=300, auto_resolve=False,
+    ))
+    session.commit()
+
+def test_rules_are_served_from_cache_until_invalidated(db_session):
+    cache = RuleCache(ttl=30, max_devices=100)
+    add_rule(db_session, "rc-1")
+    assert [r.id for r in cache.get(db_session, "fct-001", "dev-001")] == ["rc-1"]
+
+    add_rule(db_session, "rc-2")
+    assert [r.id for r in cache.get(db_session, "fct-001", "dev-001")] == ["rc-1"]
+
+    cache._on_invalidation('{"factory_id": "fct-001", "device_id": "dev-001"}')
+    assert sorted(r.id for r in cache.get(db_session, "fct-001", "dev-001")) == ["rc-1", "rc-2"]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["invalidations"] == 1
+
+def test_devices_without_rules_and_expiry(db_session):
+    cache = RuleCache(ttl=0, max_devices=100)
+    assert len(cache.get(db_session, "fct-001", "dev-none")) == 0
+    assert len(cache.get(db_session, "fct-001", "dev-none")) == 0
+    assert cache.stats()["expired"] == 1
+
+def test_factory_invalidation_drops_every_device(db_session):
+    cache = RuleCache(ttl=30, max_devices=100)
+    cache.get(db_session, "fct-001", "dev-001")
+    cache.get(db_session, "fct-001", "dev-002")
+    cache.get(db_session, "fct-002", "dev-003")
+    cache.invalidate("fct-001")
+    assert cache.stats()["devices"] == 1
+
+def test_process_event_does_not_query_rules_on_a_hit(db_session):
+    add_rule(db_session, "rc-3")
+    process_event({"factory_id": "fct-001", "device_id": "dev-001", "properties": {"temp": 50}})
+    # A cached rule keeps working after the session that loaded it is gone
+    process_event({"factory_id": "fct-001", "device_id": "dev-001", "properties": {"temp": 150}})
+    assert db_session.query(Alert).filter(Alert.rule_id == "rc-3").count() == 1
+    assert rule_cache.stats()["hits"] >= 1
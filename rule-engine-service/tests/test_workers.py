@@ -0,0 +1,68 @@
+import threading
+from app.services.workers import WorkerPool, worker_for
+
+def _events(devices, per_device):
+    return [{"factory_id": "f1", "device_id": d, "seq": i} for i in range(per_device) for d in devices]
+
+def test_device_events_stay_on_one_worker_in_order():
+    handled = [] # (thread name, event)
+    lock = threading.Lock()
+    def handler(events):
+        with lock:
+            handled.extend((threading.current_thread().name, e) for e in events)
+
+    pool = WorkerPool(workers=4, queue_size=100, batch_size=7, handler=handler)
+    pool.start()
+    events = _events([f"dev-{i}" for i in range(20)], 30)
+    for start in range(0, len(events), 50):
+        pool.dispatch(events[start:start + 50])
+    pool.stop()
+
+    assert len(handled) == len(events)
+    threads = {}
+    for name, event in handled:
+        threads.setdefault(event["device_id"], set()).add(name)
+    assert all(len(names) == 1 for names in threads.values())
+    for device in threads:
+        assert [e["seq"] for _, e in handled if e["device_id"] == device] == list(range(30))
+
+    stats = pool.stats()
+    assert stats["processed"] == len(events)
+    assert stats["queue_depth"] == 0
+    assert len(stats["per_worker"]) == 4
+    # 20 devices over 4 workers: more than one of them did some work
+    assert sum(1 for w in stats["per_worker"] if w["processed"]) > 1
+
+def test_stop_drains_queued_batches():
+    release = threading.Event()
+    handled = []
+    def handler(events):
+        release.wait(5)
+        handled.extend(events)
+
+    pool = WorkerPool(workers=2, queue_size=100, batch_size=1, handler=handler)
+    pool.start()
+    events = _events(["dev-1", "dev-2", "dev-3"], 10)
+    pool.dispatch(events)
+    release.set()
+    pool.stop()
+    assert sorted((e["device_id"], e["seq"]) for e in handled) == sorted((e["device_id"], e["seq"]) for e in events)
+
+def test_failed_batch_is_counted_and_the_worker_goes_on():
+    handled = []
+    def handler(events):
+        if any(e["seq"] == 0 for e in events):
+            raise RuntimeError("boom")
+        handled.extend(events)
+
+    pool = WorkerPool(workers=1, queue_size=10, batch_size=1, handler=handler)
+    pool.start()
+    for event in _events(["dev-1"], 3):
+        pool.dispatch([event])
+    pool.stop()
+    assert [e["seq"] for e in handled] == [1, 2]
+    assert pool.stats()["per_worker"][0]["errors"] == 1
+
+def test_worker_for_is_stable():
+    assert worker_for("f1", "dev-1", 8) == worker_for("f1", "dev-1", 8)
+    assert 0 <= worker_for("f1", "dev-1", 8) < 8
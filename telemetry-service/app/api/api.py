@@ -1,25 +1,180 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
 from app.core import influx
+from app.core.metrics import registry
 from app.services.mqtt_client import mqtt_app
+from app.services.async_ingest import async_ingest_engine, INGEST_ENGINES
+from app.services.shards import shard_supervisor
+from app.services.property_registry import property_registry
+from app.services.last_seen import last_seen_updater
+from app.services.latest_values import latest_values
+from app.services.rollups import rollup_aggregator
+from app.services.redis_service import rule_engine_queue
+from app.services import processor
+from app.services.decoder import payload_decoder
+from app.services.deadband import deadband_filter
+from app.services.device_registry import device_registry
+import logging
+
+logger = logging.getLogger("telemetry-api")
 
 api_router = APIRouter()
 
+def asyncio_engine() -> bool:
+    return settings.INGEST_ENGINE == "asyncio"
+
+def ingest_stats() -> dict:
+    return async_ingest_engine.stats() if asyncio_engine() else mqtt_app.pipeline.stats()
+
+def sharded() -> bool:
+    return settings.INGEST_PROCESSES > 1
+
+def component_stats(name: str, local) -> dict:
+    """
+    A component's stats(). With shard processes the components doing the
+    work live there, so their reports are combined instead of this process's
+    idle copies (used until the shards have reported).
+    """
+    return (sharded() and shard_supervisor.totals(name)) or local()
+
+def mqtt_connected() -> bool:
+    return async_ingest_engine.is_connected() if asyncio_engine() else mqtt_app.client.is_connected()
+
+def collect_component_metrics() -> list:
+    """Counters and gauges the components already keep in their stats()."""
+    ingest = ingest_stats()
+    decoder = component_stats("decoder", payload_decoder.stats)
+    cache = component_stats("property_cache", property_registry.stats)
+    writer = component_stats("influx_writer", influx.influx_service.writer.stats)
+    spool = component_stats("influx_spool", influx.influx_service.spool_stats)
+    publisher = component_stats("event_publisher", rule_engine_queue.publisher.stats)
+    last_seen = component_stats("last_seen", last_seen_updater.stats)
+    db_sessions = component_stats("processor", processor.get_stats)["db_sessions"]
+    return [
+        ("telemetry_mqtt_connected", "gauge", "1 if connected to the MQTT broker",
+         [({}, int(mqtt_connected()))]),
+        ("telemetry_queue_depth", "gauge", "Items waiting in each internal queue", [
+            ({"queue": "ingest"}, ingest["queue_depth"]),
+            ({"queue": "influx_buffer"}, writer["buffer_depth"]),
+            ({"queue": "influx_spool"}, spool.get("records", 0)),
+            ({"queue": "event_publisher"}, publisher["buffer_depth"]),
+        ]),
+        ("telemetry_ingest_messages_total", "counter", "MQTT messages by ingest outcome", [
+            ({"outcome": outcome}, ingest[outcome])
+            for outcome in ("enqueued", "processed", "dropped", "spilled", "errors")
+        ]),
+        ("telemetry_decode_errors_total", "counter", "Payloads that could not be decoded",
+         [({}, decoder["decode_errors"])]),
+        ("telemetry_invalid_fields_total", "counter", "Non-numeric fields dropped by validation",
+         [({}, decoder["invalid_fields"])]),
+        ("telemetry_property_cache_lookups_total", "counter", "Property registry cache lookups", [
+            ({"result": "hit"}, cache["hits"]),
+            ({"result": "miss"}, cache["misses"]),
+            ({"result": "shared_hit"}, cache["shared_hits"]),
+        ]),
+        ("telemetry_property_cache_hit_ratio", "gauge", "Property registry cache hit ratio",
+         [({}, cache["hit_ratio"])]),
+        ("telemetry_db_sessions_total", "counter", "MySQL sessions opened by the hot path",
+         [({}, db_sessions)]),
+        ("telemetry_influx_records_total", "counter", "InfluxDB records by outcome", [
+            ({"outcome": "written"}, writer["records_written"]),
+            ({"outcome": "dropped"}, writer["records_dropped"]),
+            ({"outcome": "spooled"}, writer["records_spooled"]),
+            ({"outcome": "rejected"}, writer["records_rejected"]),
+            ({"outcome": "replayed"}, spool.get("replayed_records", 0)),
+            ({"outcome": "replay_rejected"}, spool.get("replay_rejected", 0)),
+        ]),
+        ("telemetry_influx_flush_errors_total", "counter", "Failed InfluxDB batch writes",
+         [({}, writer["flush_errors"])]),
+        ("telemetry_events_total", "counter", "Rule Engine events by outcome", [
+            ({"outcome": "published"}, publisher["published"]),
+            ({"outcome": "dropped"}, publisher["dropped"]),
+        ]),
+        ("telemetry_last_seen_rows_updated_total", "counter", "devices.last_seen_at rows written",
+         [({}, last_seen["rows_updated"])]),
+    ]
+
+registry.register_collector(collect_component_metrics)
+# Stage timings and message counts recorded in the shard processes
+registry.register_source(lambda: shard_supervisor.metric_snapshots() if sharded() else [])
+
 @api_router.on_event("startup")
 async def startup_event():
+    if settings.INGEST_ENGINE not in INGEST_ENGINES:
+        raise ValueError(f"Unknown ingest engine: {settings.INGEST_ENGINE}")
+    if sharded():
+        if asyncio_engine():
+            raise ValueError("INGEST_PROCESSES > 1 requires INGEST_ENGINE=thread")
+        # Handoff to the shards blocks for INGEST_BLOCK_TIMEOUT_MS, then drops
+        if settings.INGEST_OVERFLOW_POLICY == "spill":
+            raise ValueError("INGEST_PROCESSES > 1 does not support INGEST_OVERFLOW_POLICY=spill")
+        if settings.INGEST_OVERFLOW_POLICY != "block":
+            logger.warning(f"INGEST_OVERFLOW_POLICY={settings.INGEST_OVERFLOW_POLICY} does not apply with "
+                           f"INGEST_PROCESSES > 1: full shards block, then drop after INGEST_BLOCK_TIMEOUT_MS")
+        # Shard processes run their own writers, caches and device snapshot;
+        # this process only receives from MQTT and hands messages off
+        mqtt_app.pipeline = shard_supervisor
+        mqtt_app.start()
+        return
+    # Start the batching Influx writer before messages start flowing
+    # (the asyncio engine flushes it from the event loop instead)
+    influx.influx_service.start(writer_thread=not asyncio_engine())
+    # Loads the device snapshot before the first message is processed
+    device_registry.start()
+    last_seen_updater.start()
+    latest_values.start()
+    rollup_aggregator.start()
+    if asyncio_engine():
+        await async_ingest_engine.start()
+        return
+    rule_engine_queue.start()
     # Start MQTT connection
     mqtt_app.start()
 
+@api_router.on_event("shutdown")
+async def shutdown_event():
+    # Stop MQTT and drain the ingest queue, then flush buffered state
+    if asyncio_engine():
+        await async_ingest_engine.stop()
+    else:
+        mqtt_app.stop()
+    device_registry.stop()
+    last_seen_updater.stop()
+    latest_values.stop()
+    # Writes the open windows, so before the Influx writer is closed
+    rollup_aggregator.stop()
+    if not asyncio_engine():
+        rule_engine_queue.stop()
+    influx.influx_service.close()
+
 @api_router.get("/health")
 def health_check():
     # In practice, verify MQTT connected (client.is_connected), Influx, MySQL
     status = {
         "status": "healthy", 
         "service": settings.SERVICE_NAME,
-        "mqtt_connected": mqtt_app.client.is_connected()
+        "mqtt_connected": mqtt_connected(),
+        "ingest": ingest_stats(),
+        "decoder": component_stats("decoder", payload_decoder.stats),
+        "processor": component_stats("processor", processor.get_stats),
+        "devices": component_stats("devices", device_registry.stats),
+        "property_cache": component_stats("property_cache", property_registry.stats),
+        "deadband": component_stats("deadband", deadband_filter.stats),
+        "last_seen": component_stats("last_seen", last_seen_updater.stats),
+        "latest_values": component_stats("latest_values", latest_values.stats),
+        "rollups": component_stats("rollups", rollup_aggregator.stats),
+        "influx_writer": component_stats("influx_writer", influx.influx_service.writer.stats),
+        "influx_spool": component_stats("influx_spool", influx.influx_service.spool_stats),
+        "event_publisher": component_stats("event_publisher", rule_engine_queue.publisher.stats)
     }
     return status
 
+@api_router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return registry.render()
+
 # No explicit telemetry endpoints LLD 3.4.4 GET /devices/{device_id}/telemetry
 # That endpoint is in API service, not Telemetry service.
 # Telemetry service just ingests and writes to DB.
@@ -6,11 +6,41 @@ class Settings(BaseSettings):
     MQTT_BROKER_PORT: int
     MQTT_ADMIN_USER: str
     MQTT_ADMIN_PASSWORD: str
+    MQTT_CLIENT_ID: str = "" # Defaults to <SERVICE_NAME>-<hostname>
+    MQTT_CLEAN_SESSION: bool = True
+    MQTT_SUBSCRIPTION_MODE: str = "plain" # plain | shared | partitioned
+    MQTT_SHARED_GROUP: str = "telemetry"
+    MQTT_FACTORY_PARTITIONS: str = "" # Comma separated factory ids (partitioned mode)
+
+    # Ingest pipeline (MQTT receive -> bounded queue -> workers)
+    INGEST_ENGINE: str = "thread" # thread | asyncio
+    INGEST_PROCESSES: int = 1 # >1 runs ingestion in that many shard processes (thread engine)
+    INGEST_HANDOFF_BATCH: int = 100 # Messages per handoff to a shard process
+    INGEST_HANDOFF_INTERVAL_MS: int = 5
+    INGEST_WORKERS: int = 4
+    INGEST_QUEUE_SIZE: int = 10000 # Total, split across workers
+    INGEST_OVERFLOW_POLICY: str = "block" # block | drop_oldest | spill
+    INGEST_BLOCK_TIMEOUT_MS: int = 1000
+    INGEST_SPILL_PATH: str = "/tmp/telemetry-service/ingest.spill" # One file per worker, suffixed .0, .1, ...
+    INGEST_SPILL_MAX_BYTES: int = 268435456 # 256MB, total, split across workers
+    PAYLOAD_DECODER: str = "auto" # auto | orjson | json
+    ASYNC_INGEST_SHARDS: int = 64 # asyncio engine: per-device ordered queues on the event loop
+    ASYNC_DB_WORKERS: int = 4 # asyncio engine: executor threads for MySQL work
+    ASYNC_MAX_IN_FLIGHT_WRITES: int = 32 # asyncio engine: concurrent InfluxDB write requests
     
     # InfluxDB
     INFLUX_URL: str
     INFLUX_ORG: str
     INFLUX_BUCKET: str
+    INFLUX_BATCH_SIZE: int = 100 # LLD 4.1: flush every 500ms or 100 points
+    INFLUX_FLUSH_INTERVAL_MS: int = 500
+    INFLUX_MAX_BUFFER: int = 10000
+    INFLUX_BACKPRESSURE_TIMEOUT_MS: int = 1000
+    INFLUX_GZIP_MIN_BYTES: int = 16384 # Gzip write bodies at least this large, 0 disables
+    INFLUX_SPOOL_DIR: str = "/tmp/telemetry-service/influx-spool" # Empty disables the disk spool
+    INFLUX_SPOOL_SEGMENT_BYTES: int = 16777216 # 16MB
+    INFLUX_SPOOL_MAX_BYTES: int = 1073741824 # 1GB
+    INFLUX_SPOOL_REPLAY_RATE: int = 20000 # Records/s replayed once InfluxDB recovers
     
     # MySQL
     MYSQL_HOST: str
@@ -20,6 +50,40 @@ class Settings(BaseSettings):
 
     # Redis
     REDIS_URL: str
+
+    # Rule engine event publishing (batched LPUSH to events_queue)
+    EVENT_BATCH_SIZE: int = 100
+    EVENT_FLUSH_INTERVAL_MS: int = 50
+    EVENT_MAX_BUFFER: int = 50000 # Held locally while Redis is down
+
+    # Latest value per (factory, device, property) in Redis hashes
+    LATEST_VALUES_ENABLED: bool = True
+    LATEST_VALUES_FLUSH_INTERVAL_MS: int = 1000
+
+    # Per-minute rollups (device_metrics_1m) computed at ingest
+    ROLLUPS_ENABLED: bool = True
+    ROLLUP_GRACE_SECONDS: float = 10.0 # Wait this long after a minute ends before writing it
+    ROLLUP_LATE_POLICY: str = "update" # update (re-write windows up to ROLLUP_LATE_RETENTION_SECONDS old), drop
+    ROLLUP_LATE_RETENTION_SECONDS: float = 3600.0
+    ROLLUP_MAX_FUTURE_SECONDS: float = 300.0 # Samples further ahead of the clock are left out
+
+    # Property registry cache
+    PROPERTY_CACHE_MAX_DEVICES: int = 50000
+    PROPERTY_CACHE_TTL_SECONDS: int = 300
+    PROPERTY_CACHE_REDIS: bool = False # Share discovered properties between replicas
+    PROPERTY_CACHE_REDIS_TTL_SECONDS: int = 3600
+
+    # Device snapshot: messages from unknown / inactive / maintenance devices
+    DEVICE_POLICY: str = "drop" # accept | drop | quarantine
+    DEVICE_REFRESH_INTERVAL_SECONDS: float = 30.0 # Incremental refresh by devices.updated_at
+    DEVICE_FULL_RELOAD_SECONDS: float = 3600.0
+
+    # Deadband filtering for properties with deadband_abs / deadband_pct set
+    DEADBAND_FILTER_ENABLED: bool = True
+    DEADBAND_MAX_PROPERTIES: int = 1000000 # Last forwarded values kept, least recently used evicted
+
+    # Debounced devices.last_seen_at updates
+    LAST_SEEN_FLUSH_INTERVAL_SECONDS: float = 5.0
     
     # Service
     SERVICE_NAME: str = "telemetry-service"
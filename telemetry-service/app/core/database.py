@@ -17,6 +17,33 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+class LazySession:
+    """
+    Defers opening a session until it is actually used, so hot paths that
+    usually have nothing to write do not check out a pooled connection.
+    """
+    def __init__(self, factory=None):
+        self._factory = factory or SessionLocal
+        self._session = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._factory()
+        return getattr(self._session, name)
+
+    def rollback(self):
+        if self._session is not None:
+            self._session.rollback()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
 def get_db():
     db = SessionLocal()
     try:
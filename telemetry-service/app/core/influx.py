@@ -1,49 +1,413 @@
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS, ASYNCHRONOUS
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
 from app.core.config import settings
+from app.core.line_protocol import LineProtocolEncoder
+from app.core.spool import SegmentSpool, SpoolDrainer
+import threading
+import logging
+import time
+
+logger = logging.getLogger("influx-writer")
+
+# InfluxDB recommends ~5000 lines per write request
+MAX_WRITE_BATCH = 5000
+
+# Client errors that are about the deployment (token, permissions, bucket),
+# not the data: retried like transport errors until it is fixed
+_RETRIED_CLIENT_ERRORS = {401, 403, 404, 429}
+
+def is_permanent(error: Exception) -> bool:
+    """
+    True if InfluxDB rejected a write for its content (400 parse error, 413,
+    422 field type conflict, ...). InfluxDB has already stored the valid
+    lines of such a batch (partial write), and sending it again cannot
+    succeed. Transport errors, 429 and 5xx are retried.
+    """
+    status = getattr(error, "status", None) if isinstance(error, ApiException) else None
+    return status is not None and 400 <= status < 500 and status not in _RETRIED_CLIENT_ERRORS
+
+class BatchWriter:
+    """
+    Buffers line-protocol chunks across messages and flushes them to InfluxDB
+    when `batch_size` records are pending or `flush_interval` has elapsed
+    (LLD 4.1: flush every 500ms or 100 points). Each chunk is the encoded
+    bytes for one message together with the number of records it holds.
+
+    The buffer is bounded: when InfluxDB slows down and the buffer fills up,
+    callers block for up to `backpressure_timeout` seconds before the records
+    are dropped and counted. With a `spool`, records that do not fit go to
+    the disk spool right away instead, and so do batches whose write failed.
+    Batches InfluxDB rejects for their content (`is_permanent`) are counted
+    as rejected and not retried, so they cannot hold up what follows.
+    """
+    def __init__(self, write_fn, batch_size: int, flush_interval: float,
+                 max_buffer: int, backpressure_timeout: float, retry_interval: float = 1.0,
+                 spool: SegmentSpool = None):
+        self._write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.backpressure_timeout = backpressure_timeout
+        self.retry_interval = retry_interval
+        self.spool = spool
+
+        self._buffer = [] # (bytes, record count)
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        # Runs spool writes elsewhere, set by the asyncio engine so disk I/O
+        # stays off the event loop: offload(fn, *args)
+        self.offload = None
+
+        # Counters
+        self.records_written = 0
+        self.records_dropped = 0
+        self.records_spooled = 0
+        self.records_rejected = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        """Records waiting for the next flush."""
+        return self._pending
+
+    def write(self, chunk: bytes, count: int) -> bool:
+        """
+        Queue `count` encoded records for the next flush. Returns False if they
+        were dropped because the buffer stayed full for longer than the
+        backpressure timeout (or the spool is full too).
+        """
+        if not count:
+            return True
+        with self._cond:
+            deadline = None
+            while self._pending + count > self.max_buffer:
+                if self.spool is not None:
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.backpressure_timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._cond.wait(remaining)
+            else:
+                self._buffer.append((chunk, count))
+                self._pending += count
+                if self._pending >= self.batch_size:
+                    self._cond.notify_all()
+                return True
+
+        if self.offload is not None and self.spool is not None:
+            self.offload(self._overflow, chunk, count)
+            return True
+        return self._overflow(chunk, count)
+
+    def _overflow(self, chunk: bytes, count: int) -> bool:
+        if not self._spool_chunks([(chunk, count)]):
+            return True
+        self.records_dropped += count
+        logger.warning(f"Influx buffer full, dropped {count} records")
+        return False
+
+    def flush(self) -> bool:
+        """Write everything currently buffered. Returns False if a write failed."""
+        with self._flush_lock:
+            batches = self.take_batches()
+            for i, (batch, records) in enumerate(batches):
+                if not self._write_batch(batch, records):
+                    self._requeue([chunk for chunks, _ in batches[i:] for chunk in chunks])
+                    return False
+            return True
+
+    def take_batches(self) -> list:
+        """
+        Empty the buffer into write batches of up to MAX_WRITE_BATCH records:
+        [(chunks, records), ...]. Used by `flush`, and by the asyncio engine,
+        which writes the batches itself and reports back through `_written`
+        or `_failed` and `_requeue`.
+        """
+        with self._cond:
+            pending, self._buffer = self._buffer, []
+            self._pending = 0
+            # Space was freed, wake up producers waiting on backpressure
+            self._cond.notify_all()
+
+        batches, start = [], 0
+        while start < len(pending):
+            end, records = start, 0
+            while end < len(pending) and (records == 0 or records + pending[end][1] <= MAX_WRITE_BATCH):
+                records += pending[end][1]
+                end += 1
+            batches.append((pending[start:end], records))
+            start = end
+        return batches
+
+    def close(self):
+        """Stop the flush thread and write out whatever is still buffered."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if not self.flush():
+            with self._cond:
+                pending, self._buffer = self._buffer, []
+                self._pending = 0
+            rejected = self._spool_chunks(pending)
+            if rejected:
+                self.records_dropped += sum(count for _, count in rejected)
+                logger.error("Final Influx flush failed, buffered records dropped")
+
+    def stats(self) -> dict:
+        return {
+            "buffer_depth": self._pending,
+            "records_written": self.records_written,
+            "records_dropped": self.records_dropped,
+            "records_spooled": self.records_spooled,
+            "records_rejected": self.records_rejected,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+        }
+
+    def _write_batch(self, batch: list, records: int) -> bool:
+        """Write one batch. Returns False if it failed and should be retried."""
+        started = time.perf_counter()
+        try:
+            self._write_fn(b"\n".join(chunk for chunk, _ in batch))
+        except Exception as e:
+            return not self._failed(records, e)
+        self._written(records, time.perf_counter() - started)
+        return True
+
+    def _written(self, records: int, latency: float):
+        self.flushes += 1
+        self.records_written += records
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def _failed(self, records: int, error: Exception) -> bool:
+        """Count a failed write. Returns True if the batch should be retried."""
+        if is_permanent(error):
+            self.records_rejected += records
+            logger.error(f"InfluxDB rejected a batch of {records} records, not retrying: {error}")
+            return False
+        self.flush_errors += 1
+        logger.error(f"Error writing batch of {records} records to InfluxDB: {error}")
+        return True
+
+    def _spool_chunks(self, chunks: list) -> list:
+        """Move chunks to the disk spool. Returns the ones that did not fit."""
+        if self.spool is None:
+            return chunks
+        rejected = []
+        for chunk, count in chunks:
+            if self.spool.append(chunk, count):
+                self.records_spooled += count
+            else:
+                rejected.append((chunk, count))
+        return rejected
+
+    def _requeue(self, chunks: list):
+        # Put unwritten chunks back in front so they are retried first;
+        # whatever no longer fits is dropped. With a spool they are spooled
+        # instead, so the buffer keeps accepting new writes.
+        if self.spool is not None:
+            if self.offload is not None:
+                self.offload(self._spool_failed, chunks)
+            else:
+                self._spool_failed(chunks)
+            return
+        with self._cond:
+            kept, space = [], self.max_buffer - self._pending
+            for chunk, count in chunks:
+                if count > space:
+                    self.records_dropped += count
+                    continue
+                kept.append((chunk, count))
+                space -= count
+                self._pending += count
+            self._buffer = kept + self._buffer
+
+    def _spool_failed(self, chunks: list):
+        rejected = self._spool_chunks(chunks)
+        if rejected:
+            self.records_dropped += sum(count for _, count in rejected)
+            logger.error("Influx spool is full, dropped records of a failed batch")
+
+    def _run(self):
+        retry_delay = self.retry_interval
+        while True:
+            with self._cond:
+                if self._running and self._pending < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if not self._running:
+                    return
+
+            if self.flush():
+                retry_delay = self.retry_interval
+            else:
+                # InfluxDB is failing, back off before the next attempt.
+                # Producers block (backpressure) while the buffer is full.
+                with self._cond:
+                    self._cond.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
 
 class InfluxService:
     def __init__(self):
-        self.client = InfluxDBClient(
+        self.client = self._create_client(enable_gzip=False)
+        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        # Large batches compress well; small ones are not worth the CPU
+        self.gzip_client = None
+        if settings.INFLUX_GZIP_MIN_BYTES > 0:
+            self.gzip_client = self._create_client(enable_gzip=True)
+            self.gzip_write_api = self.gzip_client.write_api(write_options=SYNCHRONOUS)
+        self.encoder = LineProtocolEncoder("device_metrics")
+        self.quarantine_encoder = LineProtocolEncoder("quarantined_metrics", max_devices=10000)
+        self.rollup_encoder = LineProtocolEncoder("device_metrics_1m")
+        # Records the writer cannot get into InfluxDB wait on disk and are
+        # replayed at a bounded rate once it recovers
+        self.spool = None
+        self.drainer = None
+        if settings.INFLUX_SPOOL_DIR:
+            self.spool = SegmentSpool(
+                settings.INFLUX_SPOOL_DIR,
+                segment_bytes=settings.INFLUX_SPOOL_SEGMENT_BYTES,
+                max_bytes=settings.INFLUX_SPOOL_MAX_BYTES,
+            )
+            self.drainer = SpoolDrainer(
+                self.spool,
+                self._write_records,
+                rate=settings.INFLUX_SPOOL_REPLAY_RATE,
+                batch_records=MAX_WRITE_BATCH,
+                is_permanent=is_permanent,
+            )
+        self.writer = BatchWriter(
+            self._write_records,
+            batch_size=settings.INFLUX_BATCH_SIZE,
+            flush_interval=settings.INFLUX_FLUSH_INTERVAL_MS / 1000,
+            max_buffer=settings.INFLUX_MAX_BUFFER,
+            backpressure_timeout=settings.INFLUX_BACKPRESSURE_TIMEOUT_MS / 1000,
+            spool=self.spool,
+        )
+        # Opened by the asyncio ingest engine, which flushes the writer itself
+        self.async_client = None
+        self.async_gzip_client = None
+
+    def _create_client(self, enable_gzip: bool) -> InfluxDBClient:
+        return InfluxDBClient(
             url=settings.INFLUX_URL,
-            token=f"{settings.INFLUX_ORG}:{settings.INFLUX_BUCKET}", 
-            org=settings.INFLUX_ORG
+            token=f"{settings.INFLUX_ORG}:{settings.INFLUX_BUCKET}",
+            org=settings.INFLUX_ORG,
+            enable_gzip=enable_gzip
         )
-        self.write_api = self.client.write_api(write_options=ASYNCHRONOUS)
 
-    def write_point(self, factory_id: str, device_id: str, data: dict, timestamp: str = None):
+    def start(self, writer_thread: bool = True):
+        if writer_thread:
+            self.writer.start()
+        if self.drainer:
+            self.drainer.start()
+
+    def open_async(self, max_connections: int):
+        """
+        Create the asyncio clients (INGEST_ENGINE=asyncio). Must be called
+        from the event loop; needs aiohttp, imported only here so the thread
+        engine runs without it.
+        """
+        from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+        options = dict(
+            url=settings.INFLUX_URL,
+            token=f"{settings.INFLUX_ORG}:{settings.INFLUX_BUCKET}",
+            org=settings.INFLUX_ORG,
+            connection_pool_maxsize=max_connections,
+        )
+        self.async_client = InfluxDBClientAsync(enable_gzip=False, **options)
+        self.async_write_api = self.async_client.write_api()
+        if settings.INFLUX_GZIP_MIN_BYTES > 0:
+            self.async_gzip_client = InfluxDBClientAsync(enable_gzip=True, **options)
+            self.async_gzip_write_api = self.async_gzip_client.write_api()
+
+    async def write_records_async(self, body: bytes):
+        write_api = self.async_write_api
+        if self.async_gzip_client and len(body) >= settings.INFLUX_GZIP_MIN_BYTES:
+            write_api = self.async_gzip_write_api
+        await write_api.write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=body)
+
+    async def close_async(self):
+        for client in (self.async_client, self.async_gzip_client):
+            if client is not None:
+                await client.close()
+        self.async_client = self.async_gzip_client = None
+
+    def close(self):
+        if self.drainer:
+            self.drainer.stop()
+        # Whatever the final flush cannot write is spooled for the next run
+        self.writer.close()
+        if self.spool:
+            self.spool.close()
+        self.client.close()
+        if self.gzip_client:
+            self.gzip_client.close()
+
+    def _write_records(self, body: bytes):
+        write_api = self.write_api
+        if self.gzip_client and len(body) >= settings.INFLUX_GZIP_MIN_BYTES:
+            write_api = self.gzip_write_api
+        write_api.write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=body)
+
+    def spool_stats(self) -> dict:
+        return self.drainer.stats() if self.drainer else {"enabled": False}
+
+    def write_point(self, factory_id: str, device_id: str, data: dict, timestamp=None):
         """
         Write multiple fields for a device.
+
+        HLD 5.2: Tags: factory_id, device_id, property_name. Field: value.
+        One point per property, so Flux queries can filter on property_name.
+        Points are encoded directly to line protocol and flushed in batches.
+        Without a device timestamp the ingest time is used, not the flush time.
+        """
+        chunk, count = self.encoder.encode(factory_id, device_id, data, timestamp)
+        if count:
+            self.writer.write(chunk, count)
+
+    def write_samples(self, factory_id: str, device_id: str, samples: list):
+        """Write a batch of [(timestamp, values), ...] for a device as one chunk."""
+        chunk, count = self.encoder.encode_samples(factory_id, device_id, samples)
+        if count:
+            self.writer.write(chunk, count)
+
+    def write_quarantine(self, factory_id: str, device_id: str, samples: list):
+        """
+        Samples from unknown or disabled devices go to a separate measurement
+        in the same bucket, still there to inspect or recover. Readers of
+        device data filter on _measurement == "device_metrics" to leave them out.
         """
-        p = Point("device_metrics") \
-            .tag("factory_id", factory_id) \
-            .tag("device_id", device_id)
-        
-        for k, v in data.items():
-            if isinstance(v, (int, float, bool)):
-                p = p.field(k, v)
-                # Also add property_name tag as per HLD 5.2? 
-                # HLD 5.2 says: Tags: factory_id, device_id, property_name. Field: value.
-                # If we follow HLD strictly, we need one point per property?
-                # "Tags: - factory_id - device_id - property_name. Field: - value"
-                # This approach (one point per property) allows filtering by property_name easily in Flux.
-                # If we put all properties as fields in one measurement, filtering by property becomes `r._field == "temp"`.
-                # HLD explicitly says "Tag: property_name". So we should write one point per property.
-                pass
-
-        points = []
-        for k, v in data.items():
-            if isinstance(v, (int, float, bool)):
-                point = Point("device_metrics") \
-                    .tag("factory_id", factory_id) \
-                    .tag("device_id", device_id) \
-                    .tag("property_name", k) \
-                    .field("value", v)
-                if timestamp:
-                    point = point.time(timestamp) # standard datetime or localized
-                points.append(point)
-        
-        if points:
-            self.write_api.write(bucket=settings.INFLUX_BUCKET, org=settings.INFLUX_ORG, record=points)
+        chunk, count = self.quarantine_encoder.encode_samples(factory_id, device_id, samples)
+        if count:
+            self.writer.write(chunk, count)
+
+    def write_rollups(self, factory_id: str, device_id: str, rows: list):
+        """Per-minute aggregates, [(window start, property, {field: value}), ...]."""
+        chunk, count = self.rollup_encoder.encode_fields(factory_id, device_id, rows)
+        if count:
+            self.writer.write(chunk, count)
 
 influx_service = InfluxService()
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from functools import lru_cache
+import calendar
+import datetime
+import math
+import threading
+import time
+
+_TAG_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+
+@lru_cache(maxsize=65536)
+def escape_tag(value: str) -> str:
+    """Escape a tag key or value. Property names repeat constantly, so results are cached."""
+    return value.translate(_TAG_ESCAPES)
+
+def valid_name(name) -> bool:
+    """
+    Whether `name` can be written as a tag key or value. Empty tags cannot be
+    encoded, and a trailing backslash would escape the separator after it.
+    """
+    return type(name) is str and name != "" and name[-1] != "\\"
+
+def format_field(value) -> str:
+    """
+    Booleans as booleans, every other number as a float: a property sent as
+    20 and then 20.5 must not change the field type, which InfluxDB rejects.
+    """
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return repr(float(value))
+
+def to_nanoseconds(timestamp) -> int:
+    """Epoch nanoseconds for a datetime (naive means UTC), or now if None."""
+    if timestamp is None:
+        return time.time_ns()
+    if isinstance(timestamp, int):
+        return timestamp
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc)
+    return calendar.timegm(timestamp.timetuple()) * 1_000_000_000 + timestamp.microsecond * 1000
+
+class LineProtocolEncoder:
+    """
+    Encodes device samples straight to InfluxDB line protocol.
+
+    HLD 5.2 layout: one point per property with tags factory_id, device_id,
+    property_name and a single `value` field. The escaped
+    `measurement,device_id=...,factory_id=...,property_name=` prefix is built
+    once per device and kept in a bounded cache. Tags are in key order, which
+    is what InfluxDB sorts them to anyway.
+    """
+    def __init__(self, measurement: str = "device_metrics", max_devices: int = 100000):
+        self.measurement = measurement.translate(_MEASUREMENT_ESCAPES)
+        self.max_devices = max_devices
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefix(self, factory_id: str, device_id: str) -> str:
+        key = (factory_id, device_id)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = (f"{self.measurement},device_id={escape_tag(device_id)},"
+                      f"factory_id={escape_tag(factory_id)},property_name=")
+            with self._lock:
+                self._prefixes[key] = prefix
+                if len(self._prefixes) > self.max_devices:
+                    self._prefixes.popitem(last=False)
+        return prefix
+
+    def encode(self, factory_id: str, device_id: str, data: dict, timestamp=None) -> tuple:
+        """
+        Encode all properties of one message. Returns (line protocol bytes,
+        number of points). Non-finite floats cannot be stored and are skipped,
+        as are names that are not `valid_name` (the decoder drops them first).
+        """
+        prefix = self.prefix(factory_id, device_id)
+        ts = to_nanoseconds(timestamp)
+        lines = []
+        for k, v in data.items():
+            if (type(v) is float and not math.isfinite(v)) or not valid_name(k):
+                continue
+            lines.append(f"{prefix}{escape_tag(k)} value={format_field(v)} {ts}")
+        return "\n".join(lines).encode(), len(lines)
+
+    def encode_samples(self, factory_id: str, device_id: str, samples: list) -> tuple:
+        """Encode [(timestamp, values), ...] for one device in one pass."""
+        prefix = self.prefix(factory_id, device_id)
+        lines = []
+        for timestamp, data in samples:
+            ts = to_nanoseconds(timestamp)
+            for k, v in data.items():
+                if (type(v) is float and not math.isfinite(v)) or not valid_name(k):
+                    continue
+                lines.append(f"{prefix}{escape_tag(k)} value={format_field(v)} {ts}")
+        return "\n".join(lines).encode(), len(lines)
+
+    def encode_fields(self, factory_id: str, device_id: str, rows: list) -> tuple:
+        """
+        Encode points with several fields, [(timestamp, property, {field: value}), ...],
+        as written for rollups. Non-finite floats are skipped as above.
+        """
+        prefix = self.prefix(factory_id, device_id)
+        lines = []
+        for timestamp, name, fields in rows:
+            encoded = ",".join(
+                f"{escape_tag(k)}={format_field(v)}" for k, v in fields.items()
+                if type(v) is not float or math.isfinite(v)
+            )
+            if encoded and valid_name(name):
+                lines.append(f"{prefix}{escape_tag(name)} {encoded} {to_nanoseconds(timestamp)}")
+        return "\n".join(lines).encode(), len(lines)
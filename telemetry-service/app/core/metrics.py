@@ -0,0 +1,207 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import math
+import threading
+
+# Seconds; the hot-path stages are mostly in the 1us - 10ms range
+DEFAULT_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(str(v))}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def merge(self, state):
+        self.value += state
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return list(self.counts), self.sum
+
+    def merge(self, state):
+        counts, total = state
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Child for one label combination. Look it up once and keep it for hot
+        paths; creating a child takes a lock, using it does not.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A zeroed child for a new label combination."""
+
+    @abstractmethod
+    def _render_child(self, values: tuple, child) -> list:
+        """Exposition lines of one child."""
+
+    def snapshot(self) -> dict:
+        return {values: child.snapshot() for values, child in list(self._children.items())}
+
+    def render(self, snapshots: list = ()) -> list:
+        """Render this process's values plus any snapshot() taken in other processes."""
+        children = dict(self._children)
+        if snapshots:
+            merged = {}
+            for snapshot in (self.snapshot(), *snapshots):
+                for values, state in snapshot.items():
+                    if values not in merged:
+                        merged[values] = self._new_child()
+                    merged[values].merge(state)
+            children = merged
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), list(child.counts)):
+            cumulative += count
+            le = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    """
+    In-process metrics rendered in the Prometheus text format.
+
+    Counters and histograms are updated without locks: each observation is a
+    couple of list/attribute updates under the GIL (well under a microsecond),
+    at the cost of rare lost increments when two threads race on the same
+    child. Values that components already track in their `stats()` are
+    exported through collectors at scrape time instead of being duplicated.
+    Metrics of other processes (ingest shards) are merged in through sources.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._sources = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        `collector()` returns [(name, type, help, [(labels dict, value), ...]), ...]
+        and is called on every scrape.
+        """
+        self._collectors.append(collector)
+
+    def register_source(self, source):
+        """`source()` returns snapshot()s taken in other processes, added in on every scrape."""
+        self._sources.append(source)
+
+    def snapshot(self) -> dict:
+        """Metric values by name, to be sent to the process that serves /metrics."""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self) -> str:
+        snapshots = [snapshot for source in self._sources for snapshot in source()]
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render([s.get(metric.name, {}) for s in snapshots]))
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "telemetry_stage_seconds", "Time spent in each message processing stage", ("stage",))
+# Labelled by factory only for factories in the device snapshot; topics
+# can carry any factory id, and every new label value is a new series
+MESSAGES = registry.counter(
+    "telemetry_messages_total", "Valid telemetry samples processed", ("factory_id",))
+OTHER_FACTORY = "other"
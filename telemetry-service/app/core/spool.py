@@ -0,0 +1,312 @@
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+logger = logging.getLogger("influx-spool")
+
+_SEGMENT_NAME = re.compile(r"^spool-(\d{12})\.seg$")
+
+class SegmentSpool:
+    """
+    Local write-ahead spool for encoded line protocol.
+
+    Chunks are appended to the active segment file, framed as
+    (length, record count, bytes). A segment is sealed once it reaches
+    `segment_bytes` (or when the reader catches up with it); sealed segments
+    are read back through a read-only mmap and deleted once fully replayed.
+    Segments left from a previous run are replayed after a restart. The
+    total size is capped at `max_bytes`: appends beyond it are refused.
+
+    Replay is at-least-once: a segment that was partly replayed when the
+    process stopped is replayed again from the start. Rewriting the same
+    series and timestamp in InfluxDB overwrites the point, so this is safe.
+    """
+    FRAME = struct.Struct(">II")
+
+    def __init__(self, directory: str, segment_bytes: int, max_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._sealed = [] # [seq, bytes, records] oldest first
+        self._size = 0
+        self._records = 0
+        for name in sorted(os.listdir(directory)):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                seq = int(match.group(1))
+                size, records = self._scan(self._path(seq))
+                if records:
+                    self._sealed.append([seq, size, records])
+                    self._size += size
+                    self._records += records
+                else:
+                    os.remove(self._path(seq))
+        self._next_seq = self._sealed[-1][0] + 1 if self._sealed else 0
+
+        # Active (writable) segment, opened on the first append
+        self._active = None
+        self._active_seq = None
+        self._active_size = 0
+        self._active_records = 0
+
+        # Reader state for the oldest sealed segment
+        self._map = None
+        self._map_seq = None
+        self._read_offset = 0
+
+        # Counters
+        self.appended_records = 0
+        self.rejected_records = 0
+        self.segments_written = 0
+
+    def __len__(self):
+        """Records waiting to be replayed."""
+        return self._records
+
+    def size_bytes(self) -> int:
+        return self._size
+
+    def append(self, chunk: bytes, count: int) -> bool:
+        frame_size = self.FRAME.size + len(chunk)
+        with self._lock:
+            if self._size + frame_size > self.max_bytes:
+                self.rejected_records += count
+                return False
+            if self._active is None:
+                self._open_active()
+            self._active.write(self.FRAME.pack(len(chunk), count))
+            self._active.write(chunk)
+            self._active.flush()
+            self._active_size += frame_size
+            self._active_records += count
+            self._size += frame_size
+            self._records += count
+            self.appended_records += count
+            if self._active_size >= self.segment_bytes:
+                self._seal_active()
+        return True
+
+    def read(self, max_records: int) -> tuple:
+        """
+        Next chunks to replay from the oldest segment, without consuming them:
+        ([(chunk, count), ...], records, position). Pass `position` to
+        `commit` once the chunks are written.
+        """
+        with self._lock:
+            if self._map is None and not self._open_oldest():
+                return [], 0, None
+            mm, seq, offset = self._map, self._map_seq, self._read_offset
+
+        chunks, records = [], 0
+        while offset + self.FRAME.size <= len(mm) and (not records or records < max_records):
+            length, count = self.FRAME.unpack_from(mm, offset)
+            end = offset + self.FRAME.size + length
+            if end > len(mm): # Torn write at the end of a crashed segment
+                offset = len(mm)
+                break
+            chunks.append((mm[offset + self.FRAME.size:end], count))
+            records += count
+            offset = end
+        if offset + self.FRAME.size > len(mm):
+            offset = len(mm) # Whatever is left is too short to be a frame
+        return chunks, records, (seq, offset)
+
+    def commit(self, position: tuple, records: int):
+        seq, offset = position
+        with self._lock:
+            if seq != self._map_seq:
+                return
+            segment = self._sealed[0]
+            consumed = offset - self._read_offset
+            self._read_offset = offset
+            segment[1] -= consumed
+            segment[2] -= records
+            self._size -= consumed
+            self._records -= records
+            if offset >= len(self._map):
+                self._drop_oldest()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+                self._map_seq = None
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    def stats(self) -> dict:
+        return {
+            "records": self._records,
+            "bytes": self._size,
+            "segments": len(self._sealed) + (1 if self._active is not None else 0),
+            "appended_records": self.appended_records,
+            "rejected_records": self.rejected_records,
+        }
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"spool-{seq:012d}.seg")
+
+    def _scan(self, path: str) -> tuple:
+        # (bytes, records) of a segment found on disk, stopping at a torn frame
+        size, records, offset = os.path.getsize(path), 0, 0
+        if not size:
+            return 0, 0
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset + self.FRAME.size <= size:
+                length, count = self.FRAME.unpack_from(mm, offset)
+                if offset + self.FRAME.size + length > size:
+                    break
+                offset += self.FRAME.size + length
+                records += count
+        return size, records
+
+    def _open_active(self):
+        self._active_seq = self._next_seq
+        self._next_seq += 1
+        self._active = open(self._path(self._active_seq), "ab")
+        self._active_size = 0
+        self._active_records = 0
+
+    def _seal_active(self):
+        self._active.close()
+        self._sealed.append([self._active_seq, self._active_size, self._active_records])
+        self._active = None
+        self._active_seq = None
+        self.segments_written += 1
+
+    def _open_oldest(self) -> bool:
+        # The reader never maps the segment still being written; if that is
+        # all there is, seal it so it can be replayed.
+        if not self._sealed and self._active is not None and self._active_records:
+            self._seal_active()
+        if not self._sealed:
+            return False
+        seq = self._sealed[0][0]
+        with open(self._path(seq), "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map_seq = seq
+        self._read_offset = 0
+        return True
+
+    def _drop_oldest(self):
+        seq, size, records = self._sealed.pop(0)
+        # Leftovers of a torn frame are not records, just bytes
+        self._size -= size
+        self._records -= records
+        self._map.close()
+        self._map = None
+        self._map_seq = None
+        self._read_offset = 0
+        try:
+            os.remove(self._path(seq))
+        except OSError as e:
+            logger.error(f"Could not remove replayed spool segment {seq}: {e}")
+
+
+class SpoolDrainer:
+    """
+    Replays a SegmentSpool into `write_fn` at no more than `rate` records per
+    second, in batches of up to `batch_records`. Failed writes leave the data
+    in the spool and are retried with exponential backoff, except those
+    `is_permanent` says can never succeed: that batch is committed and
+    counted as rejected, so the rest of the spool keeps draining.
+    """
+    def __init__(self, spool: SegmentSpool, write_fn, rate: float, batch_records: int = 5000,
+                 retry_interval: float = 1.0, idle_interval: float = 1.0, is_permanent=None):
+        self.spool = spool
+        self._write_fn = write_fn
+        self._is_permanent = is_permanent
+        self.rate = rate
+        self.batch_records = batch_records
+        self.retry_interval = retry_interval
+        self.idle_interval = idle_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.replayed_records = 0
+        self.replay_batches = 0
+        self.replay_errors = 0
+        self.replay_rejected = 0
+        self.replay_rate = 0.0 # Records/s, moving average while draining
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="influx-spool-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def drain_once(self) -> int:
+        """
+        Replay one batch. Returns the records taken off the spool, written or
+        skipped as rejected (0 if it was empty), or -1 if the write failed.
+        """
+        chunks, records, position = self.spool.read(self.batch_records)
+        if not chunks:
+            if position is not None: # Only a torn frame was left
+                self.spool.commit(position, 0)
+            return 0
+        started = time.perf_counter()
+        try:
+            self._write_fn(b"\n".join(chunk for chunk, _ in chunks))
+        except Exception as e:
+            if self._is_permanent is not None and self._is_permanent(e):
+                self.spool.commit(position, records)
+                self.replay_rejected += records
+                logger.error(f"InfluxDB rejected {records} spooled records, skipping them: {e}")
+                return records
+            self.replay_errors += 1
+            logger.error(f"Error replaying {records} spooled records to InfluxDB: {e}")
+            return -1
+        self.spool.commit(position, records)
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        self.replay_batches += 1
+        self.replayed_records += records
+        # Pace to the configured rate
+        wait = records / self.rate - elapsed if self.rate else 0.0
+        if wait > 0:
+            self._stop.wait(wait)
+        achieved = records / (elapsed + max(wait, 0.0))
+        self.replay_rate = achieved if not self.replay_rate else 0.8 * self.replay_rate + 0.2 * achieved
+        return records
+
+    def stats(self) -> dict:
+        pending = len(self.spool)
+        return {
+            **self.spool.stats(),
+            "replayed_records": self.replayed_records,
+            "replay_batches": self.replay_batches,
+            "replay_errors": self.replay_errors,
+            "replay_rejected": self.replay_rejected,
+            "replay_rate": round(self.replay_rate, 1),
+            "estimated_drain_seconds": round(pending / self.replay_rate, 1) if pending and self.replay_rate else None,
+        }
+
+    def _run(self):
+        retry_delay = self.retry_interval
+        while not self._stop.is_set():
+            written = self.drain_once()
+            if written > 0:
+                retry_delay = self.retry_interval
+            elif written == 0:
+                self._stop.wait(self.idle_interval)
+            else:
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
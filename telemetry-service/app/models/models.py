@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Enum, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, String, DateTime, Enum, Float, Integer, ForeignKey, UniqueConstraint
 from datetime import datetime
 from app.core.database import Base
 import uuid
@@ -19,6 +19,7 @@ class Device(Base):
     factory_id = Column(String(36), nullable=False)
     status = Column(Enum("active", "inactive", "maintenance"), nullable=False, default="active")
     last_seen_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class DeviceProperty(Base):
     __tablename__ = "device_properties"
@@ -30,5 +31,9 @@ class DeviceProperty(Base):
     data_type = Column(Enum("float", "integer", "boolean", "string"), nullable=False, default="float")
     first_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optional change-only filtering (see services/deadband.py); NULL disables it
+    deadband_abs = Column(Float, nullable=True)
+    deadband_pct = Column(Float, nullable=True)
+    max_silence_seconds = Column(Integer, nullable=True)
     
     __table_args__ = (UniqueConstraint('device_id', 'property_name', name='uq_dp_device_property'),)
@@ -0,0 +1,476 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.influx import influx_service
+from app.services.ingest import StageStats, shard_for
+from app.services.mqtt_client import parse_topic, decode_payload, subscription_topics, default_client_id
+from app.services.processor import process_message_async, process_batch_async
+from app.services.redis_service import rule_engine_queue
+import paho.mqtt.client as mqtt
+import redis
+import redis.asyncio as aioredis
+import asyncio
+import threading
+import logging
+import time
+
+logger = logging.getLogger("async-ingest")
+
+INGEST_ENGINES = ("thread", "asyncio")
+
+_STOP = object()
+
+class AsyncInfluxFlusher:
+    """
+    Flushes a BatchWriter from the event loop, in place of its flush thread,
+    with up to `max_in_flight` write requests at once. Failed batches go back
+    through the writer: to the disk spool, or in front of its buffer.
+    """
+    def __init__(self, writer, write_fn, max_in_flight: int, retry_interval: float = 1.0):
+        self.writer = writer
+        self._write_fn = write_fn
+        self.max_in_flight = max_in_flight
+        self.retry_interval = retry_interval
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._tasks = set()
+        self._failing = False
+
+        # Counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def kick(self):
+        """Flush now if a full batch is buffered."""
+        if len(self.writer) >= self.writer.batch_size:
+            self._wakeup.set()
+
+    async def wait_for_space(self, timeout: float):
+        """Backpressure: wait up to `timeout` seconds while the writer's buffer is full."""
+        if len(self.writer) < self.writer.max_buffer:
+            return
+        self._space.clear()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._space.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        retry_delay = self.retry_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.writer.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._failing:
+                # InfluxDB is failing, back off before the next attempt
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+            else:
+                retry_delay = self.retry_interval
+
+    async def flush(self):
+        """Start a write for every buffered batch, waiting only for free slots."""
+        batches = self.writer.take_batches()
+        self._space.set()
+        for batch, records in batches:
+            await self._slots.acquire()
+            task = asyncio.create_task(self._write(batch, records))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Write out what is buffered and wait for every write in flight."""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _write(self, batch: list, records: int):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            await self._write_fn(b"\n".join(chunk for chunk, _ in batch))
+        except Exception as e:
+            # A rejected batch means InfluxDB is up, only retried ones count as failing
+            self._failing = self.writer._failed(records, e)
+            if self._failing:
+                self.writer._requeue(batch)
+        else:
+            self._failing = False
+            self.writer._written(records, time.perf_counter() - started)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+
+class AsyncEventFlusher:
+    """
+    Pushes a BatchPublisher's buffer with redis.asyncio, in place of its
+    flush thread. One pipeline at a time, so events keep their order.
+    """
+    def __init__(self, publisher, client_factory, retry_interval: float = 1.0):
+        self.publisher = publisher
+        self._client_factory = client_factory
+        self._client = None
+        self.retry_interval = retry_interval
+        self._wakeup = asyncio.Event()
+
+    def kick(self):
+        if len(self.publisher) >= self.publisher.batch_size:
+            self._wakeup.set()
+
+    async def run(self):
+        retry_delay = self.retry_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.publisher.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                retry_delay = self.retry_interval
+            else:
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
+    async def flush(self) -> bool:
+        pending = self.publisher.take()
+        if not pending:
+            return True
+
+        started = time.perf_counter()
+        batch_size = self.publisher.batch_size
+        try:
+            if self._client is None:
+                self._client = self._client_factory()
+                self.publisher.connects += 1
+            pipe = self._client.pipeline(transaction=False)
+            for i in range(0, len(pending), batch_size):
+                pipe.lpush(self.publisher.key, *pending[i:i + batch_size])
+            await pipe.execute()
+        except redis.RedisError as e:
+            self._client = None
+            self.publisher._failed(pending, e)
+            return False
+        self.publisher._pushed(len(pending), time.perf_counter() - started)
+        return True
+
+    async def close(self):
+        if not await self.flush() and len(self.publisher):
+            logger.error(f"Final flush to {self.publisher.key} failed, {len(self.publisher)} messages lost")
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AsyncIngestEngine:
+    """
+    Asyncio ingestion (INGEST_ENGINE=asyncio). Runs on the app's event loop
+    in place of paho's network thread, the ingest worker threads and the
+    Influx and Redis flush threads:
+
+    - paho is driven from the loop through its socket callbacks
+      (add_reader / add_writer) instead of loop_start().
+    - Messages go to one of `shards` bounded queues by device (shard_for, as
+      in the thread engine), so each device is processed in order. While a
+      queue is full, reading from the broker socket is paused, so the
+      backlog waits in TCP and the broker rather than in memory.
+    - Messages are handled by process_message_async / process_batch_async:
+      MySQL work (discovery on a cache miss) runs on a small executor,
+      everything else on the loop.
+    - The Influx buffer is written with the async client, up to
+      `max_in_flight_writes` requests at once; events go out via redis.asyncio.
+
+    The device snapshot, last_seen updates and spool replay keep their threads.
+    """
+    def __init__(self, shards: int, queue_size: int, db_workers: int, max_in_flight_writes: int,
+                 backpressure_timeout: float = 1.0, client=None, influx_write=None, redis_client_factory=None):
+        self.shards = shards
+        self.queue_size = queue_size
+        self.db_workers = db_workers
+        self.max_in_flight_writes = max_in_flight_writes
+        self.backpressure_timeout = backpressure_timeout
+        self.client = client
+        self._influx_write = influx_write
+        self._redis_client_factory = redis_client_factory or _redis_client
+
+        self._loop = None
+        self._executor = None
+        self._queues = []
+        self._overflow = [] # (queue, item) received while reading was paused
+        self._paused = False
+        self._socket = None
+        self._misc_task = None
+        self._connection_task = None
+        self._disconnected = None
+        self._tasks = []
+        self.influx = None
+        self.events = None
+
+        # Counters
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self.read_pauses = 0
+        self.stages = {
+            "queue_wait": StageStats(),
+            "process": StageStats(),
+        }
+
+    def is_connected(self) -> bool:
+        return self.client is not None and self.client.is_connected()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._executor = ThreadPoolExecutor(self.db_workers, thread_name_prefix="ingest-db")
+        if self._influx_write is None:
+            influx_service.open_async(self.max_in_flight_writes)
+            self._influx_write = influx_service.write_records_async
+        self.influx = AsyncInfluxFlusher(influx_service.writer, self._influx_write, self.max_in_flight_writes)
+        # Spool writes (buffer overflow, failed batches) are disk I/O
+        self.influx.writer.offload = self._offload
+        self.events = AsyncEventFlusher(rule_engine_queue.publisher, self._redis_client_factory)
+
+        per_shard = max(1, self.queue_size // self.shards)
+        self._queues = [asyncio.Queue(per_shard) for _ in range(self.shards)]
+        self._tasks = [asyncio.create_task(self._work(q)) for q in self._queues]
+        self._tasks += [asyncio.create_task(self.influx.run()), asyncio.create_task(self.events.run())]
+
+        if self.client is None:
+            self.client = self._create_client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        # connect() runs in a thread (see _run_connection) and paho calls
+        # these from there while connecting
+        self.client.on_disconnect = self._on_loop(self.on_disconnect)
+        self.client.on_socket_open = self._on_loop(self._on_socket_open)
+        self.client.on_socket_close = self._on_loop(self._on_socket_close)
+        self.client.on_socket_register_write = self._on_loop(self._on_socket_register_write)
+        self.client.on_socket_unregister_write = self._on_loop(self._on_socket_unregister_write)
+        self._disconnected = asyncio.Event()
+        self._connection_task = asyncio.create_task(self._run_connection())
+
+    async def stop(self):
+        """Stop receiving, process what is queued, then flush InfluxDB and Redis."""
+        if not self._tasks:
+            return
+        self._connection_task.cancel()
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            logger.error(f"Error stopping MQTT client: {e}")
+
+        # Queued behind anything still waiting for room, so it is processed first
+        self._overflow.extend((q, _STOP) for q in self._queues)
+        self._resume_reading()
+        workers, flushers = self._tasks[:self.shards], self._tasks[self.shards:]
+        await asyncio.gather(*workers)
+        for task in flushers:
+            task.cancel()
+        await asyncio.gather(*flushers, return_exceptions=True)
+
+        await self.influx.close()
+        await self.events.close()
+        if self._influx_write == influx_service.write_records_async:
+            await influx_service.close_async()
+        self.influx.writer.offload = None
+        self._executor.shutdown(wait=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "engine": "asyncio",
+            "queue_depth": sum(q.qsize() for q in self._queues) + len(self._overflow),
+            "queue_capacity": sum(q.maxsize for q in self._queues),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": 0, # Reading pauses instead
+            "spilled": 0,
+            "errors": self.errors,
+            "read_paused": self._paused,
+            "read_pauses": self.read_pauses,
+            "influx_writes_in_flight": self.influx.in_flight if self.influx else 0,
+            "influx_writes_peak": self.influx.peak_in_flight if self.influx else 0,
+            "stages": {name: s.snapshot() for name, s in self.stages.items()},
+        }
+
+    # MQTT callbacks, called by paho from the event loop
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            topics = self._topics()
+            logger.info(f"Connected to EMQX Broker as {default_client_id()}, subscribing to {topics}")
+            client.subscribe([(topic, 1) for topic in topics])
+        else:
+            logger.error(f"Failed to connect, return code {rc}")
+
+    def on_message(self, client, userdata, msg):
+        try:
+            parsed = parse_topic(msg.topic, getattr(msg, "properties", None))
+            if not parsed:
+                logger.warning(f"Invalid topic format: {msg.topic}")
+                return
+            factory_id, device_id, fmt = parsed
+            q = self._queues[shard_for(factory_id, device_id, self.shards)]
+            item = (factory_id, device_id, msg.payload, fmt, time.monotonic())
+            self.enqueued += 1
+            if self._overflow:
+                # Keep arrival order behind what is already waiting
+                self._overflow.append((q, item))
+                return
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                self._overflow.append((q, item))
+                self._pause_reading()
+        except Exception as e:
+            logger.error(f"Error enqueueing message: {e}")
+
+    def on_disconnect(self, client, userdata, rc):
+        logger.warning(f"Disconnected with result code {rc}")
+        if self._disconnected is not None:
+            self._disconnected.set()
+
+    # Network I/O on the event loop (paho's socket callbacks)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._socket = sock
+        if not self._paused:
+            self._loop.add_reader(sock, client.loop_read)
+        self._misc_task = self._loop.create_task(self._run_misc())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        self._socket = None
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    def _on_loop(self, callback):
+        """Wrap a paho callback so it runs on the event loop whichever thread calls it."""
+        def call(*args):
+            if threading.get_ident() == self._loop_thread:
+                callback(*args)
+            else:
+                self._loop.call_soon_threadsafe(callback, *args)
+        return call
+
+    def _offload(self, fn, *args):
+        # Called from the loop and from other threads (rollups); submit is thread-safe
+        self._executor.submit(fn, *args).add_done_callback(_log_offload_error)
+
+    def _pause_reading(self):
+        if self._paused:
+            return
+        self._paused = True
+        self.read_pauses += 1
+        if self._socket is not None:
+            self._loop.remove_reader(self._socket)
+
+    def _resume_reading(self):
+        # Called by workers as queues drain: move waiting messages in, in
+        # order, and read from the broker again once all of them fit.
+        while self._overflow:
+            q, item = self._overflow[0]
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                return
+            self._overflow.pop(0)
+        if self._paused:
+            self._paused = False
+            if self._socket is not None:
+                self._loop.add_reader(self._socket, self.client.loop_read)
+
+    async def _run_misc(self):
+        # Keepalive pings and timeouts
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    async def _run_connection(self):
+        retry_delay = 1.0
+        while True:
+            self._disconnected.clear()
+            try:
+                # DNS lookup and TCP connect block, so not on the loop
+                await self._loop.run_in_executor(
+                    None, self.client.connect, settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT, 60)
+                retry_delay = 1.0
+                await self._disconnected.wait()
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to connect to MQTT broker: {e}")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30.0)
+
+    # Processing
+
+    async def _work(self, q: asyncio.Queue):
+        while True:
+            item = await q.get()
+            if self._overflow:
+                self._resume_reading()
+            if item is _STOP:
+                return
+            factory_id, device_id, raw, fmt, enqueued_at = item
+            self.stages["queue_wait"].observe(time.monotonic() - enqueued_at)
+            await self.influx.wait_for_space(self.backpressure_timeout)
+            started = time.perf_counter()
+            try:
+                await self.handle_payload(factory_id, device_id, raw, fmt)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error processing message for {device_id}: {e}")
+            finally:
+                self.stages["process"].observe(time.perf_counter() - started)
+            self.influx.kick()
+            self.events.kick()
+
+    async def handle_payload(self, factory_id: str, device_id: str, raw: bytes, fmt: str = "json"):
+        decoded = decode_payload(device_id, raw, fmt)
+        if decoded is None:
+            return
+        payload, samples = decoded
+        if samples is None:
+            await process_message_async(factory_id, device_id, payload, executor=self._executor)
+        else:
+            await process_batch_async(factory_id, device_id, samples, executor=self._executor)
+
+    def _topics(self) -> list:
+        partitions = [f.strip() for f in settings.MQTT_FACTORY_PARTITIONS.split(",") if f.strip()]
+        return subscription_topics(settings.MQTT_SUBSCRIPTION_MODE, settings.MQTT_SHARED_GROUP, partitions)
+
+    def _create_client(self):
+        client = mqtt.Client(client_id=default_client_id(), clean_session=settings.MQTT_CLEAN_SESSION)
+        if settings.MQTT_ADMIN_USER:
+            client.username_pw_set(settings.MQTT_ADMIN_USER, settings.MQTT_ADMIN_PASSWORD)
+        return client
+
+def _log_offload_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Error spooling InfluxDB records: {future.exception()}")
+
+def _redis_client():
+    return aioredis.Redis.from_url(settings.REDIS_URL)
+
+async_ingest_engine = AsyncIngestEngine(
+    shards=settings.ASYNC_INGEST_SHARDS,
+    queue_size=settings.INGEST_QUEUE_SIZE,
+    db_workers=settings.ASYNC_DB_WORKERS,
+    max_in_flight_writes=settings.ASYNC_MAX_IN_FLIGHT_WRITES,
+    backpressure_timeout=settings.INFLUX_BACKPRESSURE_TIMEOUT_MS / 1000,
+)
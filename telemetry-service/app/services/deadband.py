@@ -0,0 +1,116 @@
+from collections import OrderedDict, namedtuple
+from app.core.config import settings
+from app.core.metrics import registry
+import datetime
+import json
+import threading
+
+# Per-property filter settings from device_properties; any of them may be None
+Deadband = namedtuple("Deadband", ["abs", "pct", "max_silence"])
+
+def deadband_from_columns(abs_tolerance, pct_tolerance, max_silence) -> Deadband:
+    """A Deadband for the row's columns, or None if the property is not filtered."""
+    if abs_tolerance is None and pct_tolerance is None:
+        return None
+    return Deadband(abs_tolerance, pct_tolerance, max_silence)
+
+def encode_deadband(deadband: Deadband) -> str:
+    # Stored as the value of the shared Redis property hash; "" means no filter
+    return json.dumps(list(deadband)) if deadband else ""
+
+def decode_deadband(value: str) -> Deadband:
+    return Deadband(*json.loads(value)) if value else None
+
+SAMPLES = registry.counter(
+    "telemetry_deadband_samples_total", "Property values checked by the deadband filter", ("result",))
+_FORWARDED = SAMPLES.labels("forwarded")
+_SUPPRESSED = SAMPLES.labels("suppressed")
+
+class DeadbandFilter:
+    """
+    Change-only filtering for properties with a deadband configured.
+
+    A value is suppressed while it stays within the band around the last
+    value that was forwarded: |value - last| <= abs, and/or
+    <= pct% of |last| (inside every band that is configured). It is forwarded
+    anyway once `max_silence` seconds have passed since the last forwarded
+    value, so a flat signal still produces a heartbeat. Booleans are only
+    forwarded when they change. Properties without a deadband always pass.
+
+    The last forwarded values are kept in a bounded LRU of `max_properties`;
+    a property evicted from it simply forwards its next value.
+    """
+    def __init__(self, enabled: bool = True, max_properties: int = 1000000):
+        self.enabled = enabled
+        self.max_properties = max_properties
+        self._last = OrderedDict() # (factory_id, device_id, property) -> (value, timestamp)
+        self._lock = threading.Lock()
+
+        # Counters (values, not messages)
+        self.forwarded = 0
+        self.suppressed = 0
+        self.evictions = 0
+
+    def apply(self, factory_id: str, device_id: str, data: dict, deadbands: dict,
+              timestamp: datetime.datetime) -> dict:
+        """Return the part of `data` that should be written and published."""
+        if not deadbands or not self.enabled:
+            return data
+
+        forwarded, checked = {}, 0
+        with self._lock:
+            for name, value in data.items():
+                deadband = deadbands.get(name)
+                if deadband is None:
+                    forwarded[name] = value
+                    continue
+                checked += 1
+                key = (factory_id, device_id, name)
+                last = self._last.get(key)
+                if last is None or not self._inside(deadband, value, last, timestamp):
+                    self._last[key] = (value, timestamp)
+                    forwarded[name] = value
+                self._last.move_to_end(key)
+            while len(self._last) > self.max_properties:
+                self._last.popitem(last=False)
+                self.evictions += 1
+
+        suppressed = len(data) - len(forwarded)
+        self.forwarded += checked - suppressed
+        self.suppressed += suppressed
+        _FORWARDED.inc(checked - suppressed)
+        _SUPPRESSED.inc(suppressed)
+        return forwarded
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+
+    def stats(self) -> dict:
+        checked = self.forwarded + self.suppressed
+        return {
+            "enabled": self.enabled,
+            "tracked_properties": len(self._last),
+            "evictions": self.evictions,
+            "forwarded": self.forwarded,
+            "suppressed": self.suppressed,
+            "suppressed_ratio": round(self.suppressed / checked, 4) if checked else 0.0,
+        }
+
+    def _inside(self, deadband: Deadband, value, last: tuple, timestamp: datetime.datetime) -> bool:
+        last_value, last_ts = last
+        if deadband.max_silence is not None and (timestamp - last_ts).total_seconds() >= deadband.max_silence:
+            return False
+        if type(value) is bool or type(last_value) is bool:
+            return value == last_value
+        delta = abs(value - last_value)
+        if deadband.abs is not None and delta > deadband.abs:
+            return False
+        if deadband.pct is not None and delta > abs(last_value) * deadband.pct / 100:
+            return False
+        return True
+
+deadband_filter = DeadbandFilter(
+    enabled=settings.DEADBAND_FILTER_ENABLED,
+    max_properties=settings.DEADBAND_MAX_PROPERTIES,
+)
@@ -0,0 +1,172 @@
+from app.core.config import settings
+from app.core.line_protocol import valid_name
+import datetime
+import json
+import logging
+import threading
+import time
+
+try:
+    import orjson
+except ImportError: # Optional fast path
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+logger = logging.getLogger("telemetry-decoder")
+
+# LLD 6.2: only numeric and boolean values are stored
+NUMERIC_TYPES = (float, int, bool)
+
+# Epoch values above this are milliseconds, not seconds (year 33658 in seconds)
+_EPOCH_MS_THRESHOLD = 1e12
+
+class PayloadError(ValueError):
+    pass
+
+def parse_timestamp(value) -> datetime.datetime:
+    """Device timestamp (epoch seconds, epoch milliseconds or ISO 8601) as naive UTC."""
+    if isinstance(value, bool):
+        raise PayloadError(f"Invalid sample timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > _EPOCH_MS_THRESHOLD else value
+        try:
+            return datetime.datetime.utcfromtimestamp(seconds)
+        except (OverflowError, OSError, ValueError): # Out of range, NaN
+            raise PayloadError(f"Invalid sample timestamp: {value!r}")
+    if isinstance(value, str):
+        try:
+            ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if ts.tzinfo is not None:
+                ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        except (OverflowError, ValueError):
+            raise PayloadError(f"Invalid sample timestamp: {value!r}")
+        return ts
+    raise PayloadError(f"Invalid sample timestamp: {value!r}")
+
+def extract_samples(payload) -> list:
+    """
+    Samples of a batched payload as [(timestamp, values), ...], or None for a
+    flat single-sample object. Batches are either a list of samples or
+    {"samples": [...]}; each sample is {"ts": <timestamp>, "values": {...}}.
+    """
+    if isinstance(payload, dict):
+        if "samples" not in payload:
+            return None
+        payload = payload["samples"]
+    if not isinstance(payload, list):
+        raise PayloadError("Batch samples must be a list")
+
+    samples = []
+    for sample in payload:
+        if not isinstance(sample, dict) or not isinstance(sample.get("values"), dict) or "ts" not in sample:
+            raise PayloadError("Each sample must be an object with 'ts' and 'values'")
+        samples.append((parse_timestamp(sample["ts"]), sample["values"]))
+    return samples
+
+def _loads_json(raw: bytes):
+    # Explicit utf-8 decode is cheaper than letting json.loads sniff the encoding
+    return json.loads(raw.decode())
+
+DECODERS = {"json": _loads_json}
+if orjson is not None:
+    # Parses straight from bytes
+    DECODERS["orjson"] = orjson.loads
+
+# Binary payload formats, selected by topic suffix or content type
+BINARY_FORMATS = {}
+if msgpack is not None:
+    BINARY_FORMATS["msgpack"] = lambda raw: msgpack.unpackb(raw, raw=False)
+if cbor2 is not None:
+    BINARY_FORMATS["cbor"] = cbor2.loads
+
+CONTENT_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/cbor": "cbor",
+}
+
+class PayloadDecoder:
+    """
+    Decodes telemetry payloads straight from bytes and filters them down to
+    numeric fields. JSON goes through the configured parser, MessagePack and
+    CBOR through their own libraries when installed. Invalid fields are
+    counted and summarised in one log line per `log_interval` instead of one
+    warning per field.
+    """
+    def __init__(self, name: str = "auto", log_interval: float = 60.0):
+        if name == "auto":
+            name = "orjson" if "orjson" in DECODERS else "json"
+        if name not in DECODERS:
+            raise ValueError(f"Payload decoder not available: {name}")
+        self.name = name
+        self._loads = DECODERS[name]
+        self.log_interval = log_interval
+
+        self._lock = threading.Lock()
+        self._last_log = float("-inf") # First occurrence is logged right away
+        self._invalid_since_log = 0
+
+        # Counters
+        self.decoded = 0
+        self.decode_errors = 0
+        self.invalid_fields = 0
+
+    def decode(self, raw: bytes, fmt: str = "json"):
+        """Decode a payload into an object (flat sample) or a batch (list / {"samples": ...})."""
+        loads = self._loads if fmt == "json" else BINARY_FORMATS.get(fmt)
+        if loads is None:
+            self.decode_errors += 1
+            raise PayloadError(f"Unsupported payload format: {fmt}")
+        try:
+            payload = loads(raw)
+        except Exception as e: # Parser errors differ per library
+            self.decode_errors += 1
+            raise PayloadError(f"Invalid {fmt} payload: {e}") from e
+        if not isinstance(payload, (dict, list)):
+            self.decode_errors += 1
+            raise PayloadError(f"Payload must be an object or a list of samples, got {type(payload).__name__}")
+        self.decoded += 1
+        return payload
+
+    def validate(self, payload: dict) -> dict:
+        """Return only the numeric/boolean fields of `payload` with storable names, in one pass."""
+        valid = {k: v for k, v in payload.items() if type(v) in NUMERIC_TYPES and valid_name(k)}
+        if len(valid) != len(payload):
+            self._record_invalid(len(payload) - len(valid))
+        return valid
+
+    def stats(self) -> dict:
+        return {
+            "decoder": self.name,
+            "decoded": self.decoded,
+            "decode_errors": self.decode_errors,
+            "invalid_fields": self.invalid_fields,
+        }
+
+    def _record_invalid(self, count: int):
+        # Counters are best-effort under concurrency; only the log throttle is locked
+        self.invalid_fields += count
+        self._invalid_since_log += count
+
+        now = time.monotonic()
+        if now - self._last_log < self.log_interval:
+            return
+        with self._lock:
+            if now - self._last_log < self.log_interval:
+                return
+            logged, self._invalid_since_log = self._invalid_since_log, 0
+            self._last_log = now
+        logger.warning(f"Ignored {logged} non-numeric telemetry fields since the last report "
+                       f"({self.invalid_fields} total)")
+
+payload_decoder = PayloadDecoder(settings.PAYLOAD_DECODER)
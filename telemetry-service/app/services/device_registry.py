@@ -0,0 +1,230 @@
+from app.core import database
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.models import Device
+from app.services.property_registry import property_registry
+import json
+import logging
+import threading
+import time
+import redis
+
+logger = logging.getLogger("device-registry")
+
+# Published by the API service when a device is created, changed or deleted
+INVALIDATION_CHANNEL = "device_invalidation"
+
+POLICIES = ("accept", "drop", "quarantine")
+ACCEPT = "accept"
+
+_NO_DEVICES = {}
+
+REJECTED = registry.counter(
+    "telemetry_rejected_messages_total", "Messages from unknown or disabled devices", ("reason", "action"))
+
+class DeviceRegistry:
+    """
+    In-memory snapshot of known devices and their status, so telemetry from
+    unknown, inactive or maintenance devices can be turned away without a
+    database query.
+
+    The snapshot is loaded in full at start, then refreshed incrementally
+    from `devices.updated_at` every `refresh_interval` seconds and reloaded
+    in full every `full_reload_interval` (which is what notices deletions).
+    Invalidation messages from the API service update single devices right
+    away and are passed on to `on_invalidation` (the property registry, for
+    deadband changes). Until the first load succeeds every message is accepted, so a
+    MySQL outage at startup does not stop ingestion.
+
+    `policy` decides what happens to rejected messages: accept (only count
+    them), drop, or quarantine (stored apart, see InfluxService.write_quarantine).
+    """
+    def __init__(self, policy: str, refresh_interval: float, full_reload_interval: float = 3600.0,
+                 session_factory=None, redis_client_factory=None, on_invalidation=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown device policy: {policy}")
+        self.policy = policy
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._session_factory = session_factory
+        self._redis_client_factory = redis_client_factory
+        self._invalidation_listener = on_invalidation # Called with (factory_id, device_id)
+
+        # factory_id -> {device_id: status}; nested so keys are plain strings
+        self._devices = {}
+        self._watermark = None
+        self._loaded = False
+        self._last_full_load = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+        # Counters
+        self.accepted = 0
+        self.unknown = 0
+        self.disabled = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def check(self, factory_id: str, device_id: str) -> str:
+        """What to do with a message from this device: accept, drop or quarantine."""
+        if not self._loaded:
+            return ACCEPT
+        status = self._devices.get(factory_id, _NO_DEVICES).get(device_id)
+        if status == "active":
+            self.accepted += 1
+            return ACCEPT
+        if status is None:
+            self.unknown += 1
+            reason = "unknown"
+        else:
+            self.disabled += 1
+            reason = status
+        REJECTED.labels(reason, self.policy).inc()
+        return self.policy
+
+    def known_factory(self, factory_id: str) -> bool:
+        """Whether the snapshot has devices of this factory."""
+        return factory_id in self._devices
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.reload()
+        targets = [("device-registry-refresh", self._run_refresh)]
+        if self._redis_client_factory is not None:
+            targets.append(("device-registry-invalidations", self._run_invalidations))
+        for name, target in targets:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def reload(self) -> int:
+        """Replace the snapshot with every device in MySQL. Returns the rows read."""
+        rows = self._query()
+        if rows is None:
+            return 0
+        devices = {}
+        for device_id, factory_id, status, _ in rows:
+            devices.setdefault(factory_id, {})[device_id] = status
+        with self._lock:
+            self._devices = devices
+            self._watermark = max((r[3] for r in rows if r[3] is not None), default=None)
+            self._loaded = True
+        self._last_full_load = time.monotonic()
+        logger.info(f"Loaded {len(rows)} devices")
+        return len(rows)
+
+    def refresh(self) -> int:
+        """Apply devices changed since the last load. Returns the rows read."""
+        if not self._loaded or time.monotonic() - self._last_full_load >= self.full_reload_interval:
+            return self.reload()
+        # >= so rows updated within the same second as the watermark are not missed
+        rows = self._query(Device.updated_at >= self._watermark) if self._watermark else self._query()
+        if not rows:
+            return 0
+        with self._lock:
+            for device_id, factory_id, status, updated_at in rows:
+                self._set(factory_id, device_id, status)
+                if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                    self._watermark = updated_at
+        self.refreshes += 1
+        return len(rows)
+
+    def invalidate(self, factory_id: str, device_id: str):
+        """Re-read one device; removes it from the snapshot if it no longer exists."""
+        rows = self._query(Device.id == device_id)
+        if rows is None:
+            return
+        self.invalidations += 1
+        with self._lock:
+            self._set(factory_id, device_id, None)
+            for row_id, row_factory, status, _ in rows:
+                self._set(row_factory, row_id, status)
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "loaded": self._loaded,
+            "devices": sum(len(d) for d in self._devices.values()),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "accepted": self.accepted,
+            "unknown": self.unknown,
+            "disabled": self.disabled,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+    def _set(self, factory_id: str, device_id: str, status):
+        # Caller holds the lock; `check` reads without it, single dict
+        # operations are atomic.
+        if status is None:
+            self._devices.get(factory_id, _NO_DEVICES).pop(device_id, None)
+        else:
+            self._devices.setdefault(factory_id, {})[device_id] = status
+
+    def _query(self, *criteria):
+        session_factory = self._session_factory or database.SessionLocal
+        db = session_factory()
+        try:
+            return db.query(Device.id, Device.factory_id, Device.status, Device.updated_at).filter(*criteria).all()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error loading devices: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _run_refresh(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def _run_invalidations(self):
+        retry_delay = 1.0
+        while not self._stop.is_set():
+            try:
+                pubsub = self._redis_client_factory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                retry_delay = 1.0
+                # A refresh covers whatever changed while we were not subscribed
+                self.refresh()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._on_invalidation(message["data"])
+                pubsub.close()
+            except redis.RedisError as e:
+                logger.warning(f"Device invalidation channel unavailable: {e}")
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
+    def _on_invalidation(self, data):
+        try:
+            message = json.loads(data)
+            factory_id, device_id = message["factory_id"], message["device_id"]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed device invalidation {data!r}: {e}")
+            return
+        if self._invalidation_listener is not None:
+            self._invalidation_listener(factory_id, device_id)
+        self.invalidate(factory_id, device_id)
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+device_registry = DeviceRegistry(
+    policy=settings.DEVICE_POLICY,
+    refresh_interval=settings.DEVICE_REFRESH_INTERVAL_SECONDS,
+    full_reload_interval=settings.DEVICE_FULL_RELOAD_SECONDS,
+    redis_client_factory=_redis_client,
+    on_invalidation=property_registry.invalidate,
+)
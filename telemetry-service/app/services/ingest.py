@@ -0,0 +1,284 @@
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("telemetry-ingest")
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+_STOP = object()
+
+def shard_for(factory_id: str, device_id: str, shards: int) -> int:
+    """Stable shard index for a device, so all its messages go to the same worker."""
+    return zlib.crc32(f"{factory_id}/{device_id}".encode()) % shards
+
+class StageStats:
+    """Count / total / max of the time spent in one pipeline stage."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(avg * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+class SpillFile:
+    """
+    Append-only overflow file used by the "spill" policy. Records are framed as
+    length-prefixed fields (factory_id, device_id, format, payload) and read
+    back in order; the file is truncated once the reader catches up.
+    """
+    HEADER = struct.Struct(">HHHI")
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._read_offset = 0
+        self._size = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Anything left from a previous run is replayed
+        if os.path.exists(path):
+            self._size = os.path.getsize(path)
+
+    def __len__(self):
+        return self._size - self._read_offset
+
+    def append(self, factory_id: str, device_id: str, payload: bytes, fmt: str = "json") -> bool:
+        f, d, t = factory_id.encode(), device_id.encode(), fmt.encode()
+        frame = self.HEADER.pack(len(f), len(d), len(t), len(payload)) + f + d + t + payload
+        with self._lock:
+            if self._size + len(frame) > self.max_bytes:
+                return False
+            with open(self.path, "ab") as fh:
+                fh.write(frame)
+            self._size += len(frame)
+        return True
+
+    def pop(self):
+        with self._lock:
+            if self._read_offset >= self._size:
+                return None
+            with open(self.path, "rb") as fh:
+                fh.seek(self._read_offset)
+                f_len, d_len, t_len, p_len = self.HEADER.unpack(fh.read(self.HEADER.size))
+                factory_id = fh.read(f_len).decode()
+                device_id = fh.read(d_len).decode()
+                fmt = fh.read(t_len).decode()
+                payload = fh.read(p_len)
+            self._read_offset += self.HEADER.size + f_len + d_len + t_len + p_len
+            if self._read_offset >= self._size:
+                # Fully drained, start over with an empty file
+                open(self.path, "wb").close()
+                self._read_offset = self._size = 0
+            return factory_id, device_id, payload, fmt
+
+def open_spills(path: str, max_bytes: int, shards: int) -> list:
+    """
+    One SpillFile per shard (`path.0`, `path.1`, ...), sharing `max_bytes`.
+    Whatever a previous run left in spill files, possibly with another
+    number of shards, is first moved to the file of each device's current
+    shard, in order, so it is replayed by the worker that owns the device.
+    """
+    directory, base = os.path.split(path)
+    directory = directory or "."
+    os.makedirs(directory, exist_ok=True)
+    leftovers = []
+    for name in sorted(os.listdir(directory)):
+        if name != base and not name.startswith(base + "."):
+            continue
+        old = os.path.join(directory, name)
+        if not name.endswith(".moving"):
+            os.rename(old, old + ".moving")
+            old += ".moving"
+        leftovers.append(old)
+
+    spills = [SpillFile(f"{path}.{i}", max(max_bytes // shards, 1)) for i in range(shards)]
+    for old in leftovers:
+        reader = SpillFile(old, os.path.getsize(old))
+        moved = 0
+        while True:
+            record = reader.pop()
+            if record is None:
+                break
+            factory_id, device_id, payload, fmt = record
+            if spills[shard_for(factory_id, device_id, shards)].append(factory_id, device_id, payload, fmt):
+                moved += 1
+        os.remove(old)
+        logger.info(f"Moved {moved} spilled messages from {old} to the shard spill files")
+    return spills
+
+class IngestPipeline:
+    """
+    Bounded hand-off between the MQTT network thread and a pool of workers.
+
+    `submit` only enqueues; workers call `handler(factory_id, device_id, payload, fmt)`.
+    Each device is pinned to one worker queue (by hash) so its messages are
+    processed in arrival order. When a queue is full the overflow policy applies:
+      - block:       wait up to `block_timeout` for space, then drop
+      - drop_oldest: discard the oldest queued message to make room
+      - spill:       append to the worker's spill file (`spills`, one per
+                     worker), replayed by that worker once its queue is empty.
+                     While a worker has spilled messages, new ones for it are
+                     spilled too, so they cannot overtake them.
+    """
+    def __init__(self, handler, workers: int, queue_size: int, overflow_policy: str = "block",
+                 block_timeout: float = 1.0, spills: list = None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.workers = max(workers, 1)
+        if overflow_policy == "spill" and (not spills or len(spills) != self.workers):
+            raise ValueError("The spill overflow policy requires one spill file per worker")
+
+        self.handler = handler
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.spills = spills if overflow_policy == "spill" else None
+
+        per_worker = max(queue_size // self.workers, 1)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads = []
+        self._running = False
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.processed = 0
+        self.errors = 0
+        self.stages = {
+            "enqueue": StageStats(),
+            "queue_wait": StageStats(),
+            "process": StageStats(),
+        }
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, args=(i,), name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """Stop accepting work and let workers drain what is already queued."""
+        if not self._running:
+            return
+        self._running = False
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def submit(self, factory_id: str, device_id: str, payload: bytes, fmt: str = "json") -> bool:
+        started = time.perf_counter()
+        item = (factory_id, device_id, payload, fmt, time.monotonic())
+        shard = shard_for(factory_id, device_id, self.workers)
+        try:
+            accepted = self._put(shard, item)
+        finally:
+            self.stages["enqueue"].observe(time.perf_counter() - started)
+        if accepted:
+            self.enqueued += 1
+        return accepted
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": sum(q.qsize() for q in self._queues),
+            "queue_capacity": sum(q.maxsize for q in self._queues),
+            "spill_bytes": sum(len(spill) for spill in self.spills) if self.spills else 0,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "errors": self.errors,
+            "stages": {name: s.snapshot() for name, s in self.stages.items()},
+        }
+
+    def _put(self, shard: int, item) -> bool:
+        q = self._queues[shard]
+        # Spilled messages go first: queueing behind them would reorder the device
+        if not (self.spills and len(self.spills[shard])):
+            try:
+                q.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+
+        if self.overflow_policy == "block":
+            try:
+                q.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+        if self.overflow_policy == "drop_oldest":
+            while True:
+                try:
+                    q.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(item)
+                    return True
+                except queue.Full:
+                    continue
+
+        # spill
+        if self.spills[shard].append(*item[:4]):
+            self.spilled += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def _run(self, shard: int):
+        q = self._queues[shard]
+        spill = self.spills[shard] if self.spills else None
+        while True:
+            try:
+                # Queued messages are older than spilled ones; with a backlog
+                # in the spill file do not wait for new ones
+                item = q.get_nowait() if spill is not None and len(spill) else q.get(timeout=0.2)
+            except queue.Empty:
+                if spill is not None:
+                    spilled = spill.pop()
+                    if spilled:
+                        self._handle(*spilled, None)
+                continue
+
+            if item is _STOP:
+                return
+            self._handle(*item)
+
+    def _handle(self, factory_id, device_id, payload, fmt, enqueued_at):
+        if enqueued_at is not None:
+            self.stages["queue_wait"].observe(time.monotonic() - enqueued_at)
+        started = time.perf_counter()
+        try:
+            self.handler(factory_id, device_id, payload, fmt)
+            self.processed += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error processing message for {device_id}: {e}")
+        finally:
+            self.stages["process"].observe(time.perf_counter() - started)
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from sqlalchemy import update, case
+from app.core import database
+from app.core.config import settings
+from app.models.models import Device
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger("last-seen-updater")
+
+# Rows per UPDATE statement
+MAX_UPDATE_BATCH = 1000
+
+class LastSeenUpdater:
+    """
+    Debounced devices.last_seen_at updates (LLD 4.1 step 4).
+
+    `touch` only records the latest timestamp per device in memory; a
+    background thread writes them every `flush_interval` seconds with one
+    bulk UPDATE ... SET last_seen_at = CASE id ... END per factory.
+    updated_at is assigned to itself so heartbeats do not count as device
+    changes for the telemetry device snapshot.
+    """
+    def __init__(self, flush_interval: float, session_factory=None):
+        self.flush_interval = flush_interval
+        self._session_factory = session_factory
+        self._pending = {} # (factory_id, device_id) -> datetime
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.touches = 0
+        self.rows_updated = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.errors = 0
+        self._touches_since_flush = 0
+
+    def touch(self, factory_id: str, device_id: str, seen_at: datetime.datetime):
+        key = (factory_id, device_id)
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None or seen_at > current:
+                self._pending[key] = seen_at
+            self.touches += 1
+            self._touches_since_flush += 1
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="last-seen-updater", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            touches, self._touches_since_flush = self._touches_since_flush, 0
+        if not pending:
+            return 0
+
+        by_factory = defaultdict(dict)
+        for (factory_id, device_id), seen_at in pending.items():
+            by_factory[factory_id][device_id] = seen_at
+
+        session_factory = self._session_factory or database.SessionLocal
+        db = session_factory()
+        try:
+            for factory_id, devices in by_factory.items():
+                items = list(devices.items())
+                for i in range(0, len(items), MAX_UPDATE_BATCH):
+                    chunk = dict(items[i:i + MAX_UPDATE_BATCH])
+                    stmt = update(Device) \
+                        .where(Device.factory_id == factory_id, Device.id.in_(list(chunk))) \
+                        .values(last_seen_at=case(chunk, value=Device.id), updated_at=Device.updated_at) \
+                        .execution_options(synchronize_session=False)
+                    db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.errors += 1
+            logger.error(f"Error flushing last_seen_at for {len(pending)} devices: {e}")
+            self._restore(pending, touches)
+            return 0
+        finally:
+            db.close()
+
+        self.flushes += 1
+        self.rows_updated += len(pending)
+        self.coalesced += touches - len(pending)
+        return len(pending)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "touches": self.touches,
+            "rows_updated": self.rows_updated,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+    def _restore(self, pending: dict, touches: int):
+        # Keep the timestamps for the next attempt unless newer ones arrived
+        with self._lock:
+            for key, seen_at in pending.items():
+                current = self._pending.get(key)
+                if current is None or seen_at > current:
+                    self._pending[key] = seen_at
+            self._touches_since_flush += touches
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+last_seen_updater = LastSeenUpdater(settings.LAST_SEEN_FLUSH_INTERVAL_SECONDS)
@@ -0,0 +1,158 @@
+from app.core.config import settings
+import datetime
+import json
+import logging
+import threading
+import redis
+
+logger = logging.getLogger("latest-values")
+
+# One hash per factory; read in one HGETALL by the API service
+LATEST_KEY = "telemetry:latest:{factory_id}"
+
+# HSET of the fields whose stored timestamp is not newer, so a late sample or
+# another process's older value cannot replace the latest one. ISO timestamps
+# compare in time order as strings. ARGV: field, value, timestamp, ...
+# Returns how many fields were written.
+SET_IF_NEWER = """
+local written = 0
+for i = 1, #ARGV, 3 do
+  local current = redis.call("HGET", KEYS[1], ARGV[i])
+  if not current or cjson.decode(current)[2] <= ARGV[i + 2] then
+    redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+    written = written + 1
+  end
+end
+return written
+"""
+
+def latest_field(device_id: str, name: str) -> str:
+    return f"{device_id}:{name}"
+
+def encode_latest(value, timestamp: datetime.datetime) -> str:
+    return json.dumps([value, timestamp.isoformat()])
+
+class LatestValueStore:
+    """
+    Latest value and timestamp of every (factory, device, property), kept in
+    Redis so current state can be read without querying InfluxDB.
+
+    Hash telemetry:latest:{factory_id}, field "{device_id}:{property}",
+    value JSON [value, ISO timestamp]. `update` only records values in
+    memory, the newest per field winning; a background thread writes them
+    every `flush_interval` seconds with one script call per factory, all in
+    one pipeline. The script keeps a stored value that is newer than the
+    one written (late batch samples, other shard processes or replicas).
+    """
+    def __init__(self, client_factory, flush_interval: float, enabled: bool = True):
+        self._client_factory = client_factory
+        self._client = None
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._pending = {} # factory_id -> {field: (value, timestamp)}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.updates = 0
+        self.fields_written = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.flushes = 0
+        self.errors = 0
+        self._updates_since_flush = 0
+
+    def update(self, factory_id: str, device_id: str, values: dict, timestamp: datetime.datetime):
+        if not self.enabled:
+            return
+        with self._lock:
+            fields = self._pending.setdefault(factory_id, {})
+            for name, value in values.items():
+                field = latest_field(device_id, name)
+                current = fields.get(field)
+                if current is None or timestamp >= current[1]:
+                    fields[field] = (value, timestamp)
+            self.updates += len(values)
+            self._updates_since_flush += len(values)
+
+    def start(self):
+        if self._thread or not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="latest-values", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            updates, self._updates_since_flush = self._updates_since_flush, 0
+        if not pending:
+            return 0
+
+        written = sum(len(fields) for fields in pending.values())
+        try:
+            if self._client is None:
+                self._client = self._client_factory()
+            pipe = self._client.pipeline(transaction=False)
+            for factory_id, fields in pending.items():
+                args = []
+                for field, (value, timestamp) in fields.items():
+                    args += [field, encode_latest(value, timestamp), timestamp.isoformat()]
+                pipe.eval(SET_IF_NEWER, 1, LATEST_KEY.format(factory_id=factory_id), *args)
+            stored = sum(pipe.execute())
+        except redis.RedisError as e:
+            self._client = None
+            self.errors += 1
+            logger.error(f"Error writing {written} latest values: {e}")
+            self._restore(pending, updates)
+            return 0
+
+        self.flushes += 1
+        self.fields_written += written
+        self.coalesced += updates - written
+        self.stale += written - stored
+        return written
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": sum(len(fields) for fields in self._pending.values()),
+            "updates": self.updates,
+            "fields_written": self.fields_written,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+    def _restore(self, pending: dict, updates: int):
+        # Keep the values for the next attempt unless newer ones arrived
+        with self._lock:
+            for factory_id, fields in pending.items():
+                current_fields = self._pending.setdefault(factory_id, {})
+                for field, entry in fields.items():
+                    current = current_fields.get(field)
+                    if current is None or entry[1] > current[1]:
+                        current_fields[field] = entry
+            self._updates_since_flush += updates
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+def _redis_client():
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+latest_values = LatestValueStore(
+    _redis_client,
+    flush_interval=settings.LATEST_VALUES_FLUSH_INTERVAL_MS / 1000,
+    enabled=settings.LATEST_VALUES_ENABLED,
+)
@@ -1,55 +1,181 @@
 import paho.mqtt.client as mqtt
 import logging
+import socket
 import time
-import json
 from app.core.config import settings
-from app.services.processor import process_message
+from app.core.metrics import STAGE_SECONDS
+from app.services.decoder import payload_decoder, extract_samples, PayloadError, CONTENT_TYPES
+from app.services.ingest import IngestPipeline, open_spills
+from app.services.processor import process_message, process_batch
 
 logger = logging.getLogger("mqtt-client")
 
+# Also matches the format sub-topics (.../telemetry/batch, .../telemetry/msgpack, ...)
+TELEMETRY_TOPIC = "factories/{factory_id}/devices/+/telemetry/#"
+TOPIC_FORMATS = {"batch": "json", "json": "json", "msgpack": "msgpack", "cbor": "cbor"}
+
+_DECODE = STAGE_SECONDS.labels("decode")
+SUBSCRIPTION_MODES = ("plain", "shared", "partitioned")
+
+def subscription_topics(mode: str, shared_group: str = "", partitions: list = None) -> list:
+    """
+    Topic filters for the configured subscription mode:
+      - plain:       every replica receives every message (single replica only)
+      - shared:      $share/<group>/..., the broker delivers each message to
+                     one member of the group
+      - partitioned: only the listed factories; shared within the group as
+                     well when one is configured
+    """
+    if mode not in SUBSCRIPTION_MODES:
+        raise ValueError(f"Unknown MQTT subscription mode: {mode}")
+
+    if mode == "partitioned":
+        if not partitions:
+            raise ValueError("Partitioned subscription mode requires MQTT_FACTORY_PARTITIONS")
+        topics = [TELEMETRY_TOPIC.format(factory_id=f) for f in partitions]
+    else:
+        topics = [TELEMETRY_TOPIC.format(factory_id="+")]
+
+    if mode == "shared" or (mode == "partitioned" and shared_group):
+        if not shared_group:
+            raise ValueError("Shared subscription mode requires MQTT_SHARED_GROUP")
+        topics = [f"$share/{shared_group}/{t}" for t in topics]
+    return topics
+
+def payload_format(topic_suffix: str, properties=None) -> str:
+    """
+    Payload format from the MQTT v5 content type when the publisher set one,
+    otherwise from the topic suffix (none means JSON). Unknown formats are
+    returned as-is and rejected by the decoder.
+    """
+    content_type = getattr(properties, "ContentType", None)
+    if content_type:
+        return CONTENT_TYPES.get(content_type.split(";")[0].strip().lower(), content_type)
+    if not topic_suffix:
+        return "json"
+    return TOPIC_FORMATS.get(topic_suffix, topic_suffix)
+
+def parse_topic(topic: str, properties=None):
+    """
+    (factory_id, device_id, format) for factories/{factory_id}/devices/{device_id}/telemetry[/{format}],
+    or None if the topic does not have that shape.
+    """
+    parts = topic.split("/")
+    if len(parts) in (5, 6) and parts[0] == "factories" and parts[2] == "devices" and parts[4] == "telemetry":
+        return parts[1], parts[3], payload_format(parts[5] if len(parts) == 6 else "", properties)
+    return None
+
+def decode_payload(device_id: str, raw: bytes, fmt: str):
+    """
+    (payload, samples) for a raw message, where samples is None unless it
+    is a batch; None if it cannot be decoded (logged and counted here).
+    """
+    started = time.perf_counter()
+    payload = None
+    try:
+        payload = payload_decoder.decode(raw, fmt)
+        return payload, extract_samples(payload)
+    except PayloadError as e:
+        if payload is not None: # A malformed batch; decode() counts its own errors
+            payload_decoder.decode_errors += 1
+        logger.error(f"Failed to decode payload from {device_id}: {e}")
+        return None
+    finally:
+        _DECODE.observe(time.perf_counter() - started)
+
+def default_client_id() -> str:
+    # Container hostnames are stable for the life of a replica, so a restart
+    # resumes the same broker session instead of creating a new one.
+    return settings.MQTT_CLIENT_ID or f"{settings.SERVICE_NAME}-{socket.gethostname()}"
+
 class MQTTClient:
-    def __init__(self):
-        self.client = mqtt.Client()
+    def __init__(self, client=None):
+        partitions = [f.strip() for f in settings.MQTT_FACTORY_PARTITIONS.split(",") if f.strip()]
+        self.topics = subscription_topics(settings.MQTT_SUBSCRIPTION_MODE, settings.MQTT_SHARED_GROUP, partitions)
+        self.client_id = default_client_id()
+        self.client = client or mqtt.Client(client_id=self.client_id, clean_session=settings.MQTT_CLEAN_SESSION)
         if settings.MQTT_ADMIN_USER:
             self.client.username_pw_set(settings.MQTT_ADMIN_USER, settings.MQTT_ADMIN_PASSWORD)
-            
+
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
-        
+        self._pipeline = None
+
+    @property
+    def pipeline(self):
+        """
+        Built on first use rather than at import: shard processes import this
+        module only for handle_payload, and must not open (and move) the
+        spill files of the process that receives from MQTT.
+        """
+        if self._pipeline is None:
+            spills = None
+            if settings.INGEST_OVERFLOW_POLICY == "spill":
+                spills = open_spills(settings.INGEST_SPILL_PATH, settings.INGEST_SPILL_MAX_BYTES,
+                                     max(settings.INGEST_WORKERS, 1))
+            self._pipeline = IngestPipeline(
+                self.handle_payload,
+                workers=settings.INGEST_WORKERS,
+                queue_size=settings.INGEST_QUEUE_SIZE,
+                overflow_policy=settings.INGEST_OVERFLOW_POLICY,
+                block_timeout=settings.INGEST_BLOCK_TIMEOUT_MS / 1000,
+                spills=spills,
+            )
+        return self._pipeline
+
+    @pipeline.setter
+    def pipeline(self, pipeline):
+        self._pipeline = pipeline
+
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            logger.info("Connected to EMQX Broker!")
-            # Subscribe to all telemetry topics
-            self.client.subscribe("factories/+/devices/+/telemetry", qos=1)
+            logger.info(f"Connected to EMQX Broker as {self.client_id}, subscribing to {self.topics}")
+            self.client.subscribe([(topic, 1) for topic in self.topics])
         else:
             logger.error(f"Failed to connect, return code {rc}")
 
     def on_message(self, client, userdata, msg):
+        # Runs on paho's network thread: only parse the topic and hand off,
+        # decoding and processing happen on the ingest workers.
         try:
-            topic = msg.topic
-            payload = json.loads(msg.payload.decode())
-            # Parse topic factories/{factory_id}/devices/{device_id}/telemetry
-            parts = topic.split("/")
-            if len(parts) >= 5 and parts[0] == "factories" and parts[2] == "devices" and parts[4] == "telemetry":
-                factory_id = parts[1]
-                device_id = parts[3]
-                process_message(factory_id, device_id, payload)
+            parsed = parse_topic(msg.topic, getattr(msg, "properties", None))
+            if parsed:
+                factory_id, device_id, fmt = parsed
+                self.pipeline.submit(factory_id, device_id, msg.payload, fmt)
             else:
-                logger.warning(f"Invalid topic format: {topic}")
-        except json.JSONDecodeError:
-            logger.error("Failed to decode JSON payload")
+                logger.warning(f"Invalid topic format: {msg.topic}")
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
+            logger.error(f"Error enqueueing message: {e}")
+
+    def handle_payload(self, factory_id: str, device_id: str, raw: bytes, fmt: str = "json"):
+        decoded = decode_payload(device_id, raw, fmt)
+        if decoded is None:
+            return
+        payload, samples = decoded
+        if samples is None:
+            process_message(factory_id, device_id, payload)
+        else:
+            process_batch(factory_id, device_id, samples)
 
     def on_disconnect(self, client, userdata, rc):
         logger.warning(f"Disconnected with result code {rc}. Reconnection handled by loop_start()")
-        
+
     def start(self):
+        self.pipeline.start()
         try:
             self.client.connect(settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT, 60)
             self.client.loop_start()
         except Exception as e:
             logger.error(f"Failed to start MQTT client: {e}")
 
+    def stop(self):
+        # Stop receiving first, then drain what is already queued
+        try:
+            self.client.disconnect()
+            self.client.loop_stop()
+        except Exception as e:
+            logger.error(f"Error stopping MQTT client: {e}")
+        self.pipeline.stop()
+
 mqtt_app = MQTTClient()
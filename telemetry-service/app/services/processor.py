@@ -1,96 +1,278 @@
 from app.core.influx import influx_service
-from app.core.database import SessionLocal
-from app.models.models import Device, DeviceProperty
+from app.core.database import SessionLocal, LazySession
+from app.core.metrics import STAGE_SECONDS, MESSAGES, OTHER_FACTORY
+from app.services.deadband import deadband_filter
+from app.services.decoder import payload_decoder
+from app.services.device_registry import device_registry, ACCEPT
+from app.services.last_seen import last_seen_updater
+from app.services.latest_values import latest_values
+from app.services.rollups import rollup_aggregator
+from app.services.property_registry import property_registry
 from app.services.redis_service import rule_engine_queue
-import json
+from time import perf_counter
+import asyncio
 import logging
 import datetime
 
 logger = logging.getLogger("telemetry-processor")
 
-CACHE_PROPERTIES = {} # In-memory cache for simplicity in this artifact, real prod would use Redis for HA
+# How often the hot path needed MySQL; should stay near zero once caches are warm
+STATS = {"messages": 0, "db_sessions": 0}
 
-def process_message(factory_id: str, device_id: str, payload: dict, timestamp: datetime.datetime = None):
-    # 1. Validate payload
-    valid_data = {}
-    for k, v in payload.items():
-        if isinstance(v, (int, float, bool)):
-            valid_data[k] = v
-        else:
-            logger.warning(f"Invalid data type for {k}: {type(v)} in device {device_id}")
+# Histogram children bound once, so each observation is just a bucket increment
+_VALIDATE = STAGE_SECONDS.labels("validate")
+_DISCOVERY = STAGE_SECONDS.labels("discovery")
+_DEADBAND = STAGE_SECONDS.labels("deadband")
+_INFLUX = STAGE_SECONDS.labels("influx_write")
+_LAST_SEEN = STAGE_SECONDS.labels("last_seen")
+_LATEST = STAGE_SECONDS.labels("latest_values")
+_ROLLUP = STAGE_SECONDS.labels("rollup")
+_PUBLISH = STAGE_SECONDS.labels("publish")
 
-    if not valid_data:
-        return
+def get_stats() -> dict:
+    messages = STATS["messages"]
+    return {
+        **STATS,
+        "db_session_ratio": round(STATS["db_sessions"] / messages, 4) if messages else 0.0,
+    }
 
-    # 2. Auto-discovery
-    db = SessionLocal()
+def discover_properties(factory_id: str, device_id: str, names):
+    db = LazySession(SessionLocal)
     try:
-        if device_id not in CACHE_PROPERTIES:
-            # Load known properties for device
-            props = db.query(DeviceProperty.property_name).filter(
-                DeviceProperty.device_id == device_id,
-                DeviceProperty.factory_id == factory_id
-            ).all()
-            CACHE_PROPERTIES[device_id] = {p[0] for p in props}
-        
-        known_props = CACHE_PROPERTIES[device_id]
-        new_props = []
-        
-        for k in valid_data.keys():
-            if k not in known_props:
-                new_props.append(k)
-        
+        new_props = property_registry.register(db, factory_id, device_id, names)
         if new_props:
             logger.info(f"New properties discovered for {device_id}: {new_props}")
-            for prop_name in new_props:
-                # Add to DB
-                # Check if exists first (concurrency)
-                existing = db.query(DeviceProperty).filter(
-                    DeviceProperty.device_id == device_id,
-                    DeviceProperty.property_name == prop_name
-                ).first()
-                
-                if not existing:
-                    new_prop = DeviceProperty(
-                        factory_id=factory_id,
-                        device_id=device_id,
-                        property_name=prop_name,
-                        data_type="float" # Defaulting for now as per minimal impl
-                    )
-                    db.add(new_prop)
-                    # Add to cache immediately
-                    known_props.add(prop_name)
-            
-            db.commit()
-            
     except Exception as e:
         logger.error(f"Error in auto-discovery: {e}")
         db.rollback()
     finally:
+        if db.opened:
+            STATS["db_sessions"] += 1
         db.close()
 
+def factory_label(factory_id: str) -> str:
+    """Metric label of a factory; unknown ones (DEVICE_POLICY=accept) share one series."""
+    return factory_id if device_registry.known_factory(factory_id) else OTHER_FACTORY
+
+def admit(factory_id: str, device_id: str, samples: list) -> bool:
+    """
+    Check the device against the in-memory snapshot. Samples from unknown or
+    disabled devices are dropped or quarantined, depending on DEVICE_POLICY.
+    """
+    action = device_registry.check(factory_id, device_id)
+    if action == ACCEPT:
+        return True
+    if action == "quarantine":
+        valid_samples = [(ts, v) for ts, v in ((ts, payload_decoder.validate(values)) for ts, values in samples) if v]
+        try:
+            influx_service.write_quarantine(factory_id, device_id, valid_samples)
+        except Exception as e:
+            logger.error(f"Error writing quarantined telemetry to InfluxDB: {e}")
+    return False
+
+def process_message(factory_id: str, device_id: str, payload: dict, timestamp: datetime.datetime = None):
+    valid_data = _accept_message(factory_id, device_id, payload, timestamp)
+    if not valid_data:
+        return
+
+    # 2. Auto-discovery (a session is only opened on a cache miss or new property)
+    started = perf_counter()
+    discover_properties(factory_id, device_id, valid_data.keys())
+    _DISCOVERY.observe(perf_counter() - started)
+
+    _store_message(factory_id, device_id, valid_data, timestamp)
+
+async def process_message_async(factory_id: str, device_id: str, payload: dict,
+                                timestamp: datetime.datetime = None, executor=None):
+    """
+    process_message for the asyncio engine: the same steps, but discovery
+    only leaves the event loop (for `executor`) when it needs MySQL.
+    """
+    valid_data = _accept_message(factory_id, device_id, payload, timestamp)
+    if not valid_data:
+        return
+
+    started = perf_counter()
+    if not property_registry.known(factory_id, device_id, valid_data):
+        await asyncio.get_running_loop().run_in_executor(
+            executor, discover_properties, factory_id, device_id, list(valid_data))
+    _DISCOVERY.observe(perf_counter() - started)
+
+    _store_message(factory_id, device_id, valid_data, timestamp)
+
+def process_batch(factory_id: str, device_id: str, samples: list):
+    """
+    Process several samples from one device message ([(timestamp, values), ...]).
+
+    Same steps as process_message, but discovery, the Influx write and the
+    Rule Engine publish each run once for the whole batch.
+    """
+    accepted = _accept_batch(factory_id, device_id, samples)
+    if not accepted:
+        return
+    valid_samples, names = accepted
+
+    started = perf_counter()
+    discover_properties(factory_id, device_id, names)
+    _DISCOVERY.observe(perf_counter() - started)
+
+    _store_batch(factory_id, device_id, valid_samples)
+
+async def process_batch_async(factory_id: str, device_id: str, samples: list, executor=None):
+    """process_batch for the asyncio engine, see process_message_async."""
+    accepted = _accept_batch(factory_id, device_id, samples)
+    if not accepted:
+        return
+    valid_samples, names = accepted
+
+    started = perf_counter()
+    if not property_registry.known(factory_id, device_id, names):
+        await asyncio.get_running_loop().run_in_executor(
+            executor, discover_properties, factory_id, device_id, names)
+    _DISCOVERY.observe(perf_counter() - started)
+
+    _store_batch(factory_id, device_id, valid_samples)
+
+def _accept_message(factory_id: str, device_id: str, payload: dict, timestamp: datetime.datetime) -> dict:
+    # 0. Reject unknown / inactive / maintenance devices without a DB hit
+    if not admit(factory_id, device_id, [(timestamp, payload)]):
+        return None
+
+    # 1. Validate payload (numeric/bool only, invalid fields are counted by the decoder)
+    started = perf_counter()
+    valid_data = payload_decoder.validate(payload)
+    _VALIDATE.observe(perf_counter() - started)
+
+    if valid_data:
+        STATS["messages"] += 1
+        MESSAGES.labels(factory_label(factory_id)).inc()
+    return valid_data
+
+def _store_message(factory_id: str, device_id: str, valid_data: dict, timestamp: datetime.datetime):
+    # Deadband: values that did not move out of their band are not stored
+    started = perf_counter()
+    seen_at = timestamp or datetime.datetime.utcnow()
+    forwarded = deadband_filter.apply(
+        factory_id, device_id, valid_data, property_registry.deadbands(factory_id, device_id), seen_at)
+    now = perf_counter()
+    _DEADBAND.observe(now - started)
+
     # 3. Write to InfluxDB
-    try:
-        influx_service.write_point(factory_id, device_id, valid_data, timestamp)
-    except Exception as e:
-        logger.error(f"Error writing to InfluxDB: {e}")
+    if forwarded:
+        started = now
+        try:
+            influx_service.write_point(factory_id, device_id, forwarded, timestamp)
+        except Exception as e:
+            logger.error(f"Error writing to InfluxDB: {e}")
+        now = perf_counter()
+        _INFLUX.observe(now - started)
 
-    # 4. Update Device Last Seen (Async/Debounced? For now direct synchronous update or skip for performance)
-    # LLD 4.1 Step 4: async debounced. We'll skip for high throughput prototype or do simple update
-    try:
-         # Update Last Seen
-         pass 
-    except:
-         pass
+    # 4. Update Device Last Seen (LLD 4.1 Step 4: async, debounced per device)
+    started = now
+    last_seen_updater.touch(factory_id, device_id, seen_at)
+    now = perf_counter()
+    _LAST_SEEN.observe(now - started)
+
+    # Current state, including values the deadband kept out of InfluxDB
+    started = now
+    latest_values.update(factory_id, device_id, valid_data, seen_at)
+    now = perf_counter()
+    _LATEST.observe(now - started)
 
-    # 5. Publish to Rule Engine
+    started = now
+    rollup_aggregator.add(factory_id, device_id, valid_data, seen_at)
+    now = perf_counter()
+    _ROLLUP.observe(now - started)
+
+    # 5. Publish to Rule Engine, with every current value so rules over
+    # several properties still see the ones that were filtered out
+    if not forwarded:
+        return
+    started = now
     try:
         event = {
             "factory_id": factory_id,
             "device_id": device_id,
             "properties": valid_data,
-            "timestamp": timestamp.isoformat() if timestamp else datetime.datetime.utcnow().isoformat()
+            "timestamp": seen_at.isoformat()
         }
         rule_engine_queue.publish(event)
     except Exception as e:
         logger.error(f"Error publishing to Rule Engine: {e}")
+    _PUBLISH.observe(perf_counter() - started)
+
+def _accept_batch(factory_id: str, device_id: str, samples: list) -> tuple:
+    # ([(timestamp, valid values), ...], property names), or None if nothing is left
+    if not admit(factory_id, device_id, samples):
+        return None
+
+    started = perf_counter()
+    valid_samples = []
+    names = set()
+    for timestamp, values in samples:
+        valid_data = payload_decoder.validate(values)
+        if valid_data:
+            valid_samples.append((timestamp or datetime.datetime.utcnow(), valid_data))
+            names.update(valid_data)
+    _VALIDATE.observe(perf_counter() - started)
+
+    if not valid_samples:
+        return None
+    STATS["messages"] += len(valid_samples)
+    MESSAGES.labels(factory_label(factory_id)).inc(len(valid_samples))
+    return valid_samples, names
+
+def _store_batch(factory_id: str, device_id: str, valid_samples: list):
+    # (timestamp, values to store, all values) of the samples that passed the deadband
+    started = perf_counter()
+    deadbands = property_registry.deadbands(factory_id, device_id)
+    forwarded_samples = []
+    for ts, valid_data in valid_samples:
+        forwarded = deadband_filter.apply(factory_id, device_id, valid_data, deadbands, ts)
+        if forwarded:
+            forwarded_samples.append((ts, forwarded, valid_data))
+    now = perf_counter()
+    _DEADBAND.observe(now - started)
+
+    if forwarded_samples:
+        started = now
+        try:
+            influx_service.write_samples(factory_id, device_id, [(ts, f) for ts, f, _ in forwarded_samples])
+        except Exception as e:
+            logger.error(f"Error writing to InfluxDB: {e}")
+        now = perf_counter()
+        _INFLUX.observe(now - started)
+
+    started = now
+    last_seen_updater.touch(factory_id, device_id, max(ts for ts, _ in valid_samples))
+    now = perf_counter()
+    _LAST_SEEN.observe(now - started)
+
+    started = now
+    for ts, valid_data in valid_samples:
+        latest_values.update(factory_id, device_id, valid_data, ts)
+    now = perf_counter()
+    _LATEST.observe(now - started)
+
+    started = now
+    for ts, valid_data in valid_samples:
+        rollup_aggregator.add(factory_id, device_id, valid_data, ts)
+    now = perf_counter()
+    _ROLLUP.observe(now - started)
+
+    if not forwarded_samples:
+        return
+    started = now
+    try:
+        rule_engine_queue.publish_many([
+            {
+                "factory_id": factory_id,
+                "device_id": device_id,
+                "properties": valid_data,
+                "timestamp": ts.isoformat()
+            }
+            for ts, _, valid_data in forwarded_samples
+        ])
+    except Exception as e:
+        logger.error(f"Error publishing to Rule Engine: {e}")
+    _PUBLISH.observe(perf_counter() - started)
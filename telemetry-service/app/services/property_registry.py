@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from sqlalchemy import insert
+from app.core.config import settings
+from app.models.models import DeviceProperty, generate_uuid
+from app.services.deadband import deadband_from_columns, encode_deadband, decode_deadband
+import datetime
+import logging
+import threading
+import time
+import redis
+
+logger = logging.getLogger("property-registry")
+
+class PropertyRegistry:
+    """
+    Known property names per (factory_id, device_id) for auto-discovery.
+
+    Entries live in a bounded LRU with a TTL. An optional Redis tier
+    (one hash per device) is shared between telemetry replicas so a fresh
+    replica does not have to warm its cache from MySQL; it is only ever
+    written with a device's full property set. Each entry also holds the
+    deadband settings of the device's filtered properties. The API service
+    drops the shared hash and publishes a device invalidation when they
+    change, which DeviceRegistry passes on to `invalidate`.
+    """
+    def __init__(self, max_devices: int, ttl: float, redis_client=None, redis_ttl: int = 3600):
+        self.max_devices = max_devices
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+        self._entries = OrderedDict() # (factory_id, device_id) -> (expires_at, frozenset, deadbands)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.evictions = 0
+        self.registered = 0
+
+    def register(self, db, factory_id: str, device_id: str, names) -> list:
+        """
+        Make sure every name in `names` is registered for the device.
+        Returns the names that were newly discovered.
+        """
+        key = (factory_id, device_id)
+        entry = self._get(key)
+        if entry is None:
+            entry = self._load(db, factory_id, device_id)
+        known, deadbands = entry
+
+        new_props = [n for n in names if n not in known]
+        if new_props:
+            self._insert(db, factory_id, device_id, new_props)
+            self._put(key, known.union(new_props), deadbands)
+            # Dropped rather than extended: a hash holding only the new names
+            # (after the old one expired) would look complete to other replicas
+            self._unshare(factory_id, device_id)
+            self.registered += len(new_props)
+        return new_props
+
+    def known(self, factory_id: str, device_id: str, names) -> bool:
+        """
+        True if every name is cached for the device, so `register` would not
+        need the database. Counted as a hit; a miss is left to `register`.
+        """
+        key = (factory_id, device_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic() or not entry[1].issuperset(names):
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def deadbands(self, factory_id: str, device_id: str) -> dict:
+        """Deadband settings by property name for a device registered earlier."""
+        entry = self._entries.get((factory_id, device_id))
+        return entry[2] if entry is not None else {}
+
+    def invalidate(self, factory_id: str, device_id: str):
+        """Drop the device's entry, e.g. after its deadband settings changed."""
+        with self._lock:
+            self._entries.pop((factory_id, device_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "registered": self.registered,
+        }
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            return None
+
+    def _put(self, key, names: frozenset, deadbands: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, names, deadbands)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_devices:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _load(self, db, factory_id: str, device_id: str) -> tuple:
+        props = self._load_shared(factory_id, device_id)
+        if props:
+            self.shared_hits += 1
+        else:
+            rows = db.query(
+                DeviceProperty.property_name,
+                DeviceProperty.deadband_abs,
+                DeviceProperty.deadband_pct,
+                DeviceProperty.max_silence_seconds,
+            ).filter(
+                DeviceProperty.device_id == device_id,
+                DeviceProperty.factory_id == factory_id
+            ).all()
+            props = {r[0]: deadband_from_columns(r[1], r[2], r[3]) for r in rows}
+            self._share(factory_id, device_id, props)
+        names = frozenset(props)
+        deadbands = {name: d for name, d in props.items() if d is not None}
+        self._put((factory_id, device_id), names, deadbands)
+        return names, deadbands
+
+    def _insert(self, db, factory_id: str, device_id: str, names: list):
+        # One INSERT IGNORE for all new properties; rows another replica
+        # registered concurrently are skipped by uq_dp_device_property.
+        now = datetime.datetime.utcnow()
+        rows = [
+            {
+                "id": generate_uuid(),
+                "factory_id": factory_id,
+                "device_id": device_id,
+                "property_name": name,
+                "data_type": "float", # Defaulting for now as per minimal impl
+                "first_seen_at": now,
+                "last_seen_at": now,
+            }
+            for name in names
+        ]
+        stmt = insert(DeviceProperty).values(rows) \
+            .prefix_with("IGNORE", dialect="mysql") \
+            .prefix_with("OR IGNORE", dialect="sqlite")
+        db.execute(stmt)
+        db.commit()
+
+    def _redis_key(self, factory_id: str, device_id: str) -> str:
+        return f"telemetry:props:{factory_id}:{device_id}"
+
+    def _load_shared(self, factory_id: str, device_id: str) -> dict:
+        # Hash fields are property names, values the encoded deadband ("" if none)
+        if self.redis_client is None:
+            return {}
+        try:
+            shared = self.redis_client.hgetall(self._redis_key(factory_id, device_id))
+            return {name: decode_deadband(value) for name, value in shared.items()}
+        except (redis.RedisError, ValueError, TypeError) as e:
+            logger.warning(f"Shared property cache unavailable: {e}")
+            return {}
+
+    def _share(self, factory_id: str, device_id: str, props: dict):
+        if self.redis_client is None or not props:
+            return
+        key = self._redis_key(factory_id, device_id)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(key, mapping={n: encode_deadband(d) for n, d in props.items()})
+            pipe.expire(key, self.redis_ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Shared property cache unavailable: {e}")
+
+    def _unshare(self, factory_id: str, device_id: str):
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.delete(self._redis_key(factory_id, device_id))
+        except redis.RedisError as e:
+            logger.warning(f"Shared property cache unavailable: {e}")
+
+def _shared_client():
+    if not settings.PROPERTY_CACHE_REDIS:
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+property_registry = PropertyRegistry(
+    max_devices=settings.PROPERTY_CACHE_MAX_DEVICES,
+    ttl=settings.PROPERTY_CACHE_TTL_SECONDS,
+    redis_client=_shared_client(),
+    redis_ttl=settings.PROPERTY_CACHE_REDIS_TTL_SECONDS,
+)
@@ -1,20 +1,201 @@
 import redis
 import json
+import logging
+import threading
+import time
+from collections import deque
 from app.core.config import settings
 
+logger = logging.getLogger("redis-publisher")
+
+class BatchPublisher:
+    """
+    Accumulates messages for one Redis list and pushes them with multi-value
+    LPUSH commands sent in a single pipeline, on a size or time budget.
+
+    While Redis is unreachable messages stay in a bounded local buffer (the
+    oldest are dropped once it is full) and the flush is retried with backoff.
+    Messages are pushed oldest first, so consumers popping from the right
+    (RPOP) see them in publish order.
+    """
+    def __init__(self, client_factory, key: str, batch_size: int, flush_interval: float,
+                 max_buffer: int, retry_interval: float = 1.0):
+        self._client_factory = client_factory
+        self._client = None
+        self.key = key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+        # Counters
+        self.published = 0
+        self.dropped = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.connects = 0
+        self.last_rtt = 0.0
+        self.max_rtt = 0.0
+
+    def __len__(self):
+        """Messages waiting to be pushed."""
+        return len(self._buffer)
+
+    def publish(self, message: dict):
+        self.publish_many([message])
+
+    def publish_many(self, messages: list):
+        data = [json.dumps(m) for m in messages]
+        with self._cond:
+            self._buffer.extend(data)
+            while len(self._buffer) > self.max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"publisher-{self.key}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if not self.flush() and self._buffer:
+            logger.error(f"Final flush to {self.key} failed, {len(self._buffer)} messages lost")
+
+    def flush(self) -> bool:
+        """Push everything buffered in one pipeline. Returns False on failure."""
+        with self._flush_lock:
+            pending = self.take()
+            if not pending:
+                return True
+
+            started = time.perf_counter()
+            try:
+                pipe = self._get_client().pipeline(transaction=False)
+                for i in range(0, len(pending), self.batch_size):
+                    pipe.lpush(self.key, *pending[i:i + self.batch_size])
+                pipe.execute()
+            except redis.RedisError as e:
+                self._client = None
+                self._failed(pending, e)
+                return False
+            self._pushed(len(pending), time.perf_counter() - started)
+            return True
+
+    def take(self) -> list:
+        """
+        Empty the buffer, oldest message first. The asyncio ingest engine
+        pushes these itself and reports back through `_pushed` or `_failed`.
+        """
+        with self._cond:
+            pending = list(self._buffer)
+            self._buffer.clear()
+        return pending
+
+    def stats(self) -> dict:
+        return {
+            "buffer_depth": len(self._buffer),
+            "published": self.published,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "avg_batch_size": round(self.published / self.batches, 2) if self.batches else 0.0,
+            "flush_errors": self.flush_errors,
+            "connects": self.connects,
+            "last_rtt_ms": round(self.last_rtt * 1000, 3),
+            "max_rtt_ms": round(self.max_rtt * 1000, 3),
+        }
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+            self.connects += 1
+        return self._client
+
+    def _pushed(self, count: int, rtt: float):
+        self.last_rtt = rtt
+        self.max_rtt = max(self.max_rtt, rtt)
+        self.batches += 1
+        self.published += count
+
+    def _failed(self, pending: list, error: Exception):
+        self.flush_errors += 1
+        logger.error(f"Error publishing {len(pending)} messages to {self.key}: {error}")
+        self._requeue(pending)
+
+    def _requeue(self, pending: list):
+        # Failed messages go back in front of anything published meanwhile,
+        # trimming the oldest if the buffer overflows.
+        with self._cond:
+            self._buffer.extendleft(reversed(pending))
+            while len(self._buffer) > self.max_buffer:
+                self._buffer.popleft()
+                self.dropped += 1
+
+    def _run(self):
+        retry_delay = self.retry_interval
+        while True:
+            with self._cond:
+                if self._running and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if not self._running:
+                    return
+
+            if self.flush():
+                retry_delay = self.retry_interval
+            else:
+                with self._cond:
+                    self._cond.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+
+
 class RedisService:
     def __init__(self):
-        try:
-            self.redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-            self.redis_client.ping()
-        except redis.ConnectionError:
-            print("Redis connection failed")
-            # Should retry or exit, for now simple fail log
+        # Connections are opened lazily and re-established by the publisher,
+        # so a Redis outage at startup is no longer fatal.
+        self.redis_client = None
+        self.publisher = BatchPublisher(
+            self._connect,
+            "events_queue",
+            batch_size=settings.EVENT_BATCH_SIZE,
+            flush_interval=settings.EVENT_FLUSH_INTERVAL_MS / 1000,
+            max_buffer=settings.EVENT_MAX_BUFFER,
+        )
+
+    def start(self):
+        self.publisher.start()
+
+    def stop(self):
+        self.publisher.stop()
 
     def publish(self, message: dict):
-        self.redis_client.lpush("events_queue", json.dumps(message))
+        self.publisher.publish(message)
+
+    def publish_many(self, messages: list):
+        self.publisher.publish_many(messages)
 
     def get_client(self):
+        return self.redis_client or self._connect()
+
+    def _connect(self):
+        if self.redis_client is not None:
+            self.redis_client.close()
+        self.redis_client = redis.Redis.from_url(settings.REDIS_URL)
         return self.redis_client
 
 rule_engine_queue = RedisService()
@@ -0,0 +1,202 @@
+from app.core.config import settings
+from app.core.influx import influx_service
+from app.core.line_protocol import to_nanoseconds
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger("rollups")
+
+ROLLUP_MEASUREMENT = "device_metrics_1m"
+WINDOW_SECONDS = 60
+LATE_POLICIES = ("drop", "update")
+
+class RollupAggregator:
+    """
+    Per-minute min/max/mean/sum/count of every numeric property, computed
+    while ingesting so reports and dashboards can read ROLLUP_MEASUREMENT
+    instead of aggregating raw device_metrics points. Values are aggregated
+    before the deadband, so rollups are exact even for filtered properties.
+
+    Windows are aligned to the minute of the sample timestamp and written
+    (one point per device and property, at the window start) once the
+    ingest clock is `grace_seconds` past their end. Samples for a window
+    already written are late, which is normal for gateway batches and
+    buffered devices:
+      - update: written windows are kept for `late_retention_seconds` and a
+        late sample re-writes the window's full aggregate, which replaces
+        the earlier point in InfluxDB. Older samples are dropped.
+      - drop: counted and ignored.
+    Samples more than `max_future_seconds` ahead of the ingest clock are
+    dropped too, as their windows would stay open until the clock caught up.
+    Windows still open at shutdown are written as they are.
+    """
+    def __init__(self, write_fn, grace_seconds: float = 10.0, late_policy: str = "update",
+                 late_retention_seconds: float = 3600.0, max_future_seconds: float = 300.0,
+                 check_interval: float = 1.0, enabled: bool = True, clock=time.time):
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"Unknown rollup late policy: {late_policy}")
+        self._write_fn = write_fn
+        self.grace_seconds = grace_seconds
+        self.late_policy = late_policy
+        self.late_retention_seconds = late_retention_seconds
+        self.max_future_seconds = max_future_seconds
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self._clock = clock
+
+        # window start (epoch seconds) -> {(factory_id, device_id): {property: [min, max, sum, count]}}
+        self._open = {}
+        self._closed = {} # written windows kept for the update policy
+        self._dirty = {} # window start -> devices of closed windows changed by late samples
+        self._closed_before = None # windows starting before this have been written
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.samples = 0
+        self.points_written = 0
+        self.late_updates = 0
+        self.late_dropped = 0
+        self.future_dropped = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def add(self, factory_id: str, device_id: str, values: dict, timestamp):
+        if not self.enabled:
+            return
+        seconds = to_nanoseconds(timestamp) // 1_000_000_000
+        if seconds > self._clock() + self.max_future_seconds:
+            self.future_dropped += 1
+            return
+        start = seconds // WINDOW_SECONDS * WINDOW_SECONDS
+        key = (factory_id, device_id)
+        with self._lock:
+            if self._closed_before is not None and start < self._closed_before:
+                window = self._closed.get(start)
+                if window is None:
+                    self.late_dropped += 1
+                    return
+                self._dirty.setdefault(start, set()).add(key)
+                self.late_updates += 1
+            else:
+                window = self._open.get(start)
+                if window is None:
+                    window = self._open[start] = {}
+            series = window.get(key)
+            if series is None:
+                series = window[key] = {}
+            for name, value in values.items():
+                # Booleans are states, not measurements
+                if type(value) is bool or (type(value) is float and not math.isfinite(value)):
+                    continue
+                agg = series.get(name)
+                if agg is None:
+                    series[name] = [value, value, value, 1]
+                    continue
+                if value < agg[0]:
+                    agg[0] = value
+                elif value > agg[1]:
+                    agg[1] = value
+                agg[2] += value
+                agg[3] += 1
+            self.samples += 1
+
+    def start(self):
+        if self._thread or not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush(close_all=True)
+
+    def flush(self, close_all: bool = False) -> int:
+        """Write windows that are due, and closed windows changed by late samples. Returns points written."""
+        cutoff = int((self._clock() - self.grace_seconds) // WINDOW_SECONDS * WINDOW_SECONDS)
+        with self._lock:
+            due = sorted(s for s in self._open if close_all or s < cutoff)
+            closing = {s: self._open.pop(s) for s in due}
+            dirty, self._dirty = self._dirty, {}
+            # Built under the lock: closed windows keep changing with late samples
+            rows = {}
+            for start, window in closing.items():
+                for key, series in window.items():
+                    rows.setdefault(key, []).extend(self._rows(start, series))
+            for start, keys in dirty.items():
+                for key in keys:
+                    rows.setdefault(key, []).extend(self._rows(start, self._closed[start][key]))
+
+            if not close_all and (self._closed_before is None or cutoff > self._closed_before):
+                self._closed_before = cutoff
+            if self.late_policy == "update":
+                self._closed.update(closing)
+                oldest = cutoff - self.late_retention_seconds
+                for start in [s for s in self._closed if s < oldest]:
+                    del self._closed[start]
+
+        written = 0
+        for (factory_id, device_id), device_rows in rows.items():
+            try:
+                self._write_fn(factory_id, device_id, device_rows)
+                written += len(device_rows)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error writing rollups for {device_id}: {e}")
+        if rows:
+            self.flushes += 1
+            self.points_written += written
+        return written
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "late_policy": self.late_policy,
+            "open_windows": len(self._open),
+            "retained_windows": len(self._closed),
+            "samples": self.samples,
+            "points_written": self.points_written,
+            "late_updates": self.late_updates,
+            "late_dropped": self.late_dropped,
+            "future_dropped": self.future_dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+    @staticmethod
+    def _rows(start: int, series: dict) -> list:
+        # Floats throughout, so an int property does not conflict with the
+        # field type once a float value arrives
+        return [
+            (start * 1_000_000_000, name, {
+                "min": float(lo),
+                "max": float(hi),
+                "mean": total / count,
+                "sum": float(total),
+                "count": count,
+            })
+            for name, (lo, hi, total, count) in series.items()
+        ]
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.flush()
+
+def _write_rollups(factory_id: str, device_id: str, rows: list):
+    influx_service.write_rollups(factory_id, device_id, rows)
+
+rollup_aggregator = RollupAggregator(
+    _write_rollups,
+    grace_seconds=settings.ROLLUP_GRACE_SECONDS,
+    late_policy=settings.ROLLUP_LATE_POLICY,
+    late_retention_seconds=settings.ROLLUP_LATE_RETENTION_SECONDS,
+    max_future_seconds=settings.ROLLUP_MAX_FUTURE_SECONDS,
+    enabled=settings.ROLLUPS_ENABLED,
+)
@@ -0,0 +1,299 @@
+from app.core.config import settings
+from app.services.ingest import shard_for
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+logger = logging.getLogger("ingest-shards")
+
+class ShardSupervisor:
+    """
+    Multi-process ingestion (INGEST_PROCESSES > 1). Decoding, validation and
+    line-protocol encoding are CPU-bound and share one core under the GIL,
+    so the supervisor runs `processes` shard processes and hands each raw
+    message to the one owning its device (shard_for, the same hash the
+    thread pipeline uses), so every device is processed in order by one
+    process. Each shard has its own property registry, deadband state,
+    device snapshot, Influx writer and event publisher.
+
+    Takes the place of IngestPipeline inside MQTTClient: paho's thread only
+    parses the topic and calls `submit`. Messages are handed off in batches
+    of up to `batch_size`, at least every `flush_interval` seconds. When a
+    shard's inbox stays full for `block_timeout` seconds the batch is dropped
+    and counted.
+    """
+    def __init__(self, processes: int, batch_size: int, flush_interval: float, queue_size: int,
+                 block_timeout: float, stats_interval: float = 5.0, initializer=None):
+        self.processes = processes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Inbox capacity in batches, from the total message capacity
+        self.inbox_batches = max(1, queue_size // processes // batch_size)
+        self.block_timeout = block_timeout
+        self.stats_interval = stats_interval
+        self.initializer = initializer
+
+        self._buffers = [[] for _ in range(processes)]
+        self._locks = [threading.Lock() for _ in range(processes)]
+        self._inboxes = []
+        self._stats_queue = None
+        self._procs = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._shard_stats = {}
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def start(self):
+        if self._procs:
+            return
+        # spawn: children import the app afresh instead of inheriting
+        # threads and connections from this process
+        ctx = multiprocessing.get_context("spawn")
+        self._stats_queue = ctx.Queue()
+        self._inboxes = [ctx.Queue(self.inbox_batches) for _ in range(self.processes)]
+        for index, inbox in enumerate(self._inboxes):
+            p = ctx.Process(
+                target=run_shard,
+                args=(index, inbox, self._stats_queue, self.stats_interval, self.initializer),
+                name=f"ingest-shard-{index}",
+                daemon=True,
+            )
+            p.start()
+            self._procs.append(p)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-handoff", daemon=True)
+        self._thread.start()
+        logger.info(f"Started {self.processes} ingest shard processes")
+
+    def stop(self, timeout: float = 30.0):
+        """Hand off what is buffered, then let every shard drain and exit."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        deadline = time.monotonic() + timeout
+        for index in range(self.processes):
+            self._flush(index)
+            if not self._send_stop(index, deadline):
+                logger.error(f"{self._procs[index].name} is not taking messages, terminating")
+                self._procs[index].terminate()
+        # Keep reading stats while waiting: a child cannot exit while its
+        # last reports are stuck in a full pipe
+        while any(p.is_alive() for p in self._procs) and time.monotonic() < deadline:
+            self._collect_stats()
+            time.sleep(0.05)
+        for p in self._procs:
+            if p.is_alive():
+                logger.error(f"{p.name} did not stop within {timeout}s, terminating")
+                p.terminate()
+            p.join()
+        self._collect_stats()
+        self._procs = []
+
+    def _send_stop(self, index: int, deadline: float) -> bool:
+        """Queue the stop marker behind the shard's last batch; False if it never fits."""
+        while True:
+            try:
+                self._inboxes[index].put(None, timeout=0.05)
+                return True
+            except queue.Full:
+                self._collect_stats()
+                if time.monotonic() >= deadline or not self._procs[index].is_alive():
+                    return False
+
+    def submit(self, factory_id: str, device_id: str, payload: bytes, fmt: str = "json") -> bool:
+        index = shard_for(factory_id, device_id, self.processes)
+        with self._locks[index]:
+            self._buffers[index].append((factory_id, device_id, payload, fmt))
+            self.enqueued += 1
+            if len(self._buffers[index]) < self.batch_size:
+                return True
+        return self._flush(index)
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until every shard has started and reported in."""
+        deadline = time.monotonic() + timeout
+        while len(self._collect_stats()) < self.processes:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        shards = self._collect_stats()
+        return {
+            "processes": self.processes,
+            "alive": sum(p.is_alive() for p in self._procs),
+            "queue_depth": sum(len(b) for b in self._buffers) + self._inbox_depth(),
+            "enqueued": self.enqueued,
+            "processed": sum(s["processed"] for s in shards.values()),
+            "dropped": self.dropped,
+            "spilled": 0,
+            "errors": sum(s["errors"] for s in shards.values()),
+            "handoff_batches": self.batches,
+            "shards": [shards.get(i) for i in range(self.processes)],
+        }
+
+    def totals(self, component: str) -> dict:
+        """A component's stats() combined over the shards that reported it."""
+        return merge_stats([s[component] for s in self._collect_stats().values() if component in s])
+
+    def metric_snapshots(self) -> list:
+        """The latest metrics registry snapshot of every shard."""
+        return [s["metrics"] for s in self._collect_stats().values() if "metrics" in s]
+
+    def _flush(self, index: int) -> bool:
+        # The lock is held across the put so batches of a shard reach its
+        # inbox in order
+        with self._locks[index]:
+            batch, self._buffers[index] = self._buffers[index], []
+            if not batch:
+                return True
+            try:
+                self._inboxes[index].put(batch, timeout=self.block_timeout)
+            except queue.Full:
+                self.dropped += len(batch)
+                logger.warning(f"Ingest shard {index} is full, dropped {len(batch)} messages")
+                return False
+            self.batches += 1
+            return True
+
+    def _inbox_depth(self) -> int:
+        # Batches, not messages; qsize is not available everywhere
+        try:
+            return sum(inbox.qsize() for inbox in self._inboxes) * self.batch_size
+        except NotImplementedError:
+            return 0
+
+    def _collect_stats(self) -> dict:
+        while self._stats_queue is not None:
+            try:
+                index, stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._shard_stats[index] = stats
+        return self._shard_stats
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            for index in range(self.processes):
+                if self._buffers[index]:
+                    self._flush(index)
+            self._collect_stats()
+
+
+def merge_stats(reports: list) -> dict:
+    """
+    Counters and gauges are summed, max_* values take the maximum. Ratios,
+    averages and last_* values cannot be summed and are averaged over the
+    shards; anything else (policy names, flags) is taken from the first.
+    """
+    merged = {}
+    for key in (reports[0] if reports else {}):
+        values = [r[key] for r in reports]
+        if not all(isinstance(v, (int, float)) and type(v) is not bool for v in values):
+            merged[key] = values[0]
+        elif key.startswith("max_"):
+            merged[key] = max(values)
+        elif key.endswith("_ratio") or key.startswith(("avg_", "last_")):
+            merged[key] = round(sum(values) / len(values), 4)
+        else:
+            merged[key] = sum(values)
+    return merged
+
+def run_shard(index: int, inbox, stats_queue, stats_interval: float, initializer=None):
+    """Entry point of a shard process."""
+    # Shutdown is driven by the supervisor, not by Ctrl-C reaching the group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Each shard spools to its own directory
+    if settings.INFLUX_SPOOL_DIR:
+        settings.INFLUX_SPOOL_DIR = os.path.join(settings.INFLUX_SPOOL_DIR, f"shard-{index}")
+
+    # Imported here, after the shard's settings are applied, so this process
+    # builds its own caches, writers and connections
+    from app.core.influx import influx_service
+    from app.core.metrics import registry
+    from app.services import processor
+    from app.services.decoder import payload_decoder
+    from app.services.deadband import deadband_filter
+    from app.services.device_registry import device_registry
+    from app.services.last_seen import last_seen_updater
+    from app.services.latest_values import latest_values
+    from app.services.rollups import rollup_aggregator
+    from app.services.mqtt_client import mqtt_app
+    from app.services.property_registry import property_registry
+    from app.services.redis_service import rule_engine_queue
+
+    if initializer is not None:
+        initializer(index)
+    influx_service.start()
+    device_registry.start()
+    last_seen_updater.start()
+    latest_values.start()
+    rollup_aggregator.start()
+    rule_engine_queue.start()
+
+    counters = {"processed": 0, "errors": 0}
+
+    def report():
+        stats_queue.put((index, {
+            "pid": os.getpid(),
+            **counters,
+            "decoder": payload_decoder.stats(),
+            "processor": processor.get_stats(),
+            "devices": device_registry.stats(),
+            "property_cache": property_registry.stats(),
+            "deadband": deadband_filter.stats(),
+            "last_seen": last_seen_updater.stats(),
+            "latest_values": latest_values.stats(),
+            "rollups": rollup_aggregator.stats(),
+            "influx_writer": influx_service.writer.stats(),
+            "influx_spool": influx_service.spool_stats(),
+            "event_publisher": rule_engine_queue.publisher.stats(),
+            "metrics": registry.snapshot(),
+        }))
+
+    report()
+    next_report = time.monotonic() + stats_interval
+    try:
+        while True:
+            try:
+                batch = inbox.get(timeout=stats_interval)
+            except queue.Empty:
+                batch = ()
+            if batch is None:
+                break
+            for factory_id, device_id, payload, fmt in batch:
+                try:
+                    mqtt_app.handle_payload(factory_id, device_id, payload, fmt)
+                    counters["processed"] += 1
+                except Exception as e:
+                    counters["errors"] += 1
+                    logger.error(f"Error processing message for {device_id}: {e}")
+            if time.monotonic() >= next_report:
+                report()
+                next_report = time.monotonic() + stats_interval
+    finally:
+        rule_engine_queue.stop()
+        last_seen_updater.stop()
+        latest_values.stop()
+        rollup_aggregator.stop()
+        device_registry.stop()
+        influx_service.close()
+        report()
+
+shard_supervisor = ShardSupervisor(
+    processes=max(1, settings.INGEST_PROCESSES),
+    batch_size=settings.INGEST_HANDOFF_BATCH,
+    flush_interval=settings.INGEST_HANDOFF_INTERVAL_MS / 1000,
+    queue_size=settings.INGEST_QUEUE_SIZE,
+    block_timeout=settings.INGEST_BLOCK_TIMEOUT_MS / 1000,
+)
@@ -0,0 +1,64 @@
+"""
+Microbenchmark: old on_message decode + isinstance validation vs PayloadDecoder.
+
+Run from the telemetry-service directory:
+    python -m benchmarks.bench_decoder
+"""
+import json
+import logging
+import random
+import timeit
+from app.services.decoder import PayloadDecoder, DECODERS
+
+FIELD_COUNTS = (5, 20, 50)
+
+def make_payload(fields: int, seed: int = 42) -> bytes:
+    rnd = random.Random(seed)
+    payload = {}
+    for i in range(fields):
+        kind = i % 10
+        if kind == 0:
+            payload[f"status_{i}"] = "running" # Invalid, dropped by validation
+        elif kind == 1:
+            payload[f"alarm_{i}"] = rnd.random() > 0.5
+        elif kind == 2:
+            payload[f"count_{i}"] = rnd.randint(0, 100000)
+        else:
+            payload[f"sensor_{i}"] = round(rnd.uniform(-50, 500), 3)
+    return json.dumps(payload).encode()
+
+# Warnings are built as in production but not written anywhere
+logger = logging.getLogger("bench-decoder")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+def old_path(raw: bytes) -> dict:
+    # on_message + step 1 of process_message before the decoder layer
+    payload = json.loads(raw.decode())
+    valid = {}
+    for k, v in payload.items():
+        if isinstance(v, (int, float, bool)):
+            valid[k] = v
+        else:
+            logger.warning(f"Invalid data type for {k}: {type(v)} in device dev-bench")
+    return valid
+
+def best_of(fn, number: int, repeat: int = 5) -> float:
+    # Min of several runs is the most stable estimate on a noisy machine
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+def main(number: int = 20000):
+    logging.getLogger("telemetry-decoder").disabled = True
+    decoders = {name: PayloadDecoder(name) for name in DECODERS}
+    print(f"{'fields':>6} {'path':>10} {'us/msg':>8} {'speedup':>8}")
+    for fields in FIELD_COUNTS:
+        raw = make_payload(fields)
+        baseline = best_of(lambda: old_path(raw), number)
+        print(f"{fields:>6} {'old':>10} {baseline * 1e6:>8.2f} {1.0:>8.2f}")
+        for name, decoder in decoders.items():
+            assert decoder.validate(decoder.decode(raw)) == old_path(raw)
+            elapsed = best_of(lambda: decoder.validate(decoder.decode(raw)), number)
+            print(f"{fields:>6} {name:>10} {elapsed * 1e6:>8.2f} {baseline / elapsed:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+End-to-end ingestion throughput against a simulated device fleet.
+
+Drives process_message directly ("process" mode, one thread), the full
+MQTTClient -> IngestPipeline path through the in-process broker used by the
+tests ("mqtt" mode), or the ShardSupervisor with --processes shard processes
+("shards" mode, throughput only). InfluxDB, Redis and MySQL are replaced by in-process
+fakes (see benchmarks/fleet.py); encoding, batching, discovery and last-seen
+flushing all run for real.
+
+Reports msgs/s (median of --repeat runs, after a warm-up run), p50/p99 per
+stage and memory growth across the measured runs. Each run starts from an
+empty database; unless --cold is given every device sends one untimed
+message first, so the numbers reflect steady state (warm property cache)
+plus whatever --churn adds. The fleet is seeded, so runs are comparable
+across commits on the same machine.
+
+Run from the telemetry-service directory:
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --mode mqtt --devices 2000 --churn 0.01
+    python -m benchmarks.bench_ingest --rate 5000 --trace-memory
+    python -m benchmarks.bench_ingest --mode shards --processes 4
+"""
+import argparse
+import functools
+import gc
+import logging
+import resource
+import statistics
+import time
+import tracemalloc
+from app.core.influx import influx_service
+from app.services import processor
+from app.services.decoder import payload_decoder
+from app.services.device_registry import device_registry
+from app.services.last_seen import last_seen_updater
+from app.services.mqtt_client import MQTTClient
+from app.services.property_registry import property_registry
+from app.services.redis_service import rule_engine_queue
+from app.services.shards import ShardSupervisor
+from benchmarks.fleet import FleetSimulator, FakeInflux, FakeRedis, FakeMySQL, StageTimer
+from tests.local_broker import LocalBroker
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("process", "mqtt", "shards"), default="process")
+    parser.add_argument("--processes", type=int, default=2, help="shard processes (shards mode)")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--properties", type=int, default=20, help="numeric fields per message")
+    parser.add_argument("--messages", type=int, default=20000, help="messages per run")
+    parser.add_argument("--rate", type=float, default=0, help="publish rate in msgs/s (0 = as fast as possible)")
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of messages with a new property")
+    parser.add_argument("--cold", action="store_true", help="do not warm the property cache before timing")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report Python heap growth with tracemalloc (slows the run)")
+    return parser.parse_args(argv)
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError: # Not Linux: peak RSS is the best available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def install_fakes(mysql: FakeMySQL):
+    sink = FakeInflux()
+    redis = FakeRedis()
+    influx_service.writer._write_fn = sink
+    rule_engine_queue.publisher._client_factory = lambda: redis
+    rule_engine_queue.publisher._client = None
+    processor.SessionLocal = mysql.SessionLocal
+    last_seen_updater._session_factory = mysql.SessionLocal
+    return sink, redis
+
+# Keeps each shard's FakeMySQL (and its temporary directory) alive
+_shard_fakes = {}
+
+def install_shard_fakes(devices: int, properties: int, seed: int, index: int):
+    # Runs inside each shard process
+    logging.disable(logging.WARNING)
+    fleet = FleetSimulator(devices, properties, seed=seed)
+    mysql = _shard_fakes["mysql"] = FakeMySQL(fleet.devices)
+    install_fakes(mysql)
+    device_registry._session_factory = mysql.SessionLocal
+    device_registry._redis_client_factory = None
+
+def instrument(timer: StageTimer):
+    payload_decoder.decode = timer.wrap("decode", payload_decoder.decode)
+    payload_decoder.validate = timer.wrap("validate", payload_decoder.validate)
+    processor.discover_properties = timer.wrap("discovery", processor.discover_properties)
+    influx_service.write_point = timer.wrap("influx_encode", influx_service.write_point)
+    last_seen_updater.touch = timer.wrap("last_seen", last_seen_updater.touch)
+    rule_engine_queue.publish = timer.wrap("publish", rule_engine_queue.publish)
+
+def pace(started: float, sent: int, rate: float):
+    if rate:
+        delay = started + sent / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+def run_process(messages: list, rate: float, timer: StageTimer):
+    handle = timer.wrap("message", lambda f, d, raw: processor.process_message(f, d, payload_decoder.decode(raw)))
+    started = time.perf_counter()
+    for i, (factory_id, device_id, _, raw) in enumerate(messages):
+        pace(started, i, rate)
+        handle(factory_id, device_id, raw)
+
+def run_mqtt(messages: list, rate: float, timer: StageTimer):
+    broker = LocalBroker()
+    app = MQTTClient(client=broker.client())
+    app.pipeline.handler = timer.wrap("message", app.pipeline.handler)
+    app.pipeline.start()
+    app.client.connect()
+    started = time.perf_counter()
+    for i, (_, _, topic, raw) in enumerate(messages):
+        pace(started, i, rate)
+        broker.publish(topic, raw)
+    app.stop() # Drains the worker queues
+    return app.pipeline.stats()
+
+def run_shards(args, fleet: FleetSimulator) -> list:
+    """msgs/s of each run through the ShardSupervisor, including the handoff."""
+    supervisor = ShardSupervisor(
+        processes=args.processes, batch_size=100, flush_interval=0.005, queue_size=100000,
+        block_timeout=60, stats_interval=0.05,
+        initializer=functools.partial(install_shard_fakes, args.devices, args.properties, args.seed),
+    )
+
+    def send(messages: list):
+        target = supervisor.stats()["processed"] + len(messages)
+        started = time.perf_counter()
+        for i, (factory_id, device_id, _, raw) in enumerate(messages):
+            pace(started, i, args.rate)
+            supervisor.submit(factory_id, device_id, raw)
+        while supervisor.stats()["processed"] < target:
+            time.sleep(0.001)
+        return len(messages) / (time.perf_counter() - started)
+
+    supervisor.start()
+    try:
+        supervisor.wait_ready(120)
+        if not args.cold:
+            send(fleet.messages(len(fleet.devices)))
+        send(fleet.messages(args.messages)) # Warm-up
+        return [send(fleet.messages(args.messages)) for _ in range(args.repeat)]
+    finally:
+        supervisor.stop()
+
+def run_once(args, fleet: FleetSimulator, timer: StageTimer) -> dict:
+    messages = fleet.messages(args.messages)
+    mysql = FakeMySQL(fleet.devices)
+    sink, redis = install_fakes(mysql)
+    property_registry.clear()
+    if not args.cold:
+        for factory_id, device_id, _, raw in fleet.messages(len(fleet.devices)):
+            processor.process_message(factory_id, device_id, payload_decoder.decode(raw))
+        influx_service.writer.flush()
+        rule_engine_queue.publisher.flush()
+        last_seen_updater.flush()
+        sink.reset()
+        redis.reset()
+    timer.reset()
+    gc.collect()
+
+    influx_service.start()
+    rule_engine_queue.start()
+    started = time.perf_counter()
+    pipeline_stats = None
+    if args.mode == "mqtt":
+        pipeline_stats = run_mqtt(messages, args.rate, timer)
+    else:
+        run_process(messages, args.rate, timer)
+    # Buffered work counts against the run
+    influx_service.writer.flush()
+    rule_engine_queue.publisher.flush()
+    last_seen_updater.flush()
+    elapsed = time.perf_counter() - started
+
+    influx_service.writer.close()
+    rule_engine_queue.stop()
+    mysql.close()
+    return {
+        "elapsed": elapsed,
+        "msgs_per_s": len(messages) / elapsed,
+        "influx_lines": sink.lines,
+        "influx_writes": sink.writes,
+        "events": redis.pushed,
+        "redis_round_trips": redis.round_trips,
+        "pipeline": pipeline_stats,
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The fakes make every write succeed; keep the log out of the timings
+    logging.disable(logging.WARNING)
+    timer = StageTimer()
+    instrument(timer)
+    fleet = FleetSimulator(args.devices, args.properties, args.churn, seed=args.seed)
+
+    if args.mode == "shards":
+        rates = run_shards(args, fleet)
+        print(f"mode=shards processes={args.processes} devices={args.devices} properties={args.properties} "
+              f"messages={args.messages} rate={args.rate or 'max'} churn={args.churn}")
+        print(f"throughput: {statistics.median(rates):,.0f} msgs/s median "
+              f"(min {min(rates):,.0f}, max {max(rates):,.0f}, {args.repeat} runs)")
+        return
+
+    run_once(args, fleet, timer) # Warm-up: imports, caches, SQLite pages
+    rss_before = rss_kb()
+    if args.trace_memory:
+        tracemalloc.start()
+    runs = [run_once(args, fleet, timer) for _ in range(args.repeat)]
+    heap_kb = tracemalloc.get_traced_memory()[0] // 1024 if args.trace_memory else None
+    tracemalloc.stop()
+    rss_growth = rss_kb() - rss_before
+
+    rates = [r["msgs_per_s"] for r in runs]
+    last = runs[-1]
+    print(f"mode={args.mode} devices={args.devices} properties={args.properties} "
+          f"messages={args.messages} rate={args.rate or 'max'} churn={args.churn}")
+    print(f"throughput: {statistics.median(rates):,.0f} msgs/s median "
+          f"(min {min(rates):,.0f}, max {max(rates):,.0f}, {args.repeat} runs)")
+    print(f"influx: {last['influx_lines']:,} lines in {last['influx_writes']} writes; "
+          f"events: {last['events']:,} in {last['redis_round_trips']} round trips")
+    print(f"memory: rss {rss_growth:+,} KB" + (f", python heap {heap_kb:,} KB" if heap_kb is not None else ""))
+
+    print(f"{'stage':<14} {'calls':>9} {'p50 us':>9} {'p99 us':>9}")
+    for stage, s in timer.summary().items():
+        if s["count"]:
+            print(f"{stage:<14} {s['count']:>9,} {s['p50_us']:>9.1f} {s['p99_us']:>9.1f}")
+    if last["pipeline"]:
+        print(f"{'pipeline':<14} {'calls':>9} {'avg us':>9} {'max us':>9}")
+        for stage, s in last["pipeline"]["stages"].items():
+            print(f"{stage:<14} {s['count']:>9,} {s['avg_ms'] * 1000:>9.1f} {s['max_ms'] * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Points/sec on one core: influxdb_client Point objects vs LineProtocolEncoder.
+
+Run from the telemetry-service directory:
+    python -m benchmarks.bench_line_protocol
+"""
+import datetime
+import gzip
+import timeit
+from influxdb_client import Point
+from app.core.line_protocol import LineProtocolEncoder
+
+FIELD_COUNTS = (5, 20, 50)
+DEVICES = 100
+
+def make_data(fields: int) -> dict:
+    return {f"sensor_{i}": 20.0 + i * 0.37 for i in range(fields)}
+
+def point_path(factory_id, device_id, data, ts) -> bytes:
+    # What write_point did before: one Point per property, serialised by the client
+    points = []
+    for k, v in data.items():
+        point = Point("device_metrics") \
+            .tag("factory_id", factory_id) \
+            .tag("device_id", device_id) \
+            .tag("property_name", k) \
+            .field("value", v) \
+            .time(ts)
+        points.append(point.to_line_protocol())
+    return "\n".join(points).encode()
+
+def best_of(fn, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+def main(number: int = 2000):
+    encoder = LineProtocolEncoder("device_metrics")
+    ts = datetime.datetime(2026, 2, 17, 14, 0, 0)
+    devices = [f"dev-{i:04d}" for i in range(DEVICES)]
+    print(f"{'fields':>6} {'Point pts/s':>12} {'encoder pts/s':>14} {'speedup':>8} {'gzip ratio':>11}")
+    for fields in FIELD_COUNTS:
+        data = make_data(fields)
+        state = {"i": 0}
+
+        def next_device():
+            state["i"] = (state["i"] + 1) % DEVICES
+            return devices[state["i"]]
+
+        # Same points (Point writes 20.0 as "20", both are floats in line protocol)
+        assert point_path("fct-001", "dev-0001", data, ts).count(b"\n") == encoder.encode("fct-001", "dev-0001", data, ts)[0].count(b"\n")
+        old = best_of(lambda: point_path("fct-001", next_device(), data, ts), number)
+        new = best_of(lambda: encoder.encode("fct-001", next_device(), data, ts), number)
+
+        # Compression on a flush-sized body (100 messages)
+        body = b"\n".join(encoder.encode("fct-001", d, data, ts)[0] for d in devices)
+        ratio = len(body) / len(gzip.compress(body))
+        print(f"{fields:>6} {fields / old:>12,.0f} {fields / new:>14,.0f} {old / new:>8.2f} {ratio:>10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Simulated device fleet and in-process stand-ins for InfluxDB, Redis and MySQL,
+shared by the ingestion benchmarks. Nothing here opens a network connection.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base
+from app.models.models import Device
+
+class FleetSimulator:
+    """
+    Pre-generates the messages of `devices` devices, each sending
+    `properties` numeric fields per message. With probability `churn` a
+    message also carries a property that device has never sent before, which
+    forces auto-discovery to go to MySQL. Messages are generated up front so
+    the timed run only measures the service side.
+    """
+    def __init__(self, devices: int = 500, properties: int = 20, churn: float = 0.0,
+                 factories: int = 4, seed: int = 42):
+        self.rnd = random.Random(seed)
+        self.properties = properties
+        self.churn = churn
+        self.devices = [(f"fct-{i % factories:03d}", f"dev-{i:05d}") for i in range(devices)]
+        self._new_props = 0
+
+    def messages(self, count: int) -> list:
+        """[(factory_id, device_id, topic, payload bytes), ...] round-robin over the fleet."""
+        out = []
+        for i in range(count):
+            factory_id, device_id = self.devices[i % len(self.devices)]
+            values = {f"sensor_{p}": round(self.rnd.uniform(-50, 500), 3) for p in range(self.properties)}
+            if self.churn and self.rnd.random() < self.churn:
+                self._new_props += 1
+                values[f"extra_{self._new_props}"] = self.rnd.random()
+            topic = f"factories/{factory_id}/devices/{device_id}/telemetry"
+            out.append((factory_id, device_id, topic, json.dumps(values).encode()))
+        return out
+
+class FakeInflux:
+    """Write function for BatchWriter that only counts what it is sent."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.writes = 0
+        self.lines = 0
+        self.bytes = 0
+
+    def __call__(self, body: bytes):
+        with self._lock:
+            self.writes += 1
+            self.lines += body.count(b"\n") + 1
+            self.bytes += len(body)
+
+class FakeRedisPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = 0
+
+    def lpush(self, key, *values):
+        self.redis.pushed += len(values)
+        self.commands += 1
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [0] * self.commands
+
+class FakeRedis:
+    """Enough of redis.Redis for BatchPublisher."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pushed = 0
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def close(self):
+        pass
+
+class FakeMySQL:
+    """
+    File-backed SQLite database with the service's tables, so ingest workers
+    on several threads each get their own connection.
+    """
+    def __init__(self, devices: list):
+        self._dir = tempfile.TemporaryDirectory(prefix="telemetry-bench-")
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self._dir.name, 'bench.db')}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        # No fsync per commit: disk latency would swamp what is being measured
+        event.listen(self.engine, "connect", lambda conn, _: conn.execute("PRAGMA synchronous=OFF"))
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        db = self.SessionLocal()
+        db.add_all([Device(id=d, factory_id=f) for f, d in devices])
+        db.commit()
+        db.close()
+
+    def close(self):
+        self.engine.dispose()
+        self._dir.cleanup()
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class StageTimer:
+    """Wraps callables to record how long each call took, per stage name."""
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, stage: str, fn):
+        samples = self.samples.setdefault(stage, [])
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                samples.append(perf_counter() - started)
+        return timed
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+    def summary(self) -> dict:
+        out = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            out[stage] = {
+                "count": len(ordered),
+                "p50_us": percentile(ordered, 50) * 1e6,
+                "p99_us": percentile(ordered, 99) * 1e6,
+            }
+        return out
@@ -1,12 +1,15 @@
 from app.core import influx
 from app.services import redis_service
+from app.services.latest_values import SET_IF_NEWER
 from app.core.database import Base, engine, SessionLocal
 from app.models.models import Device, DeviceProperty
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+import json
 import pytest
 import os
+import redis
 
 # Use SQLite for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -46,9 +49,86 @@ def mock_external_services(monkeypatch):
     
     # Mock Influx
     monkeypatch.setattr(influx.InfluxService, "write_point", mock_write)
+    monkeypatch.setattr(influx.InfluxService, "write_samples", mock_write)
+    monkeypatch.setattr(influx.InfluxService, "write_quarantine", mock_write)
+    monkeypatch.setattr(influx.InfluxService, "write_rollups", mock_write)
     # Mock Redis
     monkeypatch.setattr(redis_service.RedisService, "publish", mock_publish)
+    monkeypatch.setattr(redis_service.RedisService, "publish_many", mock_publish)
     # We also need to prevent Redis connection attempt at import time if possible, or mock it.
     # But since imports happen before fixtures, we rely on the try-except in RedisService.__init__
     
     yield
+
+class FakeRedis:
+    """In-memory Redis with the list, hash and pipeline commands the service uses."""
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+        self.down = False
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def check(self):
+        if self.down:
+            raise redis.ConnectionError("redis down")
+
+    def lpush(self, key, *values):
+        self.check()
+        # LPUSH inserts each value at the head in turn
+        for v in values:
+            self.lists.setdefault(key, []).insert(0, v)
+
+    def hgetall(self, key):
+        self.check()
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self.check()
+        fields = self.hashes.setdefault(key, {})
+        if field is not None:
+            fields[field] = value
+        fields.update(mapping or {})
+
+    def delete(self, *keys):
+        self.check()
+        for key in keys:
+            self.lists.pop(key, None)
+            self.hashes.pop(key, None)
+
+    def expire(self, key, ttl):
+        self.check()
+
+    def eval(self, script, numkeys, *keys_and_args):
+        assert script == SET_IF_NEWER and numkeys == 1 # The only script
+        self.check()
+        key, args = keys_and_args[0], keys_and_args[1:]
+        stored = self.hashes.setdefault(key, {})
+        written = 0
+        for field, value, timestamp in zip(args[0::3], args[1::3], args[2::3]):
+            if field not in stored or json.loads(stored[field])[1] <= timestamp:
+                stored[field] = value
+                written += 1
+        return written
+
+class FakePipeline:
+    """Queues FakeRedis commands and runs them in one round trip on execute()."""
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        self.client.check()
+        results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.client.round_trips += 1
+        return results
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,91 @@
+"""
+In-process stand-in for an MQTT broker: topic wildcard matching and
+shared-subscription ($share/<group>/...) round-robin delivery. Just enough
+to drive MQTTClient callbacks without a real EMQX.
+"""
+import itertools
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    f_parts, t_parts = topic_filter.split("/"), topic.split("/")
+    for i, f in enumerate(f_parts):
+        if f == "#":
+            return True
+        if i >= len(t_parts) or (f != "+" and f != t_parts[i]):
+            return False
+    return len(f_parts) == len(t_parts)
+
+class Message:
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 1
+
+class LocalClient:
+    """Replaces paho's Client inside MQTTClient."""
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_connect = self.on_message = self.on_disconnect = None
+        self.connected = False
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def connect(self, host=None, port=None, keepalive=60):
+        self.connected = True
+        self.on_connect(self, None, {}, 0)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.connected = False
+        self.broker.unsubscribe_all(self)
+
+    def is_connected(self):
+        return self.connected
+
+    def subscribe(self, topic, qos=0):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for t, _ in topics:
+            self.broker.subscribe(self, t)
+        return (0, 1)
+
+class LocalBroker:
+    def __init__(self):
+        self.plain = [] # (filter, client)
+        self.shared = {} # (group, filter) -> [clients]
+        self._cursors = {}
+
+    def client(self) -> LocalClient:
+        return LocalClient(self)
+
+    def subscribe(self, client, topic_filter: str):
+        if topic_filter.startswith("$share/"):
+            _, group, real_filter = topic_filter.split("/", 2)
+            self.shared.setdefault((group, real_filter), []).append(client)
+        else:
+            self.plain.append((topic_filter, client))
+
+    def unsubscribe_all(self, client):
+        self.plain = [(f, c) for f, c in self.plain if c is not client]
+        for members in self.shared.values():
+            if client in members:
+                members.remove(client)
+
+    def publish(self, topic: str, payload: bytes) -> int:
+        """Deliver a message; returns how many subscribers received it."""
+        delivered = 0
+        for topic_filter, client in self.plain:
+            if topic_matches(topic_filter, topic):
+                client.on_message(client, None, Message(topic, payload))
+                delivered += 1
+        for key, members in self.shared.items():
+            if members and topic_matches(key[1], topic):
+                cursor = self._cursors.setdefault(key, itertools.count())
+                client = members[next(cursor) % len(members)]
+                client.on_message(client, None, Message(topic, payload))
+                delivered += 1
+        return delivered
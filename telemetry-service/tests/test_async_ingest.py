@@ -0,0 +1,207 @@
+import asyncio
+import json
+import redis
+import threading
+import time
+from influxdb_client.rest import ApiException
+from app.core.influx import BatchWriter
+from app.core.spool import SegmentSpool
+from app.models.models import DeviceProperty
+from app.services.async_ingest import AsyncIngestEngine, AsyncInfluxFlusher, AsyncEventFlusher
+from app.services.property_registry import property_registry
+from app.services.redis_service import BatchPublisher
+from tests.local_broker import LocalBroker
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    assert predicate()
+
+class FakeAsyncPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def lpush(self, key, *values):
+        self.commands.append((key, values))
+
+    async def execute(self):
+        if self.client.down:
+            raise redis.ConnectionError("redis down")
+        for key, values in self.commands:
+            for v in values:
+                self.client.lists.setdefault(key, []).insert(0, v)
+
+class FakeAsyncRedis:
+    def __init__(self):
+        self.lists = {}
+        self.down = False
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+    async def aclose(self):
+        pass
+
+def make_writer(**overrides):
+    options = dict(batch_size=10, flush_interval=0.01, max_buffer=1000, backpressure_timeout=0)
+    options.update(overrides)
+    return BatchWriter(lambda body: None, **options)
+
+def test_influx_writes_run_concurrently_up_to_the_limit():
+    writer = make_writer()
+    bodies = []
+
+    async def slow_write(body):
+        await asyncio.sleep(0.01)
+        bodies.append(body)
+
+    async def scenario():
+        flusher = AsyncInfluxFlusher(writer, slow_write, max_in_flight=4)
+        for i in range(12):
+            writer.write(f"m v={i}".encode(), 1)
+            # One batch per write, so there are 12 requests to overlap
+            await flusher.flush()
+        await flusher.close()
+        return flusher
+
+    flusher = asyncio.run(scenario())
+    assert len(bodies) == 12
+    assert flusher.peak_in_flight == 4
+    assert flusher.in_flight == 0
+    assert writer.records_written == 12
+
+def test_failed_influx_write_is_requeued():
+    writer = make_writer()
+
+    async def failing_write(body):
+        raise ConnectionError("influx down")
+
+    async def scenario():
+        flusher = AsyncInfluxFlusher(writer, failing_write, max_in_flight=2)
+        writer.write(b"m v=1", 1)
+        await flusher.close()
+
+    asyncio.run(scenario())
+    assert writer.flush_errors == 1
+    assert len(writer) == 1
+
+def test_rejected_influx_write_is_not_requeued():
+    writer = make_writer()
+
+    async def rejecting_write(body):
+        raise ApiException(status=400, reason="unable to parse")
+
+    async def scenario():
+        flusher = AsyncInfluxFlusher(writer, rejecting_write, max_in_flight=2)
+        writer.write(b"m v=1", 1)
+        await flusher.close()
+        return flusher
+
+    flusher = asyncio.run(scenario())
+    assert writer.records_rejected == 1
+    assert len(writer) == 0
+    assert not flusher._failing
+
+def test_events_are_pushed_in_rpop_order_and_retried():
+    publisher = BatchPublisher(lambda: None, "events_queue", batch_size=2, flush_interval=1, max_buffer=100)
+    client = FakeAsyncRedis()
+
+    async def scenario():
+        flusher = AsyncEventFlusher(publisher, lambda: client)
+        client.down = True
+        publisher.publish_many([{"seq": i} for i in range(3)])
+        assert not await flusher.flush()
+        client.down = False
+        publisher.publish({"seq": 3})
+        assert await flusher.flush()
+
+    asyncio.run(scenario())
+    popped = [json.loads(v)["seq"] for v in reversed(client.lists["events_queue"])]
+    assert popped == [0, 1, 2, 3]
+    assert publisher.flush_errors == 1
+    assert publisher.published == 4
+
+def test_engine_processes_messages_in_order_and_pauses_reading(db_session, monkeypatch):
+    broker = LocalBroker()
+    handled = []
+
+    async def write(body):
+        pass
+
+    engine = AsyncIngestEngine(shards=2, queue_size=2, db_workers=1, max_in_flight_writes=2,
+                               client=broker.client(), influx_write=write,
+                               redis_client_factory=FakeAsyncRedis)
+    original = engine.handle_payload
+
+    async def handle_payload(factory_id, device_id, raw, fmt="json"):
+        handled.append((device_id, json.loads(raw)["seq"]))
+        await original(factory_id, device_id, raw, fmt)
+
+    monkeypatch.setattr(engine, "handle_payload", handle_payload)
+    property_registry.invalidate("fct-async", "dev-a")
+
+    async def scenario():
+        await engine.start()
+        await wait_until(engine.is_connected) # Connects in a thread, then subscribes
+        # Published faster than the workers run, so the queues overflow
+        for seq in range(10):
+            broker.publish("factories/fct-async/devices/dev-a/telemetry", json.dumps({"seq": seq}).encode())
+        assert engine.stats()["read_paused"]
+        await engine.stop()
+
+    asyncio.run(scenario())
+    assert handled == [("dev-a", seq) for seq in range(10)]
+    stats = engine.stats()
+    assert stats["processed"] == 10
+    assert stats["read_pauses"] == 1
+    assert not stats["read_paused"]
+    # Discovery ran on the executor against MySQL
+    props = db_session.query(DeviceProperty).filter(DeviceProperty.device_id == "dev-a").all()
+    assert [p.property_name for p in props] == ["seq"]
+
+def test_connect_does_not_block_the_event_loop(monkeypatch):
+    broker = LocalBroker()
+    client = broker.client()
+    connecting = threading.Event()
+    original = client.connect
+
+    def slow_connect(*args):
+        connecting.set()
+        time.sleep(0.2) # DNS lookup, TCP handshake
+        original(*args)
+
+    client.connect = slow_connect
+
+    async def write(body):
+        pass
+
+    engine = AsyncIngestEngine(shards=1, queue_size=10, db_workers=1, max_in_flight_writes=1,
+                               client=client, influx_write=write, redis_client_factory=FakeAsyncRedis)
+
+    async def scenario():
+        await engine.start()
+        ticks = 0
+        while not engine.is_connected():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        await engine.stop()
+        return ticks
+
+    assert asyncio.run(scenario()) > 5
+    assert connecting.is_set()
+
+def test_spool_writes_can_be_offloaded(tmp_path):
+    offloaded = []
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    writer = BatchWriter(lambda body: None, batch_size=10, flush_interval=10.0, max_buffer=1,
+                         backpressure_timeout=0.01, spool=spool)
+    writer.offload = lambda fn, *args: offloaded.append((fn, args))
+
+    assert writer.write(b"a 1", 1)
+    assert writer.write(b"b 1", 1) # Buffer full
+    assert len(offloaded) == 1 and len(spool) == 0
+    fn, args = offloaded[0]
+    fn(*args)
+    assert writer.records_spooled == 1
@@ -0,0 +1,132 @@
+import datetime
+from app.models.models import DeviceProperty
+from app.services import processor
+from app.services.deadband import Deadband, DeadbandFilter, encode_deadband, decode_deadband
+from app.services.processor import process_message
+from app.services.property_registry import PropertyRegistry, property_registry
+
+T0 = datetime.datetime(2026, 2, 17, 14, 0, 0)
+
+def at(seconds: int) -> datetime.datetime:
+    return T0 + datetime.timedelta(seconds=seconds)
+
+def test_absolute_band_and_heartbeat():
+    dbf = DeadbandFilter()
+    bands = {"temp": Deadband(0.5, None, 10)}
+    assert dbf.apply("f", "d", {"temp": 20.0}, bands, at(0)) == {"temp": 20.0}
+    assert dbf.apply("f", "d", {"temp": 20.4}, bands, at(1)) == {}
+    # The band is around the last forwarded value, so slow drift is still caught
+    assert dbf.apply("f", "d", {"temp": 20.6}, bands, at(2)) == {"temp": 20.6}
+    assert dbf.apply("f", "d", {"temp": 20.6}, bands, at(5)) == {}
+    assert dbf.apply("f", "d", {"temp": 20.6}, bands, at(12)) == {"temp": 20.6} # max silence
+    assert dbf.stats()["suppressed"] == 2
+    assert dbf.stats()["forwarded"] == 3
+
+def test_percent_band_bools_and_unfiltered_properties():
+    dbf = DeadbandFilter()
+    bands = {"rpm": Deadband(None, 1.0, None), "running": Deadband(0, None, None)}
+    first = {"rpm": 1000, "running": True, "load": 5}
+    assert dbf.apply("f", "d", first, bands, at(0)) == first
+    assert dbf.apply("f", "d", {"rpm": 1009, "running": True, "load": 5}, bands, at(1)) == {"load": 5}
+    assert dbf.apply("f", "d", {"rpm": 1011, "running": False}, bands, at(2)) == {"rpm": 1011, "running": False}
+
+def test_disabled_filter_passes_everything():
+    dbf = DeadbandFilter(enabled=False)
+    bands = {"temp": Deadband(1.0, None, None)}
+    dbf.apply("f", "d", {"temp": 1.0}, bands, at(0))
+    assert dbf.apply("f", "d", {"temp": 1.0}, bands, at(1)) == {"temp": 1.0}
+
+def test_last_values_are_bounded():
+    dbf = DeadbandFilter(max_properties=2)
+    bands = {"temp": Deadband(1.0, None, None)}
+    for device in ("d1", "d2", "d3"):
+        dbf.apply("f", device, {"temp": 1.0}, bands, at(0))
+    assert dbf.stats()["tracked_properties"] == 2
+    assert dbf.stats()["evictions"] == 1
+    # d1 was evicted, so its next value is forwarded again
+    assert dbf.apply("f", "d1", {"temp": 1.0}, bands, at(1)) == {"temp": 1.0}
+    assert dbf.apply("f", "d3", {"temp": 1.0}, bands, at(1)) == {}
+
+def test_shared_cache_encoding():
+    assert decode_deadband(encode_deadband(Deadband(0.5, None, 60))) == Deadband(0.5, None, 60)
+    assert decode_deadband(encode_deadband(None)) is None
+
+def test_registry_loads_deadbands(db_session):
+    db_session.add(DeviceProperty(factory_id="fct-db", device_id="dev-db", property_name="temp",
+                                  deadband_abs=0.5, max_silence_seconds=60))
+    db_session.add(DeviceProperty(factory_id="fct-db", device_id="dev-db", property_name="rpm"))
+    db_session.commit()
+
+    registry = PropertyRegistry(max_devices=10, ttl=60)
+    assert registry.register(db_session, "fct-db", "dev-db", ["temp", "rpm"]) == []
+    assert registry.deadbands("fct-db", "dev-db") == {"temp": Deadband(0.5, None, 60)}
+
+class FakeSharedCache:
+    def __init__(self):
+        self.hashes = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        pass
+
+def test_deadband_change_is_picked_up_after_invalidation(db_session):
+    prop = DeviceProperty(factory_id="fct-db3", device_id="dev-db3", property_name="temp", deadband_abs=0.5)
+    db_session.add(prop)
+    db_session.commit()
+    shared = FakeSharedCache()
+    registry = PropertyRegistry(max_devices=10, ttl=300, redis_client=shared)
+    registry.register(db_session, "fct-db3", "dev-db3", ["temp"])
+    assert shared.hashes["telemetry:props:fct-db3:dev-db3"]
+
+    # What the API service does on PATCH .../deadband
+    prop.deadband_abs = 2.0
+    db_session.commit()
+    shared.delete("telemetry:props:fct-db3:dev-db3")
+    registry.invalidate("fct-db3", "dev-db3")
+
+    registry.register(db_session, "fct-db3", "dev-db3", ["temp"])
+    assert registry.deadbands("fct-db3", "dev-db3") == {"temp": Deadband(2.0, None, None)}
+
+def test_new_property_does_not_leave_a_partial_shared_hash(db_session):
+    shared = FakeSharedCache()
+    registry = PropertyRegistry(max_devices=10, ttl=300, redis_client=shared)
+    registry.register(db_session, "fct-db4", "dev-db4", ["temp"])
+    shared.hashes.clear() # Expired
+    registry.register(db_session, "fct-db4", "dev-db4", ["temp", "rpm"])
+    assert "telemetry:props:fct-db4:dev-db4" not in shared.hashes
+
+    other = PropertyRegistry(max_devices=10, ttl=300, redis_client=shared)
+    assert other.register(db_session, "fct-db4", "dev-db4", ["temp", "rpm"]) == []
+    assert set(shared.hashes["telemetry:props:fct-db4:dev-db4"]) == {"temp", "rpm"}
+
+def test_suppressed_values_skip_influx_and_rule_engine(db_session, monkeypatch):
+    db_session.add(DeviceProperty(factory_id="fct-db2", device_id="dev-db2", property_name="temp",
+                                  deadband_abs=1.0))
+    db_session.commit()
+    property_registry.invalidate("fct-db2", "dev-db2")
+
+    writes, published = [], []
+    monkeypatch.setattr(processor.influx_service, "write_point", lambda f, d, data, ts=None: writes.append(data))
+    monkeypatch.setattr(processor.rule_engine_queue, "publish", published.append)
+
+    process_message("fct-db2", "dev-db2", {"temp": 50.0}, at(0))
+    process_message("fct-db2", "dev-db2", {"temp": 50.5}, at(1))
+    process_message("fct-db2", "dev-db2", {"temp": 50.5, "rpm": 900}, at(2))
+
+    assert writes == [{"temp": 50.0}, {"rpm": 900}]
+    # Events keep every current value, only fully suppressed messages are skipped
+    assert [e["properties"] for e in published] == [{"temp": 50.0}, {"temp": 50.5, "rpm": 900}]
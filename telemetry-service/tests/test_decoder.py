@@ -0,0 +1,62 @@
+import datetime
+import json
+import pytest
+from app.services.decoder import PayloadDecoder, PayloadError, DECODERS, extract_samples, parse_timestamp
+from app.services import mqtt_client
+
+@pytest.mark.parametrize("name", sorted(DECODERS))
+def test_decode_and_validate(name):
+    decoder = PayloadDecoder(name)
+    payload = decoder.decode(b'{"temp": 21.5, "rpm": 1450, "on": true, "mode": "auto", "meta": {"a": 1}}')
+    assert decoder.validate(payload) == {"temp": 21.5, "rpm": 1450, "on": True}
+    assert decoder.stats()["invalid_fields"] == 2
+
+def test_validate_rejects_names_that_cannot_be_stored():
+    decoder = PayloadDecoder("json")
+    assert decoder.validate({"": 1, "x\\": 3.5, "temp": 20}) == {"temp": 20}
+    assert decoder.stats()["invalid_fields"] == 2
+
+@pytest.mark.parametrize("name", sorted(DECODERS))
+def test_decode_errors_are_counted(name):
+    decoder = PayloadDecoder(name)
+    with pytest.raises(PayloadError):
+        decoder.decode(b"{not json")
+    with pytest.raises(PayloadError):
+        decoder.decode(b'"text"')
+    assert decoder.stats()["decode_errors"] == 2
+
+def test_parse_timestamp_formats():
+    expected = datetime.datetime(2026, 2, 17, 14, 0, 0)
+    assert parse_timestamp(1771336800) == expected
+    assert parse_timestamp(1771336800000) == expected
+    assert parse_timestamp("2026-02-17T14:00:00Z") == expected
+    assert parse_timestamp("2026-02-17T16:00:00+02:00") == expected
+    with pytest.raises(PayloadError):
+        parse_timestamp("yesterday")
+
+@pytest.mark.parametrize("value", [10 ** 20, -10 ** 20, float("nan"), float("inf"), "0001-01-01T00:00:00+01:00"])
+def test_out_of_range_timestamps_are_payload_errors(value):
+    with pytest.raises(PayloadError):
+        parse_timestamp(value)
+
+def test_batch_with_a_bad_timestamp_is_counted(monkeypatch):
+    decoder = PayloadDecoder("json")
+    monkeypatch.setattr(mqtt_client, "payload_decoder", decoder)
+    raw = json.dumps([{"ts": 10 ** 20, "values": {"temp": 20.0}}]).encode()
+    assert mqtt_client.decode_payload("dev-1", raw, "json") is None
+    assert decoder.stats()["decode_errors"] == 1
+
+def test_extract_samples():
+    assert extract_samples({"temp": 1.0}) is None
+    batch = [{"ts": 1771336800, "values": {"temp": 1.0}}, {"ts": 1771336801, "values": {"temp": 2.0}}]
+    assert [v for _, v in extract_samples(batch)] == [{"temp": 1.0}, {"temp": 2.0}]
+    assert len(extract_samples({"samples": batch})) == 2
+    with pytest.raises(PayloadError):
+        extract_samples([{"values": {"temp": 1.0}}])
+
+@pytest.mark.parametrize("fmt", ["msgpack", "cbor"])
+def test_decode_binary_formats(fmt):
+    encode = {"msgpack": lambda o: pytest.importorskip("msgpack").packb(o),
+              "cbor": lambda o: pytest.importorskip("cbor2").dumps(o)}[fmt]
+    payload = PayloadDecoder().decode(encode({"samples": [{"ts": 1771336800, "values": {"temp": 21.5}}]}), fmt)
+    assert payload["samples"][0]["values"] == {"temp": 21.5}
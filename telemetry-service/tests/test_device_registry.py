@@ -0,0 +1,86 @@
+import datetime
+import json
+from app.models.models import Device, DeviceProperty
+from app.services import processor
+from app.services.device_registry import DeviceRegistry
+from app.services.last_seen import LastSeenUpdater
+from app.services.processor import process_message
+
+def make_registry(db_session, policy="drop", on_invalidation=None):
+    return DeviceRegistry(policy, refresh_interval=60, session_factory=lambda: db_session,
+                          on_invalidation=on_invalidation)
+
+def add_devices(db_session, *devices):
+    db_session.add_all([Device(id=d, factory_id=f, status=s) for f, d, s in devices])
+    db_session.commit()
+
+def test_accepts_everything_until_loaded(db_session):
+    registry = make_registry(db_session)
+    assert registry.check("fct-x", "nobody") == "accept"
+
+def test_unknown_and_disabled_devices_are_rejected(db_session):
+    add_devices(db_session, ("fct-dr", "dev-dr-1", "active"), ("fct-dr", "dev-dr-2", "maintenance"))
+    registry = make_registry(db_session)
+    assert registry.reload() >= 2
+
+    assert registry.check("fct-dr", "dev-dr-1") == "accept"
+    assert registry.check("fct-dr", "dev-dr-2") == "drop"
+    assert registry.check("fct-dr", "dev-dr-9") == "drop"
+    # Same device id under another factory's topic is unknown too
+    assert registry.check("fct-other", "dev-dr-1") == "drop"
+    stats = registry.stats()
+    assert (stats["accepted"], stats["unknown"], stats["disabled"]) == (1, 2, 1)
+
+def test_incremental_refresh_and_invalidation(db_session):
+    add_devices(db_session, ("fct-ir", "dev-ir-1", "active"))
+    invalidated = []
+    registry = make_registry(db_session, on_invalidation=lambda f, d: invalidated.append((f, d)))
+    registry.reload()
+
+    device = db_session.get(Device, "dev-ir-1")
+    device.status = "inactive"
+    device.updated_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=5)
+    add_devices(db_session, ("fct-ir", "dev-ir-2", "active"))
+    db_session.execute(Device.__table__.update().where(Device.id == "dev-ir-2")
+                       .values(updated_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=5)))
+    db_session.commit()
+
+    assert registry.refresh() >= 2
+    assert registry.check("fct-ir", "dev-ir-1") == "drop"
+    assert registry.check("fct-ir", "dev-ir-2") == "accept"
+
+    db_session.delete(db_session.get(Device, "dev-ir-2"))
+    db_session.commit()
+    registry._on_invalidation(json.dumps({"factory_id": "fct-ir", "device_id": "dev-ir-2"}))
+    assert registry.check("fct-ir", "dev-ir-2") == "drop"
+    registry._on_invalidation("not json") # Ignored
+    assert registry.stats()["invalidations"] == 1
+    assert invalidated == [("fct-ir", "dev-ir-2")]
+
+def test_last_seen_flush_does_not_bump_updated_at(db_session):
+    add_devices(db_session, ("fct-ua", "dev-ua-1", "active"))
+    before = db_session.get(Device, "dev-ua-1").updated_at
+
+    updater = LastSeenUpdater(flush_interval=60, session_factory=lambda: db_session)
+    updater.touch("fct-ua", "dev-ua-1", datetime.datetime(2026, 1, 1))
+    updater.flush()
+    db_session.expire_all()
+    assert db_session.get(Device, "dev-ua-1").updated_at == before
+
+def test_rejected_devices_skip_processing(db_session, monkeypatch):
+    add_devices(db_session, ("fct-rj", "dev-rj-1", "inactive"))
+    registry = make_registry(db_session, policy="quarantine")
+    registry.reload()
+    monkeypatch.setattr(processor, "device_registry", registry)
+
+    quarantined, written = [], []
+    monkeypatch.setattr(processor.influx_service, "write_quarantine", lambda f, d, s: quarantined.append(s))
+    monkeypatch.setattr(processor.influx_service, "write_point", lambda *a: written.append(a))
+
+    process_message("fct-rj", "dev-rj-1", {"temp": 20.0, "mode": "auto"})
+    process_message("fct-rj", "dev-rj-404", {"temp": 21.0})
+
+    assert written == []
+    assert [[v for _, v in s] for s in quarantined] == [[{"temp": 20.0}], [{"temp": 21.0}]]
+    # No properties were auto-discovered for rejected devices
+    assert db_session.query(DeviceProperty).filter(DeviceProperty.factory_id == "fct-rj").count() == 0
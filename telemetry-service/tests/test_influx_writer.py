@@ -0,0 +1,137 @@
+import datetime
+import time
+from influxdb_client import Point
+from influxdb_client.rest import ApiException
+from app.core.influx import BatchWriter, is_permanent
+from app.core.line_protocol import LineProtocolEncoder
+
+class FakeSink:
+    def __init__(self, fail=False):
+        self.bodies = []
+        self.fail = fail
+
+    def __call__(self, body):
+        if self.fail:
+            raise ConnectionError("influx down")
+        self.bodies.append(body)
+
+def make_writer(sink, batch_size=3, flush_interval=10.0, max_buffer=10, timeout=0.01):
+    return BatchWriter(sink, batch_size=batch_size, flush_interval=flush_interval,
+                       max_buffer=max_buffer, backpressure_timeout=timeout, retry_interval=0.01)
+
+def test_flush_on_batch_size():
+    sink = FakeSink()
+    writer = make_writer(sink)
+    writer.start()
+    try:
+        writer.write(b"m v=1\nm v=2", 2)
+        writer.write(b"m v=3", 1)
+        deadline = time.time() + 2
+        while not sink.bodies and time.time() < deadline:
+            time.sleep(0.01)
+        assert sink.bodies == [b"m v=1\nm v=2\nm v=3"]
+    finally:
+        writer.close()
+
+def test_flush_on_interval():
+    sink = FakeSink()
+    writer = make_writer(sink, batch_size=100, flush_interval=0.05)
+    writer.start()
+    try:
+        writer.write(b"m v=1", 1)
+        time.sleep(0.3)
+        assert sink.bodies == [b"m v=1"]
+        assert writer.stats()["records_written"] == 1
+    finally:
+        writer.close()
+
+def test_backpressure_drops_when_full():
+    sink = FakeSink(fail=True)
+    writer = make_writer(sink, batch_size=100, max_buffer=2)
+    # Flush thread not started: the buffer cannot drain
+    assert writer.write(b"a\nb", 2) is True
+    assert writer.write(b"c", 1) is False
+    assert writer.stats()["records_dropped"] == 1
+
+def test_failed_flush_keeps_records_and_close_flushes():
+    sink = FakeSink(fail=True)
+    writer = make_writer(sink, batch_size=100)
+    writer.write(b"a\nb", 2)
+    assert writer.flush() is False
+    assert writer.stats()["buffer_depth"] == 2
+
+    sink.fail = False
+    writer.close()
+    assert sink.bodies == [b"a\nb"]
+    assert writer.stats()["buffer_depth"] == 0
+
+def test_rejected_batch_is_dropped_and_the_rest_written(monkeypatch):
+    monkeypatch.setattr("app.core.influx.MAX_WRITE_BATCH", 2)
+    bodies = []
+    def sink(body):
+        if b"bad" in body:
+            raise ApiException(status=422, reason="field type conflict")
+        bodies.append(body)
+
+    writer = make_writer(sink, batch_size=100)
+    writer.write(b"bad\nx", 2)
+    writer.write(b"a\nb", 2)
+    assert writer.flush() is True
+    assert bodies == [b"a\nb"]
+    stats = writer.stats()
+    assert stats["records_rejected"] == 2
+    assert stats["records_written"] == 2
+    assert stats["buffer_depth"] == 0
+    assert stats["flush_errors"] == 0
+
+def test_permanent_errors():
+    assert is_permanent(ApiException(status=400))
+    assert is_permanent(ApiException(status=422))
+    for status in (0, 401, 429, 500, 503):
+        assert not is_permanent(ApiException(status=status))
+    assert not is_permanent(ConnectionError("influx down"))
+
+def test_encoder_matches_point_line_protocol():
+    encoder = LineProtocolEncoder("device_metrics")
+    ts = datetime.datetime(2026, 2, 17, 14, 0, 0, 123456)
+    data = {"temp erature": 87.4, "rpm,x": 1450.5, "running=": True, "ratio": 1e-05}
+
+    body, count = encoder.encode("fct 001", "dev=abc", data, ts)
+    assert count == 4
+
+    expected = [
+        Point("device_metrics")
+        .tag("factory_id", "fct 001")
+        .tag("device_id", "dev=abc")
+        .tag("property_name", k)
+        .field("value", v)
+        .time(ts)
+        .to_line_protocol()
+        for k, v in data.items()
+    ]
+    assert body.decode().split("\n") == expected
+
+def test_encoder_skips_non_finite_values():
+    body, count = LineProtocolEncoder().encode("f", "d", {"a": float("nan"), "b": 1.5}, 0)
+    assert count == 1
+    assert body == b"device_metrics,device_id=d,factory_id=f,property_name=b value=1.5 0"
+
+def test_encode_samples_uses_each_timestamp():
+    body, count = LineProtocolEncoder().encode_samples("f", "d", [(1, {"a": 1}), (2, {"a": 2, "b": float("inf")})])
+    assert count == 2
+    assert body.decode().split("\n") == [
+        "device_metrics,device_id=d,factory_id=f,property_name=a value=1.0 1",
+        "device_metrics,device_id=d,factory_id=f,property_name=a value=2.0 2",
+    ]
+
+def test_integers_are_written_as_floats():
+    # 20 then 20.5 must not be a field type conflict
+    encoder = LineProtocolEncoder()
+    assert encoder.encode("f", "d", {"a": 20}, 1)[0] == b"device_metrics,device_id=d,factory_id=f,property_name=a value=20.0 1"
+    assert encoder.encode("f", "d", {"a": 20.5}, 2)[0] == b"device_metrics,device_id=d,factory_id=f,property_name=a value=20.5 2"
+    assert encoder.encode("f", "d", {"on": False}, 3)[0] == b"device_metrics,device_id=d,factory_id=f,property_name=on value=false 3"
+
+def test_encoder_skips_names_that_cannot_be_encoded():
+    body, count = LineProtocolEncoder().encode("f", "d", {"": 1, "x\\": 3.5, "y\\z": 2.0}, 0)
+    assert count == 1
+    assert body == b"device_metrics,device_id=d,factory_id=f,property_name=y\\z value=2.0 0"
@@ -0,0 +1,117 @@
+import threading
+import time
+import os
+from app.services.ingest import IngestPipeline, SpillFile, open_spills, shard_for
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+def test_per_device_order_preserved():
+    seen = []
+    pipeline = IngestPipeline(lambda f, d, p, fmt: seen.append((d, p)), workers=4, queue_size=1000)
+    pipeline.start()
+    for i in range(50):
+        pipeline.submit("fct-001", "dev-a", str(i).encode())
+        pipeline.submit("fct-001", "dev-b", str(i).encode())
+    pipeline.stop()
+
+    for device in ("dev-a", "dev-b"):
+        payloads = [int(p) for d, p in seen if d == device]
+        assert payloads == list(range(50))
+    assert pipeline.stats()["processed"] == 100
+
+def test_drop_oldest_policy():
+    release = threading.Event()
+    seen = []
+
+    def handler(f, d, p, fmt):
+        release.wait()
+        seen.append(p)
+
+    pipeline = IngestPipeline(handler, workers=1, queue_size=2, overflow_policy="drop_oldest")
+    pipeline.start()
+    pipeline.submit("f", "d", b"0")
+    assert wait_for(lambda: pipeline.stats()["queue_depth"] == 0) # b"0" is in the handler
+    for p in (b"1", b"2", b"3"):
+        pipeline.submit("f", "d", p)
+    release.set()
+    pipeline.stop()
+
+    assert seen == [b"0", b"2", b"3"]
+    assert pipeline.stats()["dropped"] == 1
+
+def test_spill_policy_replays_overflow(tmp_path):
+    release = threading.Event()
+    seen = []
+
+    def handler(f, d, p, fmt):
+        release.wait()
+        seen.append(p)
+
+    spill = SpillFile(str(tmp_path / "ingest.spill"), max_bytes=1024)
+    pipeline = IngestPipeline(handler, workers=1, queue_size=1, overflow_policy="spill", spills=[spill])
+    pipeline.start()
+    pipeline.submit("f", "d", b"0")
+    assert wait_for(lambda: pipeline.stats()["queue_depth"] == 0)
+    pipeline.submit("f", "d", b"1")
+    pipeline.submit("f", "d", b"2") # queue full -> spilled
+    assert pipeline.stats()["spilled"] == 1
+
+    release.set()
+    assert wait_for(lambda: len(seen) == 3)
+    pipeline.stop()
+    assert seen == [b"0", b"1", b"2"]
+    assert len(spill) == 0
+
+def test_spill_policy_keeps_device_order(tmp_path):
+    release = threading.Event()
+    seen = []
+
+    def handler(f, d, p, fmt):
+        release.wait()
+        seen.append((threading.current_thread().name, d, int(p)))
+
+    spills = open_spills(str(tmp_path / "ingest.spill"), 1 << 20, 2)
+    pipeline = IngestPipeline(handler, workers=2, queue_size=4, overflow_policy="spill", spills=spills)
+    pipeline.start()
+    devices = [f"dev-{i}" for i in range(6)]
+    for i in range(20):
+        for device in devices:
+            pipeline.submit("f", device, str(i).encode())
+    assert pipeline.stats()["spilled"] > 0
+    # Room in the queue again, but newer messages must stay behind the spilled ones
+    release.set()
+    for i in range(20, 30):
+        for device in devices:
+            pipeline.submit("f", device, str(i).encode())
+    assert wait_for(lambda: len(seen) == 180)
+    pipeline.stop()
+
+    for device in devices:
+        assert [p for _, d, p in seen if d == device] == list(range(30))
+        assert len({t for t, d, _ in seen if d == device}) == 1
+    assert all(len(spill) == 0 for spill in spills)
+
+def test_open_spills_moves_leftovers_to_the_device_shard(tmp_path):
+    path = str(tmp_path / "ingest.spill")
+    old = SpillFile(path, max_bytes=1024) # Single file of a previous run
+    for i in range(3):
+        for device in ("dev-a", "dev-b", "dev-c"):
+            old.append("f", device, str(i).encode())
+
+    spills = open_spills(path, 4096, 3)
+    # Per-shard files are created on first append
+    assert set(os.listdir(tmp_path)) <= {"ingest.spill.0", "ingest.spill.1", "ingest.spill.2"}
+    records = []
+    for shard, spill in enumerate(spills):
+        while True:
+            record = spill.pop()
+            if record is None:
+                break
+            records.append((shard, record))
+    for device in ("dev-a", "dev-b", "dev-c"):
+        assert [(s, p) for s, (_, d, p, _) in records if d == device] == \
+            [(shard_for("f", device, 3), p) for p in (b"0", b"1", b"2")]
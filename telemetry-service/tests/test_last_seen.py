@@ -0,0 +1,38 @@
+import datetime
+from app.services.last_seen import LastSeenUpdater
+from app.models.models import Device
+
+def test_touches_are_coalesced_into_one_update(db_session):
+    db_session.add_all([
+        Device(id="dev-ls-1", factory_id="fct-ls", status="active"),
+        Device(id="dev-ls-2", factory_id="fct-ls", status="active"),
+    ])
+    db_session.commit()
+
+    updater = LastSeenUpdater(flush_interval=60, session_factory=lambda: db_session)
+    base = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(10):
+        updater.touch("fct-ls", "dev-ls-1", base + datetime.timedelta(seconds=i))
+    updater.touch("fct-ls", "dev-ls-2", base)
+    # Out-of-order timestamps never move last_seen_at backwards
+    updater.touch("fct-ls", "dev-ls-1", base)
+
+    assert updater.flush() == 2
+    stats = updater.stats()
+    assert stats["rows_updated"] == 2
+    assert stats["coalesced"] == 10
+
+    db_session.expire_all()
+    assert db_session.get(Device, "dev-ls-1").last_seen_at == base + datetime.timedelta(seconds=9)
+    assert db_session.get(Device, "dev-ls-2").last_seen_at == base
+
+def test_other_factory_is_not_updated(db_session):
+    db_session.add(Device(id="dev-ls-3", factory_id="fct-real", status="active"))
+    db_session.commit()
+
+    updater = LastSeenUpdater(flush_interval=60, session_factory=lambda: db_session)
+    updater.touch("fct-spoofed", "dev-ls-3", datetime.datetime(2026, 1, 1))
+    updater.flush()
+
+    db_session.expire_all()
+    assert db_session.get(Device, "dev-ls-3").last_seen_at is None
@@ -0,0 +1,61 @@
+import datetime
+import json
+from app.services.latest_values import LatestValueStore
+
+def test_newest_values_are_written_in_one_pipeline(fake_redis):
+    client = fake_redis
+    store = LatestValueStore(lambda: client, flush_interval=60)
+    base = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(5):
+        store.update("fct-1", "dev-1", {"temp": 20 + i, "rpm": 1000}, base + datetime.timedelta(seconds=i))
+    # A late sample does not replace a newer pending value
+    store.update("fct-1", "dev-1", {"temp": 0}, base)
+    store.update("fct-2", "dev-9", {"temp": 50}, base)
+
+    assert store.flush() == 3
+    assert client.round_trips == 1
+    assert json.loads(client.hashes["telemetry:latest:fct-1"]["dev-1:temp"]) == [24, "2026-01-01T12:00:04"]
+    assert json.loads(client.hashes["telemetry:latest:fct-1"]["dev-1:rpm"]) == [1000, "2026-01-01T12:00:04"]
+    assert list(client.hashes["telemetry:latest:fct-2"]) == ["dev-9:temp"]
+    stats = store.stats()
+    assert stats["fields_written"] == 3
+    assert stats["coalesced"] == 9
+
+def test_values_are_kept_when_redis_is_down(fake_redis):
+    client = fake_redis
+    store = LatestValueStore(lambda: client, flush_interval=60)
+    base = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    store.update("fct-1", "dev-1", {"temp": 20}, base)
+
+    client.down = True
+    assert store.flush() == 0
+    assert store.stats()["errors"] == 1
+    # Newer values that arrive meanwhile win over the restored ones
+    store.update("fct-1", "dev-1", {"temp": 21}, base + datetime.timedelta(seconds=1))
+
+    client.down = False
+    assert store.flush() == 1
+    assert json.loads(client.hashes["telemetry:latest:fct-1"]["dev-1:temp"])[0] == 21
+    assert store.stats()["pending"] == 0
+
+def test_older_sample_does_not_replace_a_stored_value(fake_redis):
+    client = fake_redis
+    store = LatestValueStore(lambda: client, flush_interval=60)
+    base = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    store.update("fct-1", "dev-1", {"temp": 21, "rpm": 900}, base + datetime.timedelta(seconds=5))
+    store.flush()
+
+    # A batch with older samples, flushed after the newer value was stored
+    store.update("fct-1", "dev-1", {"temp": 20, "rpm": 800}, base)
+    store.update("fct-1", "dev-1", {"rpm": 1000}, base + datetime.timedelta(seconds=5, microseconds=1))
+    assert store.flush() == 2
+    stored = client.hashes["telemetry:latest:fct-1"]
+    assert json.loads(stored["dev-1:temp"]) == [21, "2026-01-01T12:00:05"]
+    assert json.loads(stored["dev-1:rpm"]) == [1000, "2026-01-01T12:00:05.000001"]
+    assert store.stats()["stale"] == 1
+
+def test_disabled_store_records_nothing(fake_redis):
+    store = LatestValueStore(lambda: fake_redis, flush_interval=60, enabled=False)
+    store.update("fct-1", "dev-1", {"temp": 20}, datetime.datetime(2026, 1, 1))
+    assert store.flush() == 0
+    assert store.stats()["updates"] == 0
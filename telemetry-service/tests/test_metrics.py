@@ -0,0 +1,106 @@
+import pytest
+from app.api import api
+from app.core.config import settings
+from app.core.metrics import Registry, STAGE_SECONDS, MESSAGES, OTHER_FACTORY, _Metric
+from app.services import processor
+from app.services.processor import process_message
+from app.services.property_registry import property_registry
+
+def test_histogram_and_counter_rendering():
+    registry = Registry()
+    latency = registry.histogram("stage_seconds", "Stage latency", ("stage",), buckets=(0.001, 0.01))
+    requests = registry.counter("requests_total", "Requests", ("factory_id",))
+    child = latency.labels("validate")
+    child.observe(0.0005)
+    child.observe(0.005)
+    child.observe(1.0)
+    requests.labels('fct"1').inc(3)
+
+    text = registry.render()
+    assert 'stage_seconds_bucket{stage="validate",le="0.001"} 1' in text
+    assert 'stage_seconds_bucket{stage="validate",le="0.01"} 2' in text
+    assert 'stage_seconds_bucket{stage="validate",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="validate"} 3' in text
+    assert 'requests_total{factory_id="fct\\"1"} 3' in text
+    assert "# TYPE stage_seconds histogram" in text
+
+def test_collectors_are_rendered():
+    registry = Registry()
+    registry.register_collector(lambda: [("queue_depth", "gauge", "Depth", [({"queue": "ingest"}, 7)])])
+    assert 'queue_depth{queue="ingest"} 7' in registry.render()
+
+def test_snapshots_of_other_processes_are_merged():
+    def make_registry():
+        registry = Registry()
+        return (registry, registry.histogram("stage_seconds", "Stage latency", ("stage",), buckets=(0.01,)),
+                registry.counter("requests_total", "Requests", ("factory_id",)))
+
+    main, latency, requests = make_registry()
+    shard, shard_latency, shard_requests = make_registry()
+    latency.labels("validate").observe(0.001)
+    shard_latency.labels("validate").observe(0.5)
+    shard_requests.labels("fct-1").inc(2)
+    main.register_source(lambda: [shard.snapshot(), shard.snapshot()])
+
+    text = main.render()
+    assert 'stage_seconds_bucket{stage="validate",le="0.01"} 1' in text
+    assert 'stage_seconds_count{stage="validate"} 3' in text
+    assert 'requests_total{factory_id="fct-1"} 4' in text
+    # The main process's own values are untouched
+    assert latency.labels("validate").counts == [1, 0]
+
+def test_sharded_stats_come_from_the_shards(monkeypatch):
+    shard = Registry()
+    shard.histogram("telemetry_stage_seconds", "", ("stage",)).labels("validate").observe(0.001)
+    report = {
+        "influx_writer": {**api.influx.influx_service.writer.stats(), "records_written": 5,
+                          "max_flush_latency_ms": 3.0},
+        "property_cache": {**api.property_registry.stats(), "hits": 4, "hit_ratio": 0.5},
+        "metrics": shard.snapshot(),
+    }
+    monkeypatch.setattr(settings, "INGEST_PROCESSES", 2)
+    monkeypatch.setattr(api.shard_supervisor, "_shard_stats", {0: report, 1: report})
+
+    health = api.health_check()
+    assert health["influx_writer"]["records_written"] == 10
+    assert health["influx_writer"]["max_flush_latency_ms"] == 3.0
+    assert health["property_cache"]["hit_ratio"] == 0.5
+    # Not reported yet: this process's own stats
+    assert health["deadband"] == api.deadband_filter.stats()
+
+    text = api.metrics()
+    assert 'telemetry_influx_records_total{outcome="written"} 10' in text
+    assert 'telemetry_property_cache_lookups_total{result="hit"} 8' in text
+    count = sum(STAGE_SECONDS.labels("validate").counts) + 2
+    assert f'telemetry_stage_seconds_count{{stage="validate"}} {count}' in text
+
+def test_process_message_records_stages(db_session, monkeypatch):
+    monkeypatch.setattr(processor.device_registry, "_devices", {"fct-m01": {"dev-m01": "active"}})
+    property_registry.invalidate("fct-m01", "dev-m01")
+    before = sum(STAGE_SECONDS.labels("publish").counts)
+    messages = MESSAGES.labels("fct-m01").value
+
+    process_message("fct-m01", "dev-m01", {"temperature": 20.5})
+
+    assert sum(STAGE_SECONDS.labels("publish").counts) == before + 1
+    assert MESSAGES.labels("fct-m01").value == messages + 1
+
+def test_unknown_factories_share_one_series(db_session, monkeypatch):
+    monkeypatch.setattr(processor.device_registry, "_devices", {"fct-m02": {"dev-m02": "active"}})
+    other = MESSAGES.labels(OTHER_FACTORY).value
+
+    for i in range(3):
+        process_message(f"fct-random-{i}", "dev-m02", {"temperature": 20.5})
+
+    assert MESSAGES.labels(OTHER_FACTORY).value == other + 3
+    assert not any(values[0].startswith("fct-random") for values in MESSAGES.snapshot())
+
+def test_metric_kinds_must_implement_children():
+    with pytest.raises(TypeError):
+        _Metric("incomplete", "No child type")
+
+def test_metrics_endpoint():
+    text = api.metrics()
+    assert "# TYPE telemetry_stage_seconds histogram" in text
+    assert 'telemetry_queue_depth{queue="ingest"}' in text
+    assert "telemetry_property_cache_hit_ratio" in text
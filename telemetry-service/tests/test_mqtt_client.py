@@ -0,0 +1,89 @@
+import pytest
+from app.services import mqtt_client
+from app.services.mqtt_client import MQTTClient, subscription_topics, payload_format
+from tests.local_broker import LocalBroker
+
+def make_replica(broker, monkeypatch, mode, **overrides):
+    monkeypatch.setattr(mqtt_client.settings, "MQTT_SUBSCRIPTION_MODE", mode)
+    for key, value in overrides.items():
+        monkeypatch.setattr(mqtt_client.settings, key, value)
+    replica = MQTTClient(client=broker.client())
+    received = []
+    replica.pipeline.submit = lambda f, d, p, fmt="json": received.append((f, d, p))
+    replica.client.connect()
+    return replica, received
+
+def test_subscription_topics():
+    assert subscription_topics("plain") == ["factories/+/devices/+/telemetry/#"]
+    assert subscription_topics("shared", "grp") == ["$share/grp/factories/+/devices/+/telemetry/#"]
+    assert subscription_topics("partitioned", "", ["f1", "f2"]) == [
+        "factories/f1/devices/+/telemetry/#",
+        "factories/f2/devices/+/telemetry/#",
+    ]
+    with pytest.raises(ValueError):
+        subscription_topics("partitioned", "grp", [])
+
+def test_plain_mode_duplicates_across_replicas(monkeypatch):
+    broker = LocalBroker()
+    _, a = make_replica(broker, monkeypatch, "plain")
+    _, b = make_replica(broker, monkeypatch, "plain")
+    broker.publish("factories/f1/devices/d1/telemetry", b"{}")
+    assert len(a) == len(b) == 1
+
+def test_shared_mode_delivers_each_message_once(monkeypatch):
+    broker = LocalBroker()
+    _, a = make_replica(broker, monkeypatch, "shared")
+    _, b = make_replica(broker, monkeypatch, "shared")
+    for i in range(10):
+        broker.publish(f"factories/f1/devices/d{i}/telemetry", b"{}")
+    assert len(a) + len(b) == 10
+    assert a and b
+
+def test_partitioned_mode_only_receives_own_factories(monkeypatch):
+    broker = LocalBroker()
+    _, a = make_replica(broker, monkeypatch, "partitioned", MQTT_FACTORY_PARTITIONS="f1", MQTT_SHARED_GROUP="")
+    _, b = make_replica(broker, monkeypatch, "partitioned", MQTT_FACTORY_PARTITIONS="f2,f3", MQTT_SHARED_GROUP="")
+    for factory_id in ("f1", "f2", "f3", "f4"):
+        broker.publish(f"factories/{factory_id}/devices/d1/telemetry", b"{}")
+    assert [f for f, _, _ in a] == ["f1"]
+    assert [f for f, _, _ in b] == ["f2", "f3"]
+
+def test_client_id_is_stable(monkeypatch):
+    monkeypatch.setattr(mqtt_client.settings, "MQTT_CLIENT_ID", "")
+    monkeypatch.setattr(mqtt_client.socket, "gethostname", lambda: "replica-7")
+    assert mqtt_client.default_client_id() == "telemetry-service-replica-7"
+
+class Properties:
+    def __init__(self, content_type):
+        self.ContentType = content_type
+
+def test_payload_format():
+    assert payload_format("") == "json"
+    assert payload_format("batch") == "json"
+    assert payload_format("msgpack") == "msgpack"
+    assert payload_format("", Properties("application/cbor")) == "cbor"
+    assert payload_format("json", Properties("application/msgpack; v=1")) == "msgpack"
+
+def test_format_sub_topics_are_routed(monkeypatch):
+    broker = LocalBroker()
+    replica = MQTTClient(client=broker.client())
+    received = []
+    replica.pipeline.submit = lambda f, d, p, fmt: received.append((d, fmt))
+    replica.client.connect()
+    broker.publish("factories/f1/devices/d1/telemetry", b"{}")
+    broker.publish("factories/f1/devices/d1/telemetry/msgpack", b"\x80")
+    broker.publish("factories/f1/devices/d1/telemetry/batch/extra", b"{}")
+    assert received == [("d1", "json"), ("d1", "msgpack")]
+
+def test_spill_files_are_opened_on_first_use(tmp_path, monkeypatch):
+    path = str(tmp_path / "ingest.spill")
+    with open(path, "wb"):
+        pass # Leftover of a previous run
+    monkeypatch.setattr(mqtt_client.settings, "INGEST_OVERFLOW_POLICY", "spill")
+    monkeypatch.setattr(mqtt_client.settings, "INGEST_SPILL_PATH", path)
+
+    # What a shard process does when it imports the module
+    replica = MQTTClient(client=LocalBroker().client())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ingest.spill"]
+    assert replica.pipeline.spills
+    assert "ingest.spill" not in [p.name for p in tmp_path.iterdir()]
@@ -1,5 +1,8 @@
+import datetime
 import pytest
-from app.services.processor import process_message, CACHE_PROPERTIES
+from app.services import processor
+from app.services.processor import process_message, process_batch
+from app.services.property_registry import property_registry
 from app.models.models import Device, DeviceProperty
 
 def test_auto_discovery(db_session, monkeypatch):
@@ -8,8 +11,7 @@ def test_auto_discovery(db_session, monkeypatch):
     payload = {"temperature": 25.5, "pressure": 10}
     
     # Ensure cache is clean for test
-    if device_id in CACHE_PROPERTIES:
-        del CACHE_PROPERTIES[device_id]
+    property_registry.invalidate(factory_id, device_id)
         
     # Process
     process_message(factory_id, device_id, payload)
@@ -31,11 +33,54 @@ def test_invalid_payload_handling(db_session):
     device_id = "dev-002"
     payload = {"valid": 100, "invalid": "text"}
     
-    if device_id in CACHE_PROPERTIES:
-        del CACHE_PROPERTIES[device_id]
+    property_registry.invalidate(factory_id, device_id)
         
     process_message(factory_id, device_id, payload)
     
     props = db_session.query(DeviceProperty).filter(DeviceProperty.device_id == device_id).all()
     assert len(props) == 1
     assert props[0].property_name == "valid"
+
+def test_cached_properties_skip_db_session(db_session, monkeypatch):
+    factory_id = "fct-003"
+    device_id = "dev-003"
+    property_registry.invalidate(factory_id, device_id)
+    process_message(factory_id, device_id, {"temperature": 20.0})
+
+    opened = []
+    def counting_session():
+        opened.append(1)
+        return db_session
+    monkeypatch.setattr("app.services.processor.SessionLocal", counting_session)
+
+    process_message(factory_id, device_id, {"temperature": 21.0})
+    assert opened == []
+
+    # A new property still goes to MySQL
+    process_message(factory_id, device_id, {"temperature": 22.0, "humidity": 40})
+    assert opened == [1]
+
+def test_process_batch_writes_and_publishes_once(db_session, monkeypatch):
+    factory_id = "fct-004"
+    device_id = "dev-004"
+    property_registry.invalidate(factory_id, device_id)
+
+    writes, published, touched = [], [], []
+    monkeypatch.setattr(processor.influx_service, "write_samples", lambda f, d, s: writes.append(s))
+    monkeypatch.setattr(processor.rule_engine_queue, "publish_many", published.append)
+    monkeypatch.setattr(processor.last_seen_updater, "touch", lambda f, d, ts: touched.append(ts))
+
+    t1 = datetime.datetime(2026, 2, 17, 14, 0, 0)
+    t2 = datetime.datetime(2026, 2, 17, 14, 0, 1)
+    process_batch(factory_id, device_id, [
+        (t1, {"temperature": 20.0, "mode": "auto"}),
+        (t2, {"temperature": 21.0, "pressure": 3}),
+        (t2, {"mode": "manual"}),
+    ])
+
+    assert len(writes) == 1 and len(writes[0]) == 2
+    assert len(published) == 1
+    assert [e["timestamp"] for e in published[0]] == [t1.isoformat(), t2.isoformat()]
+    assert touched == [t2]
+    props = db_session.query(DeviceProperty).filter(DeviceProperty.device_id == device_id).all()
+    assert {p.property_name for p in props} == {"temperature", "pressure"}
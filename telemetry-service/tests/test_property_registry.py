@@ -0,0 +1,33 @@
+import time
+from app.services.property_registry import PropertyRegistry
+from app.models.models import DeviceProperty
+
+def test_register_is_factory_scoped(db_session):
+    registry = PropertyRegistry(max_devices=10, ttl=60)
+    assert registry.register(db_session, "fct-a", "dev-shared", ["temp"]) == ["temp"]
+    assert registry.register(db_session, "fct-a", "dev-shared", ["temp"]) == []
+    # Same device id in another factory has its own entry
+    assert registry.register(db_session, "fct-b", "dev-shared", ["temp"]) == ["temp"]
+    assert registry.stats()["hits"] == 1
+
+def test_bulk_insert_ignores_existing_rows(db_session):
+    registry = PropertyRegistry(max_devices=10, ttl=60)
+    registry.register(db_session, "fct-c", "dev-c", ["rpm"])
+
+    # A second replica with a cold cache still only reports the truly new property
+    other = PropertyRegistry(max_devices=10, ttl=60)
+    assert other.register(db_session, "fct-c", "dev-c", ["rpm", "load"]) == ["load"]
+
+    names = {p.property_name for p in db_session.query(DeviceProperty).filter(DeviceProperty.device_id == "dev-c")}
+    assert names == {"rpm", "load"}
+
+def test_lru_and_ttl_eviction(db_session):
+    registry = PropertyRegistry(max_devices=2, ttl=0.05)
+    for device_id in ("dev-1", "dev-2", "dev-3"):
+        registry.register(db_session, "fct-d", device_id, ["v"])
+    assert registry.stats()["size"] == 2
+    assert registry.stats()["evictions"] == 1
+
+    time.sleep(0.1)
+    registry.register(db_session, "fct-d", "dev-3", ["v"])
+    assert registry.stats()["misses"] == 4 # expired entry reloaded from MySQL
@@ -0,0 +1,35 @@
+import json
+from app.services.redis_service import BatchPublisher
+
+def test_batch_is_one_round_trip_in_rpop_order(fake_redis):
+    client = fake_redis
+    publisher = BatchPublisher(lambda: client, "events_queue", batch_size=2, flush_interval=1, max_buffer=100)
+    for i in range(5):
+        publisher.publish({"seq": i})
+    assert publisher.flush()
+
+    assert client.round_trips == 1
+    # Consumers RPOP from the tail, so the tail must hold the oldest event
+    popped = [json.loads(v)["seq"] for v in reversed(client.lists["events_queue"])]
+    assert popped == [0, 1, 2, 3, 4]
+    assert publisher.stats()["avg_batch_size"] == 5
+
+def test_buffer_while_redis_down_is_bounded(fake_redis):
+    client = fake_redis
+    client.down = True
+    publisher = BatchPublisher(lambda: client, "events_queue", batch_size=10, flush_interval=1, max_buffer=3)
+    for i in range(2):
+        publisher.publish({"seq": i})
+    assert publisher.flush() is False
+    for i in range(2, 5):
+        publisher.publish({"seq": i})
+
+    stats = publisher.stats()
+    assert stats["buffer_depth"] == 3
+    assert stats["dropped"] == 2
+
+    client.down = False
+    assert publisher.flush()
+    popped = [json.loads(v)["seq"] for v in reversed(client.lists["events_queue"])]
+    assert popped == [2, 3, 4]
+    assert publisher.stats()["connects"] == 2
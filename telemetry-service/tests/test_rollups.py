@@ -0,0 +1,104 @@
+import datetime
+import pytest
+from app.core.line_protocol import LineProtocolEncoder
+from app.services.rollups import RollupAggregator
+
+BASE = datetime.datetime(2026, 1, 1, 12, 0, 0)
+BASE_S = int(BASE.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_aggregator(**overrides):
+    written = []
+    clock = Clock(BASE_S)
+    options = dict(grace_seconds=10, clock=clock)
+    options.update(overrides)
+    aggregator = RollupAggregator(lambda f, d, rows: written.extend((d, *row) for row in rows), **options)
+    return aggregator, clock, written
+
+def at(seconds):
+    return BASE + datetime.timedelta(seconds=seconds)
+
+def test_window_is_written_after_the_grace_period():
+    aggregator, clock, written = make_aggregator()
+    for i, temp in enumerate([20, 25, 15, 20]):
+        aggregator.add("fct-1", "dev-1", {"temp": temp, "running": True}, at(i * 10))
+    aggregator.add("fct-1", "dev-1", {"temp": 99}, at(61))
+
+    clock.now = BASE_S + 65
+    assert aggregator.flush() == 0
+    clock.now = BASE_S + 70
+    assert aggregator.flush() == 1
+    assert written == [("dev-1", BASE_S * 1_000_000_000, "temp",
+                        {"min": 15.0, "max": 25.0, "mean": 20.0, "sum": 80.0, "count": 4})]
+    # The next minute is still open
+    assert aggregator.stats()["open_windows"] == 1
+
+def test_late_samples_are_dropped_with_drop_policy():
+    aggregator, clock, written = make_aggregator(late_policy="drop")
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(0))
+    clock.now = BASE_S + 70
+    aggregator.flush()
+    aggregator.add("fct-1", "dev-1", {"temp": 30}, at(30))
+
+    assert aggregator.flush() == 0
+    assert aggregator.stats()["late_dropped"] == 1
+
+def test_late_samples_rewrite_the_window_with_update_policy():
+    aggregator, clock, written = make_aggregator(late_policy="update", late_retention_seconds=120)
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(0))
+    clock.now = BASE_S + 70
+    aggregator.flush()
+    aggregator.add("fct-1", "dev-1", {"temp": 30}, at(30))
+
+    assert aggregator.flush() == 1
+    assert written[-1][3] == {"min": 20.0, "max": 30.0, "mean": 25.0, "sum": 50.0, "count": 2}
+    assert aggregator.stats()["late_updates"] == 1
+
+    # Past the retention the window is gone
+    clock.now = BASE_S + 250
+    aggregator.flush()
+    aggregator.add("fct-1", "dev-1", {"temp": 40}, at(30))
+    assert aggregator.flush() == 0
+    assert aggregator.stats()["late_dropped"] == 1
+
+def test_late_samples_update_by_default():
+    aggregator, clock, written = make_aggregator()
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(0))
+    clock.now = BASE_S + 200
+    aggregator.flush()
+    # A gateway batch a few minutes late
+    aggregator.add("fct-1", "dev-1", {"temp": 40}, at(10))
+    assert aggregator.flush() == 1
+    assert written[-1][3]["count"] == 2
+
+def test_future_samples_are_dropped():
+    aggregator, clock, written = make_aggregator(max_future_seconds=300)
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(200))
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(3600))
+    stats = aggregator.stats()
+    assert stats["future_dropped"] == 1
+    assert stats["open_windows"] == 1
+
+def test_stop_writes_open_windows():
+    aggregator, clock, written = make_aggregator()
+    aggregator.add("fct-1", "dev-1", {"temp": 20}, at(0))
+    aggregator.stop()
+    assert len(written) == 1
+
+def test_unknown_late_policy_is_rejected():
+    with pytest.raises(ValueError):
+        make_aggregator(late_policy="merge")
+
+def test_rollup_rows_encode_to_line_protocol():
+    encoder = LineProtocolEncoder("device_metrics_1m")
+    chunk, count = encoder.encode_fields("fct-1", "dev 1", [
+        (1_000, "temp", {"min": 1.0, "mean": float("nan"), "count": 2}),
+    ])
+    assert count == 1
+    assert chunk == b"device_metrics_1m,device_id=dev\\ 1,factory_id=fct-1,property_name=temp min=1.0,count=2.0 1000"
@@ -0,0 +1,81 @@
+import functools
+import json
+import os
+import queue
+from app.services.ingest import shard_for
+from app.services.shards import ShardSupervisor
+
+def record_messages(directory: str, index: int):
+    """Shard initializer: log what the shard processes instead of storing it."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.core.database import Base
+    from app.services import mqtt_client
+    from app.services.device_registry import device_registry
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    device_registry._session_factory = sessionmaker(bind=engine)
+    device_registry._redis_client_factory = None
+
+    path = os.path.join(directory, f"shard-{index}.log")
+
+    def process_message(factory_id, device_id, payload, timestamp=None):
+        with open(path, "a") as fh:
+            fh.write(f"{factory_id} {device_id} {payload['seq']}\n")
+
+    mqtt_client.process_message = process_message
+
+def test_devices_stay_on_their_shard_in_order(tmp_path):
+    supervisor = ShardSupervisor(processes=2, batch_size=5, flush_interval=0.01, queue_size=1000,
+                                 block_timeout=5, stats_interval=0.1,
+                                 initializer=functools.partial(record_messages, str(tmp_path)))
+    devices = [("fct-001", f"dev-{i}") for i in range(6)]
+    supervisor.start()
+    try:
+        assert supervisor.wait_ready(60)
+        for seq in range(20):
+            for factory_id, device_id in devices:
+                supervisor.submit(factory_id, device_id, json.dumps({"seq": seq}).encode())
+    finally:
+        supervisor.stop()
+
+    seen = {}
+    for index in range(2):
+        with open(tmp_path / f"shard-{index}.log") as fh:
+            for line in fh:
+                factory_id, device_id, seq = line.split()
+                assert shard_for(factory_id, device_id, 2) == index
+                seen.setdefault(device_id, []).append(int(seq))
+    assert seen == {device_id: list(range(20)) for _, device_id in devices}
+
+    stats = supervisor.stats()
+    assert stats["enqueued"] == stats["processed"] == 120
+    assert stats["dropped"] == stats["errors"] == 0
+    assert all(s["processed"] > 0 for s in stats["shards"])
+
+class DeadProcess:
+    name = "ingest-shard-0"
+
+    def __init__(self):
+        self.terminated = False
+
+    def is_alive(self):
+        return False
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self):
+        pass
+
+def test_stop_does_not_hang_on_a_dead_shard():
+    supervisor = ShardSupervisor(processes=1, batch_size=5, flush_interval=0.01, queue_size=5, block_timeout=0.01)
+    inbox = queue.Queue(1)
+    inbox.put([("fct-001", "dev-1", b"{}", "json")]) # Never read again
+    process = DeadProcess()
+    supervisor._inboxes, supervisor._procs = [inbox], [process]
+
+    supervisor.stop(timeout=1.0)
+    assert process.terminated
@@ -0,0 +1,125 @@
+import os
+import time
+from influxdb_client.rest import ApiException
+from app.core.influx import BatchWriter, is_permanent
+from app.core.spool import SegmentSpool, SpoolDrainer
+
+def drain_all(spool, max_records=100):
+    out = []
+    while True:
+        chunks, records, position = spool.read(max_records)
+        if position is None:
+            return out
+        out.extend(chunk for chunk, _ in chunks)
+        spool.commit(position, records)
+
+def test_segments_rotate_and_replay_in_order(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=64, max_bytes=10000)
+    chunks = [f"m v={i}".encode() * 4 for i in range(10)]
+    for chunk in chunks:
+        assert spool.append(chunk, 4)
+    assert len(spool) == 40
+    assert spool.stats()["segments"] > 1
+
+    assert drain_all(spool, max_records=8) == chunks
+    assert len(spool) == 0 and spool.size_bytes() == 0
+    assert os.listdir(tmp_path) == []
+
+def test_size_cap_rejects_appends(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=40)
+    assert spool.append(b"x" * 20, 1)
+    assert not spool.append(b"y" * 20, 1)
+    assert spool.stats()["rejected_records"] == 1
+
+def test_segments_survive_restart(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    spool.append(b"a", 1)
+    spool.append(b"b", 1)
+    spool.close()
+    # Torn frame from a crash mid-append
+    with open(os.path.join(tmp_path, os.listdir(tmp_path)[0]), "ab") as fh:
+        fh.write(SegmentSpool.FRAME.pack(100, 1) + b"partial")
+
+    reopened = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    assert len(reopened) == 2
+    reopened.append(b"c", 1)
+    assert drain_all(reopened) == [b"a", b"b", b"c"]
+    assert len(reopened) == 0
+
+def test_drainer_replays_and_retries(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    for i in range(3):
+        spool.append(f"m v={i}".encode(), 1)
+
+    bodies, fail = [], [True]
+    def write(body):
+        if fail[0]:
+            raise ConnectionError("influx down")
+        bodies.append(body)
+
+    drainer = SpoolDrainer(spool, write, rate=0, batch_records=2)
+    assert drainer.drain_once() == -1
+    assert len(spool) == 3
+    fail[0] = False
+    assert drainer.drain_once() == 2
+    assert drainer.drain_once() == 1
+    assert bodies == [b"m v=0\nm v=1", b"m v=2"]
+    stats = drainer.stats()
+    assert stats["replayed_records"] == 3 and stats["replay_errors"] == 1
+    assert stats["replay_rate"] > 0
+
+def test_drainer_skips_rejected_batches(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    spool.append(b"bad", 1)
+    spool.append(b"m v=1", 1)
+    spool.append(b"m v=2", 1)
+
+    bodies = []
+    def write(body):
+        if b"bad" in body:
+            raise ApiException(status=400, reason="unable to parse")
+        bodies.append(body)
+
+    drainer = SpoolDrainer(spool, write, rate=0, batch_records=1, is_permanent=is_permanent)
+    assert drainer.drain_once() == 1
+    assert len(spool) == 2
+    assert drainer.drain_once() == 1
+    assert drainer.drain_once() == 1
+    assert bodies == [b"m v=1", b"m v=2"]
+    stats = drainer.stats()
+    assert stats["replay_rejected"] == 1 and stats["replay_errors"] == 0
+    assert len(spool) == 0
+
+def test_drainer_does_not_idle_after_a_rejected_batch(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    spool.append(b"bad", 1)
+    spool.append(b"m v=1", 1)
+
+    bodies = []
+    def write(body):
+        if b"bad" in body:
+            raise ApiException(status=400, reason="unable to parse")
+        bodies.append(body)
+
+    drainer = SpoolDrainer(spool, write, rate=0, batch_records=1, idle_interval=60, is_permanent=is_permanent)
+    drainer.start()
+    deadline = time.monotonic() + 2.0
+    while not bodies and time.monotonic() < deadline:
+        time.sleep(0.01)
+    drainer.stop()
+    assert bodies == [b"m v=1"]
+
+def test_writer_spools_failed_batches_and_overflow(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_bytes=1024, max_bytes=10000)
+    def failing(body):
+        raise ConnectionError("influx down")
+    writer = BatchWriter(failing, batch_size=100, flush_interval=10.0, max_buffer=2,
+                         backpressure_timeout=5.0, spool=spool)
+    assert writer.write(b"a\nb", 2)
+    assert writer.write(b"c", 1) # Buffer full: straight to the spool, no blocking
+    assert writer.flush() is False # Failed batch is spooled too
+    stats = writer.stats()
+    assert stats["records_spooled"] == 3
+    assert stats["records_dropped"] == 0
+    assert stats["buffer_depth"] == 0
+    assert sorted(drain_all(spool)) == [b"a\nb", b"c"]